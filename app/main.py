@@ -1,20 +1,30 @@
 # --- Importações ---
-from fastapi import FastAPI, Request, Body
+from fastapi import FastAPI, Request, Response, Body
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse, FileResponse, RedirectResponse
 from app.routes import query, importar, consulta, multi_sources, coema, auth, documents
 from app.services.document_chat_service import DocumentChatService
+from app.services.conversation_context import ConversationContextManager
+from app.services.message_queue import MessagePersistenceQueue, novo_conversation_id, agora
+from app.services.chat_cache import chat_cache, paginar_conversas, paginar_mensagens
+from app.services.conversation_admin import ConversationAdmin, ArquivamentoIndisponivel
+from app.services import openai_clients
+from app.services.openai_clients import chat_completion
+from app.services.container import services
+from app.services.warmup import warmup
+from app.services.corpus_snapshot import coluna
+from app.services.pdf_service import LimiteDeUpload
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from pathlib import Path
+from contextlib import asynccontextmanager
 import os
 import sys
 from dotenv import load_dotenv
 from supabase import create_client, Client
-import openai
-import pandas as pd
 import json
 from io import BytesIO
 
@@ -23,7 +33,6 @@ from uuid import UUID
 
 # Adicionar o diretório tabela_generator ao path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'tabela_generator'))
-from ia_tabela_service import IATabela
 
 load_dotenv()
 
@@ -41,6 +50,11 @@ class ChatRequest(BaseModel):
     history: List[Message]
     conversation_id: Optional[UUID] = None # O ID é opcional
 
+class BulkChatRequest(BaseModel):
+    action: str  # "delete", "rename", "archive" ou "unarchive"
+    conversation_ids: List[UUID] = []
+    titles: Dict[UUID, str] = {}  # rename: id da conversa -> novo título
+
 class TabelaRequest(BaseModel):
     descricao: str
     municipio: Optional[str] = None
@@ -56,9 +70,21 @@ class QuadroResumoRequest(BaseModel):
     esferas: List[str] = ["federal", "estadual", "municipal"]
     max_documentos: int = 20
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Gravação diferida das mensagens: recupera o journal e inicia os envios em lote
+    await message_queue.start()
+    # Aquecimento em segundo plano: /ready responde 200 quando terminar
+    warmup.start()
+    yield
+    await warmup.stop()
+    # Ao encerrar, grava o que restou na fila (o que falhar continua no journal)
+    await message_queue.stop()
+
 app = FastAPI(
     title="API Leis Ambientais",
-    description="Sistema de consulta a leis ambientais com múltiplas fontes de dados"
+    description="Sistema de consulta a leis ambientais com múltiplas fontes de dados",
+    lifespan=lifespan
 )
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -66,9 +92,28 @@ templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
 supabase_url: str = os.environ.get("SUPABASE_URL")
 supabase_key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+supabase: Client = services.register("supabase", lambda: create_client(supabase_url, supabase_key))
+
+def _criar_ia_tabela():
+    # pandas e os dados do Pinecone só são carregados no primeiro uso do gerador de tabelas
+    from ia_tabela_service import IATabela
+    return IATabela()
+
+# Instância compartilhada pelos endpoints /api do gerador de tabelas
+ia_tabela = services.register("ia_tabela", _criar_ia_tabela)
+
+# Conversas e mensagens são gravadas em lote, fora do caminho da resposta
+message_queue = MessagePersistenceQueue(supabase)
 
-openai.api_key = os.environ.get("OPENAI_API_KEY")
+# Janela de histórico + resumo das mensagens antigas para /ask-ia e /ask-ia-o3
+conversation_context = ConversationContextManager(supabase, pending_messages=message_queue.pending_messages)
+
+# Exclusão, renomeação e arquivamento de conversas (uma ou várias por requisição)
+conversation_admin = ConversationAdmin(supabase, message_queue, chat_cache, conversation_context)
+
+# Uploads acima de UPLOAD_MAX_BYTES recusados antes de o multipart ser lido
+# (registrado antes do CORS para que a resposta 413 também receba os cabeçalhos)
+app.add_middleware(LimiteDeUpload, prefixo="/documents/upload")
 
 app.add_middleware(
     CORSMiddleware,
@@ -89,39 +134,87 @@ async def serve_dashboard(request: Request):
     return templates.TemplateResponse("dashboard.html", {"request": request})
 
 @app.get("/user-chats")
-async def get_user_chats():
+async def get_user_chats(response: Response, limit: Optional[int] = None, before: Optional[str] = None,
+                         include_archived: bool = False):
     test_user_id = "ca9520b0-2cd7-4e6f-b8d2-8b6e805188b7"  # Simulado para dev/teste
 
-    try:
-        response = supabase \
+    def carregar() -> List[Dict[str, Any]]:
+        # Lê a fila antes do banco: uma conversa gravada no meio aparece nos dois e é deduplicada
+        pendentes = message_queue.pending_conversations(test_user_id)
+        resultado = supabase \
             .table("conversations") \
             .select("*") \
             .eq("user_id", test_user_id) \
             .order("created_at", desc=True) \
             .execute()
 
-        return JSONResponse(content=response.data)
+        # Conversas recém-criadas que ainda estão na fila de gravação aparecem primeiro
+        gravadas = {conversa["id"] for conversa in resultado.data}
+        pendentes = [c for c in pendentes if c["id"] not in gravadas]
+        pendentes.sort(key=lambda c: c["created_at"], reverse=True)
+        return pendentes + resultado.data
+
+    try:
+        conversas = await run_in_threadpool(chat_cache.conversations, test_user_id, carregar)
+        if not include_archived:
+            conversas = [conversa for conversa in conversas if not conversa.get("archived")]
+        pagina, proximo = paginar_conversas(conversas, limit, before)
+
+        # Próxima página: GET /user-chats?before=<X-Next-Cursor>
+        if proximo:
+            response.headers["X-Next-Cursor"] = proximo
+        return pagina
 
     except Exception as e:
         print(f"Erro ao buscar chats: {e}")
         return JSONResponse(status_code=500, content={"message": "Erro ao buscar conversas."})
 
 @app.get("/chat/{conversation_id}/messages")
-async def get_chat_messages(conversation_id: str):
-    try:
-        response = supabase \
+async def get_chat_messages(conversation_id: str, response: Response,
+                            limit: Optional[int] = None, before: Optional[str] = None):
+    def carregar() -> List[Dict[str, Any]]:
+        pendentes = message_queue.pending_messages(conversation_id)
+        resultado = supabase \
             .table("messages") \
-            .select("role, content") \
+            .select("role, content, created_at") \
             .eq("conversation_id", conversation_id) \
             .order("created_at", desc=False) \
             .execute()
 
-        return JSONResponse(content=response.data)
+        # Mensagens ainda na fila de gravação entram no fim
+        vistas = {(m["created_at"], m["role"], m["content"]) for m in resultado.data}
+        mensagens = resultado.data + [m for m in pendentes
+                                      if (m["created_at"], m["role"], m["content"]) not in vistas]
+        return [{"role": m["role"], "content": m["content"]} for m in mensagens]
+
+    try:
+        mensagens = await run_in_threadpool(chat_cache.messages, conversation_id, carregar)
+        pagina, anterior = paginar_mensagens(mensagens, limit, before)
+
+        # Mensagens mais antigas: GET /chat/{id}/messages?before=<X-Next-Cursor>
+        if anterior:
+            response.headers["X-Next-Cursor"] = anterior
+        return pagina
 
     except Exception as e:
         print(f"Erro ao buscar mensagens: {e}")
         return JSONResponse(status_code=500, content={"message": "Erro ao buscar mensagens."})
 
+@app.get("/metrics/openai")
+async def get_openai_metrics():
+    """Filas por modelo: chamadas em andamento, em espera, tempo de espera e tokens usados"""
+    return openai_clients.stats()
+
+@app.get("/ready")
+async def readiness():
+    """Prontidão do worker: 503 até o aquecimento terminar, depois 200 (estado de cada etapa no corpo)"""
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.status())
+
+@app.get("/metrics/services")
+async def get_services_metrics():
+    """Serviços pesados já inicializados e o tempo que cada um levou"""
+    return services.stats()
+
 @app.get("/")
 async def serve_login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
@@ -147,14 +240,12 @@ async def serve_gerador_tabelas(request: Request):
 async def get_fontes_dados():
     """Retorna contadores das fontes de dados disponíveis"""
     try:
-        ia_tabela = IATabela()
-        dados = ia_tabela.todas_fontes_data
-
-        # Contar por jurisdição
-        federais = len([d for d in dados if d.get('jurisdicao', '').startswith('Federal')])
-        estaduais = len([d for d in dados if d.get('jurisdicao', '').startswith('Estadual')])
-        municipais = len([d for d in dados if d.get('jurisdicao', '').startswith('Municipal')])
-        total = len(dados)
+        # Contar por jurisdição (só a coluna é lida do snapshot, sem montar os documentos)
+        jurisdicoes = coluna(ia_tabela.todas_fontes_data, 'jurisdicao', '')
+        federais = len([j for j in jurisdicoes if j.startswith('Federal')])
+        estaduais = len([j for j in jurisdicoes if j.startswith('Estadual')])
+        municipais = len([j for j in jurisdicoes if j.startswith('Municipal')])
+        total = len(jurisdicoes)
         
         return JSONResponse(content={
             "federais": federais,
@@ -170,8 +261,6 @@ async def get_fontes_dados():
 async def gerar_estrutura_tabela(request: TabelaRequest):
     """Gera estrutura de tabela baseada na descrição do usuário"""
     try:
-        ia_tabela = IATabela()
-        
         # Gerar estrutura usando IA
         estrutura = ia_tabela.gerar_estrutura_tabela(request.descricao)
         
@@ -203,8 +292,6 @@ async def gerar_estrutura_tabela(request: TabelaRequest):
 async def gerar_quadro_resumo(request: QuadroResumoRequest):
     """Gera quadro-resumo simplificado das legislações"""
     try:
-        ia_tabela = IATabela()
-        
         # Estrutura simplificada para quadro-resumo
         estrutura_resumo = {
             "titulo_tabela": "Quadro-Resumo de Legislação Ambiental",
@@ -249,6 +336,7 @@ async def download_tabela(request: dict = Body(...)):
     try:
         from fastapi.responses import StreamingResponse
         import tempfile
+        import pandas as pd
         
         dados = request.get('dados', [])
         formato = request.get('formato', 'excel')
@@ -299,16 +387,13 @@ async def handle_login(user_login: UserLogin):
 
 @app.patch("/chat/{conversation_id}")
 async def update_chat_title(conversation_id: str, data: dict = Body(...)):
+    test_user_id = "ca9520b0-2cd7-4e6f-b8d2-8b6e805188b7"
     new_title = data.get("title")
     if not new_title:
         return JSONResponse(status_code=400, content={"message": "Título não fornecido"})
 
     try:
-        supabase \
-            .table("conversations") \
-            .update({"title": new_title}) \
-            .eq("id", conversation_id) \
-            .execute()
+        await conversation_admin.rename(test_user_id, {conversation_id: new_title})
         
         return JSONResponse(status_code=200, content={"message": "Título atualizado com sucesso"})
     
@@ -318,12 +403,10 @@ async def update_chat_title(conversation_id: str, data: dict = Body(...)):
 
 @app.delete("/chat/{conversation_id}")
 async def delete_chat(conversation_id: str):
+    test_user_id = "ca9520b0-2cd7-4e6f-b8d2-8b6e805188b7"
     try:
-        # Primeiro exclui todas as mensagens da conversa
-        supabase.table("messages").delete().eq("conversation_id", conversation_id).execute()
-        
-        # Depois exclui a conversa
-        supabase.table("conversations").delete().eq("id", conversation_id).execute()
+        # Exclui mensagens e conversa e limpa fila, cache, resumo e vínculo com documento
+        await conversation_admin.delete(test_user_id, [conversation_id])
         
         return JSONResponse(
             status_code=200,
@@ -336,11 +419,39 @@ async def delete_chat(conversation_id: str):
             content={"message": "Erro ao excluir chat"}
         )
 
+@app.post("/chats/bulk")
+async def bulk_chats(bulk_request: BulkChatRequest):
+    """Exclui, renomeia, arquiva ou desarquiva várias conversas em uma requisição"""
+    test_user_id = "ca9520b0-2cd7-4e6f-b8d2-8b6e805188b7"
+    action = bulk_request.action.lower()
+
+    try:
+        if action == "delete":
+            afetadas = await conversation_admin.delete(test_user_id, bulk_request.conversation_ids)
+        elif action == "rename":
+            if not bulk_request.titles or not all(t.strip() for t in bulk_request.titles.values()):
+                return JSONResponse(status_code=400, content={"message": "Títulos não fornecidos"})
+            afetadas = await conversation_admin.rename(test_user_id, bulk_request.titles)
+        elif action in ("archive", "unarchive"):
+            afetadas = await conversation_admin.archive(
+                test_user_id, bulk_request.conversation_ids, archived=action == "archive"
+            )
+        else:
+            return JSONResponse(status_code=400, content={"message": f"Ação inválida: {bulk_request.action}"})
+
+        return JSONResponse(status_code=200, content={"message": "Operação concluída", "affected": afetadas})
+
+    except ArquivamentoIndisponivel:
+        return JSONResponse(status_code=501, content={"message": "Arquivamento indisponível: coluna 'archived' ausente em conversations"})
+    except Exception as e:
+        print(f"Erro na operação em lote ({action}): {e}")
+        return JSONResponse(status_code=500, content={"message": "Erro na operação em lote"})
+
 @app.post("/ask-ia")
 async def ask_ia(chat_request: ChatRequest):
-    # 1) Converte o histórico em dicts simples
-    conversation_history = [message.dict() for message in chat_request.history]
-    user_message = conversation_history[-1]['content']
+    # 1) Do payload só interessa a mensagem nova; o histórico vem do banco
+    user_message = chat_request.history[-1].content
+    recebida_em = agora()
 
     # 2) Converte conversation_id vindo do request para string (se existir)
     conversation_id = None
@@ -351,37 +462,40 @@ async def ask_ia(chat_request: ChatRequest):
     test_user_id = "ca9520b0-2cd7-4e6f-b8d2-8b6e805188b7"
 
     try:
-        # 3) Se não veio id, cria a conversa e já padroniza para string
-        if conversation_id is None:
-            new_conv = supabase.table("conversations").insert({
-                "user_id": test_user_id,
-                "title": user_message[:50]
-            }).execute()
-            conv_id = new_conv.data[0]["id"]
-            conversation_id = str(conv_id)  # <- padroniza AQUI
-
-        # 4) Verificar se há documento associado a esta conversa e incluir contexto
-        enhanced_messages = conversation_history.copy()
-        
-        # Buscar contexto do documento associado a esta conversa específica
-        document_context = DocumentChatService.get_latest_document_context(conversation_id, user_message)
+        # 3) Se não veio id, gera o ID aqui; a conversa é gravada junto com as mensagens
+        nova_conversa = conversation_id is None
+        if nova_conversa:
+            conversation_id = novo_conversation_id()
+            conversa = message_queue.add_conversation(conversation_id, test_user_id, user_message[:50])
+            chat_cache.add_conversation(test_user_id, conversa)
+
+        # 4) Buscar contexto do documento associado a esta conversa específica (embedding da pergunta em thread)
+        document_context = await run_in_threadpool(
+            DocumentChatService.get_latest_document_context, conversation_id, user_message
+        )
         
-        if document_context:
-            # Modificar a última mensagem do usuário para incluir contexto
-            enhanced_messages[-1]['content'] = user_message + document_context
+        # Histórico gravado (janela recente + resumo), sem alterar a mensagem do usuário
+        contexto = await conversation_context.build_messages(
+            None if nova_conversa else conversation_id, user_message, document_context, model="gpt-4o-mini"
+        )
 
         # 5) Chama a OpenAI com mensagens aprimoradas
-        completion = openai.chat.completions.create(
+        completion = await run_in_threadpool(
+            chat_completion,
             model="gpt-4o-mini",
-            messages=enhanced_messages
+            messages=contexto["messages"]
         )
         ai_response = completion.choices[0].message.content
 
-        # 5) Ao salvar mensagens no Supabase, use SEMPRE string no conversation_id
-        supabase.table("messages").insert([
-            {"conversation_id": conversation_id, "role": "user", "content": user_message},
-            {"conversation_id": conversation_id, "role": "assistant", "content": ai_response}
-        ]).execute()
+        # 5) Enfileira as mensagens (gravadas em lote, sem atrasar a resposta)
+        message_queue.add_messages(conversation_id, [
+            {"role": "user", "content": user_message, "created_at": recebida_em},
+            {"role": "assistant", "content": ai_response, "created_at": agora()}
+        ])
+        chat_cache.append_messages(conversation_id, [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": ai_response}
+        ])
 
         return JSONResponse(
             status_code=200,
@@ -399,9 +513,9 @@ async def ask_ia(chat_request: ChatRequest):
 @app.post("/ask-ia-o3")
 async def ask_ia_o3(chat_request: ChatRequest):
     """Endpoint para testar modelo o3 com persistência completa"""
-    # 1) Converte o histórico em dicts simples
-    conversation_history = [message.dict() for message in chat_request.history]
-    user_message = conversation_history[-1]['content']
+    # 1) Do payload só interessa a mensagem nova; o histórico vem do banco
+    user_message = chat_request.history[-1].content
+    recebida_em = agora()
 
     # 2) Converte conversation_id vindo do request para string (se existir)
     conversation_id = None
@@ -412,37 +526,40 @@ async def ask_ia_o3(chat_request: ChatRequest):
     test_user_id = "ca9520b0-2cd7-4e6f-b8d2-8b6e805188b7"
 
     try:
-        # 3) Se não veio id, cria a conversa e já padroniza para string
-        if conversation_id is None:
-            new_conv = supabase.table("conversations").insert({
-                "user_id": test_user_id,
-                "title": user_message[:50]
-            }).execute()
-            conv_id = new_conv.data[0]["id"]
-            conversation_id = str(conv_id)  # <- padroniza AQUI
-
-        # 4) Verificar se há documento associado a esta conversa e incluir contexto
-        enhanced_messages = conversation_history.copy()
-        
-        # Buscar contexto do documento associado a esta conversa específica
-        document_context = DocumentChatService.get_latest_document_context(conversation_id, user_message)
+        # 3) Se não veio id, gera o ID aqui; a conversa é gravada junto com as mensagens
+        nova_conversa = conversation_id is None
+        if nova_conversa:
+            conversation_id = novo_conversation_id()
+            conversa = message_queue.add_conversation(conversation_id, test_user_id, user_message[:50])
+            chat_cache.add_conversation(test_user_id, conversa)
+
+        # 4) Buscar contexto do documento associado a esta conversa específica (embedding da pergunta em thread)
+        document_context = await run_in_threadpool(
+            DocumentChatService.get_latest_document_context, conversation_id, user_message
+        )
         
-        if document_context:
-            # Modificar a última mensagem do usuário para incluir contexto
-            enhanced_messages[-1]['content'] = user_message + document_context
+        # Histórico gravado (janela recente + resumo), sem alterar a mensagem do usuário
+        contexto = await conversation_context.build_messages(
+            None if nova_conversa else conversation_id, user_message, document_context, model="o3"
+        )
 
         # 5) Chama a OpenAI com modelo o3
-        completion = openai.chat.completions.create(
+        completion = await run_in_threadpool(
+            chat_completion,
             model="o3",
-            messages=enhanced_messages
+            messages=contexto["messages"]
         )
         ai_response = completion.choices[0].message.content
 
-        # 6) Ao salvar mensagens no Supabase, use SEMPRE string no conversation_id
-        supabase.table("messages").insert([
-            {"conversation_id": conversation_id, "role": "user", "content": user_message},
-            {"conversation_id": conversation_id, "role": "assistant", "content": ai_response}
-        ]).execute()
+        # 6) Enfileira as mensagens (gravadas em lote, sem atrasar a resposta)
+        message_queue.add_messages(conversation_id, [
+            {"role": "user", "content": user_message, "created_at": recebida_em},
+            {"role": "assistant", "content": ai_response, "created_at": agora()}
+        ])
+        chat_cache.append_messages(conversation_id, [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": ai_response}
+        ])
 
         return JSONResponse(
             status_code=200,
@@ -3,13 +3,17 @@ Rotas para o COEMA (Conselho Estadual de Meio Ambiente)
 """
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from app.services.coema_service import COEMAService
+from app.services.coema_catalog import COEMACatalog, paginacao
 from app.models.models import QueryRequest
 
 router = APIRouter()
 coema_service = COEMAService()
 
+# Listagem e detalhe servidos da memória (o arquivo só é relido quando muda)
+coema_catalog = COEMACatalog(coema_service)
+
 @router.post("/coema/index")
 async def index_coema_documents(background_tasks: BackgroundTasks) -> Dict[str, Any]:
     """
@@ -114,6 +118,7 @@ async def get_coema_stats() -> Dict[str, Any]:
         return {
             "message": "Estatísticas do COEMA obtidas com sucesso",
             "stats": stats,
+            "catalog": coema_catalog.stats(),
             "source": "COEMA"
         }
         
@@ -145,30 +150,21 @@ async def delete_coema_index() -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail=f"Erro ao remover índice do COEMA: {str(e)}")
 
 @router.get("/coema/documents")
-async def list_coema_documents() -> Dict[str, Any]:
+async def list_coema_documents(offset: int = 0, limit: Optional[int] = None, type: Optional[str] = None,
+                               year: Optional[str] = None, law_number: Optional[str] = None) -> Dict[str, Any]:
     """
-    Lista documentos do COEMA disponíveis
+    Lista documentos do COEMA disponíveis (paginado, com filtros por tipo, ano e número de lei)
     """
     try:
-        documents = coema_service.load_coema_documents()
-        
-        # Cria resumo dos documentos
-        document_summary = []
-        for i, doc in enumerate(documents):
-            summary = {
-                "index": i,
-                "title": doc.get('title', 'Sem título')[:100],
-                "type": doc.get('type', 'documento'),
-                "year": doc.get('year', ''),
-                "content_length": len(doc.get('content', '')),
-                "url": doc.get('url', ''),
-                "extracted_at": doc.get('extracted_at', '')
-            }
-            document_summary.append(summary)
+        total, document_summary = coema_catalog.list(offset, limit, type, year, law_number)
+        offset, limite = paginacao(offset, limit)
         
         return {
-            "message": f"Encontrados {len(documents)} documentos do COEMA",
-            "total_documents": len(documents),
+            "message": f"Encontrados {total} documentos do COEMA",
+            "total_documents": len(coema_catalog),
+            "total_matches": total,
+            "offset": offset,
+            "limit": limite,
             "documents": document_summary,
             "source": "COEMA"
         }
@@ -182,13 +178,11 @@ async def get_coema_document(doc_index: int) -> Dict[str, Any]:
     Obtém um documento específico do COEMA pelo índice
     """
     try:
-        documents = coema_service.load_coema_documents()
+        document = coema_catalog.get(doc_index)
         
-        if doc_index < 0 or doc_index >= len(documents):
+        if document is None:
             raise HTTPException(status_code=404, detail="Documento não encontrado")
         
-        document = documents[doc_index]
-        
         return {
             "message": "Documento do COEMA encontrado",
             "document": document,
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from app.services.pdf_service import PDFService
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.services.pdf_service import PDFService, UploadMuitoGrande, UploadTemporario, salvar_upload
 from app.services.document_chat_service import DocumentChatService
+from app.services.upload_cache import upload_cache
 import uuid
+import json
+import asyncio
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional
 
 router = APIRouter()
 
@@ -11,6 +16,56 @@ class ChatRequest(BaseModel):
     document_id: str
     message: str
 
+async def processar_upload(upload: UploadTemporario,
+                           on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """Texto, chunks e embeddings do PDF: do cache se o mesmo arquivo já foi processado"""
+    processado = await run_in_threadpool(upload_cache.get, upload.sha256)
+    if processado:
+        print(f"♻️ Upload já processado ({upload.sha256[:12]}), reutilizando chunks e embeddings")
+        return {**processado, "cached": True}
+    
+    # Extração em paralelo no pool de processos (a partir do arquivo) e chunking em thread
+    text = await PDFService.extract_text_parallel(upload.path, on_progress)
+    chunks = await run_in_threadpool(PDFService.chunk_text, text)
+    return {"text": text, "chunks": chunks, "embeddings": None, "cached": False}
+
+async def armazenar_documento(filename: str, processado: Dict[str, Any], sha256: str,
+                              conversation_id: Optional[str]) -> Dict[str, Any]:
+    """Gera embeddings (se ainda não houver), armazena o documento e o associa à conversa"""
+    chunks = processado["chunks"]
+    embeddings = processado["embeddings"]
+    
+    if embeddings is None:
+        # Gera os embeddings dos chunks uma única vez (fora do event loop)
+        embeddings = await run_in_threadpool(DocumentChatService.embed_chunks, chunks)
+        
+        # Guarda o resultado para reenvios do mesmo arquivo
+        try:
+            await run_in_threadpool(upload_cache.put, sha256, processado["text"], chunks, embeddings)
+        except OSError as e:
+            print(f"⚠️ Não foi possível gravar o upload no cache: {e}")
+    
+    # Gerar ID único para o documento
+    document_id = DocumentChatService.generate_document_id()
+    
+    # Armazenar documento no serviço (SQLite/Redis: fora do event loop)
+    await run_in_threadpool(DocumentChatService.store_document, document_id, filename, chunks, embeddings)
+    
+    # Se conversation_id foi fornecido, associar documento à conversa
+    if conversation_id:
+        await run_in_threadpool(DocumentChatService.associate_document_to_conversation, document_id, conversation_id)
+    
+    return {
+        "document_id": document_id,
+        "conversation_id": conversation_id,
+        "filename": filename,
+        "sha256": sha256,
+        "cached": processado["cached"],
+        "chunks_count": len(chunks),
+        "embeddings": embeddings is not None,
+        "preview": chunks[0][:200] + "..." if chunks[0] else "Sem conteúdo"
+    }
+
 @router.post("/upload")
 async def upload_pdf(file: UploadFile = File(...), conversation_id: Optional[str] = Form(None)):
     """
@@ -21,38 +76,85 @@ async def upload_pdf(file: UploadFile = File(...), conversation_id: Optional[str
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Apenas arquivos PDF são suportados")
         
-        # Ler o conteúdo do arquivo
-        content = await file.read()
+        # Gravar o upload em disco por partes (respeitando o limite de tamanho)
+        with await salvar_upload(file) as upload:
+            # Processar o PDF (ou reaproveitar o processamento de um envio anterior)
+            processado = await processar_upload(upload)
         
-        # Processar o PDF
-        chunks = PDFService.process_pdf(content)
-        
-        if not chunks:
+        if not processado["chunks"]:
             raise HTTPException(status_code=400, detail="Não foi possível extrair texto do PDF")
         
-        # Gerar ID único para o documento
-        document_id = DocumentChatService.generate_document_id()
-        
-        # Armazenar documento no serviço
-        DocumentChatService.store_document(document_id, file.filename, chunks)
-        
-        # Se conversation_id foi fornecido, associar documento à conversa
-        if conversation_id:
-            DocumentChatService.associate_document_to_conversation(document_id, conversation_id)
+        resultado = await armazenar_documento(file.filename, processado, upload.sha256, conversation_id)
         
         return {
             "success": True,
             "message": "PDF processado com sucesso",
-            "document_id": document_id,
-            "conversation_id": conversation_id,
-            "filename": file.filename,
-            "chunks_count": len(chunks),
-            "preview": chunks[0][:200] + "..." if chunks[0] else "Sem conteúdo"
+            **resultado
         }
         
+    except HTTPException:
+        raise
+    except UploadMuitoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar PDF: {str(e)}")
 
+@router.post("/upload/stream")
+async def upload_pdf_stream(file: UploadFile = File(...), conversation_id: Optional[str] = Form(None)):
+    """
+    Upload com progresso: responde em NDJSON com eventos 'progress' (páginas extraídas; ausentes
+    quando o arquivo já estava no cache), 'chunk' (cada trecho gerado) e, ao final, 'done'
+    com o document_id (ou 'error')
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Apenas arquivos PDF são suportados")
+    
+    try:
+        upload = await salvar_upload(file)
+    except UploadMuitoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    eventos: asyncio.Queue = asyncio.Queue()
+    
+    def progresso(paginas_concluidas: int, total_paginas: int):
+        eventos.put_nowait({"event": "progress", "pages_done": paginas_concluidas, "total_pages": total_paginas})
+    
+    def linha(evento: Dict[str, Any]) -> str:
+        return json.dumps(evento, ensure_ascii=False) + "\n"
+    
+    async def gerar():
+        tarefa = asyncio.create_task(processar_upload(upload, progresso))
+        try:
+            while not tarefa.done():
+                proximo = asyncio.create_task(eventos.get())
+                await asyncio.wait({proximo, tarefa}, return_when=asyncio.FIRST_COMPLETED)
+                if proximo.done():
+                    yield linha(proximo.result())
+                else:
+                    proximo.cancel()
+            while not eventos.empty():
+                yield linha(eventos.get_nowait())
+            
+            processado = tarefa.result()
+            chunks = processado["chunks"]
+            if not chunks:
+                yield linha({"event": "error", "detail": "Não foi possível extrair texto do PDF"})
+                return
+            
+            for indice, chunk in enumerate(chunks):
+                yield linha({"event": "chunk", "index": indice, "text": chunk})
+            
+            resultado = await armazenar_documento(file.filename, processado, upload.sha256, conversation_id)
+            yield linha({"event": "done", **resultado})
+        except Exception as e:
+            yield linha({"event": "error", "detail": str(e)})
+        finally:
+            # Cliente desconectou no meio: não deixa a tarefa órfã
+            if not tarefa.done():
+                tarefa.cancel()
+            upload.close()
+    
+    return StreamingResponse(gerar(), media_type="application/x-ndjson")
+
 @router.post("/chat")
 async def chat_with_document(request: ChatRequest):
     """
@@ -60,18 +162,20 @@ async def chat_with_document(request: ChatRequest):
     """
     try:
         # Verificar se o documento existe
-        document = DocumentChatService.get_document(request.document_id)
+        document = await run_in_threadpool(DocumentChatService.get_document, request.document_id)
         if not document:
             raise HTTPException(status_code=404, detail="Documento não encontrado")
         
-        # Construir prompt com contexto do documento
-        context_prompt = DocumentChatService.build_context_prompt(
+        # Construir prompt com contexto do documento (a busca gera o embedding da pergunta: em thread)
+        context_prompt = await run_in_threadpool(
+            DocumentChatService.build_context_prompt,
             request.document_id, 
             request.message
         )
         
         # Adicionar mensagem do usuário ao histórico
-        DocumentChatService.add_chat_message(
+        await run_in_threadpool(
+            DocumentChatService.add_chat_message,
             request.document_id, 
             "user", 
             request.message
@@ -82,7 +186,8 @@ async def chat_with_document(request: ChatRequest):
         ai_response = f"Baseado no documento '{document['filename']}', posso ajudar com sua pergunta sobre: {request.message}"
         
         # Adicionar resposta da IA ao histórico
-        DocumentChatService.add_chat_message(
+        await run_in_threadpool(
+            DocumentChatService.add_chat_message,
             request.document_id, 
             "assistant", 
             ai_response
@@ -103,7 +208,7 @@ async def list_documents():
     Endpoint para listar documentos carregados
     """
     try:
-        documents = DocumentChatService.list_documents()
+        documents = await run_in_threadpool(DocumentChatService.list_documents)
         return {"documents": documents}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao listar documentos: {str(e)}")
@@ -114,11 +219,11 @@ async def get_chat_history(document_id: str):
     Endpoint para obter histórico de chat de um documento
     """
     try:
-        document = DocumentChatService.get_document(document_id)
+        document = await run_in_threadpool(DocumentChatService.get_document, document_id)
         if not document:
             raise HTTPException(status_code=404, detail="Documento não encontrado")
         
-        history = DocumentChatService.get_chat_history(document_id)
+        history = await run_in_threadpool(DocumentChatService.get_chat_history, document_id)
         return {
             "document_id": document_id,
             "document_name": document['filename'],
@@ -133,7 +238,7 @@ async def delete_document(document_id: str):
     Endpoint para deletar um documento
     """
     try:
-        success = DocumentChatService.delete_document(document_id)
+        success = await run_in_threadpool(DocumentChatService.delete_document, document_id)
         if not success:
             raise HTTPException(status_code=404, detail="Documento não encontrado")
         
@@ -146,4 +251,7 @@ async def get_status():
     """
     Endpoint para verificar status do serviço de upload
     """
-    return {"status": "active", "service": "document_upload"}
+    # Contagens no SQLite e, no primeiro uso, varredura do cache em disco: fora do event loop
+    return {"status": "active", "service": "document_upload",
+            "store": await run_in_threadpool(DocumentChatService.store_stats),
+            "upload_cache": await run_in_threadpool(upload_cache.stats)}
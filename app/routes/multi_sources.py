@@ -158,20 +158,13 @@ async def collect_and_index_sources(sources: Optional[List[str]]):
         collector = MultiSourceCollector()
         indexer = MultiSourceIndexer()
         
-        if sources:
-            # Coleta apenas das fontes especificadas
-            all_documents = []
-            for source in sources:
-                # Busca o scraper pelo nome
-                scraper = next((s for s in collector.scrapers if s.name == source), None)
-                if scraper:
-                    documents = scraper.extract_documents()
-                    all_documents.extend(documents)
-                    print(f"✅ Coletados {len(documents)} documentos de {source}")
-        else:
-            # Coleta de todas as fontes
-            all_documents = collector.collect_all_sources()
-            print(f"✅ Coletados {len(all_documents)} documentos de todas as fontes")
+        # Coleta as fontes em paralelo (apenas as especificadas, se houver)
+        all_documents = collector.collect_all_sources(sources)
+        
+        for report in collector.last_report:
+            print(f"📊 {report['source']}: {report['status']} - "
+                  f"{report['documents']} documentos em {report.get('elapsed_seconds', 0)}s")
+        print(f"✅ Coletados {len(all_documents)} documentos no total")
         
         # Indexa os documentos coletados
         if all_documents:
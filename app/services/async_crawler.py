@@ -0,0 +1,133 @@
+"""
+Núcleo assíncrono de coleta HTTP compartilhado pelos scrapers
+Usa um cliente com pool de conexões (HTTP/2 quando disponível),
+limite de concorrência por host e o limitador de cortesia do agendador
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+import httpx
+from bs4 import BeautifulSoup
+from app.services.collection_scheduler import HostRateLimiter, default_rate_limiter
+from app.services.http_cache import HTTPCache
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Requisições simultâneas ao mesmo host e no total
+MAX_REQUESTS_PER_HOST = int(os.getenv("CRAWLER_MAX_PER_HOST", "4"))
+MAX_CONNECTIONS = int(os.getenv("CRAWLER_MAX_CONNECTIONS", "20"))
+
+
+def http2_disponivel() -> bool:
+    """HTTP/2 (multiplexação de requisições) depende do pacote opcional h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def run_sync(coro):
+    """
+    Executa uma corrotina a partir de código síncrono.
+    Se já houver um event loop nesta thread (ex.: tarefa em background do FastAPI),
+    a corrotina roda em uma thread própria para não conflitar com ele.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+class AsyncCrawler:
+    """Cliente HTTP assíncrono com pool de conexões e concorrência por host"""
+
+    def __init__(self, max_per_host: int = MAX_REQUESTS_PER_HOST,
+                 rate_limiter: Optional[HostRateLimiter] = None,
+                 timeout: float = 30.0, headers: Optional[Dict[str, str]] = None,
+                 cache: Optional[HTTPCache] = None):
+        self.max_per_host = max(1, max_per_host)
+        self.cache = cache
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self.timeout = timeout
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self.client: Optional[httpx.AsyncClient] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            http2=http2_disponivel(),
+            headers=self.headers,
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                max_keepalive_connections=MAX_CONNECTIONS)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self.client = None
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = HostRateLimiter.host_of(url)
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_semaphores[host]
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> Optional[httpx.Response]:
+        """Baixa uma URL respeitando a concorrência e a cortesia por host"""
+        async with self._semaphore(url):
+            delay = self.rate_limiter.reserve(url)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            try:
+                response = await self.client.get(url, headers=headers)
+                if response.status_code == 304:
+                    return response  # Não modificado: o chamador usa a cópia em cache
+                response.raise_for_status()
+                return response
+            except Exception as e:
+                print(f"Erro ao acessar {url}: {e}")
+                return None
+
+    async def fetch_text(self, url: str) -> Optional[str]:
+        """Baixa uma página e retorna o HTML (revalidando a cópia em cache, se houver)"""
+        if not self.cache:
+            response = await self.fetch(url)
+            return response.text if response is not None else None
+
+        cached = self.cache.load(url)
+        response = await self.fetch(url, headers=self.cache.conditional_headers(url) if cached else None)
+
+        if response is None or response.status_code == 304:
+            return cached.text if cached else None
+        return self.cache.store(url, response.content, response.headers).text
+
+    async def fetch_soup(self, url: str) -> Optional[BeautifulSoup]:
+        """Baixa uma página e retorna o HTML já analisado"""
+        html = await self.fetch_text(url)
+        return BeautifulSoup(html, 'html.parser') if html else None
+
+    async def fetch_many(self, urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Baixa várias páginas em paralelo (mantendo a ordem de entrada)"""
+        urls = list(urls)
+        pages = await asyncio.gather(*(self.fetch_text(url) for url in urls))
+        return dict(zip(urls, pages))
+
+
+def fetch_pages(urls: Iterable[str], **crawler_kwargs) -> Dict[str, Optional[str]]:
+    """Atalho síncrono: baixa várias páginas HTML em paralelo"""
+    async def _fetch():
+        async with AsyncCrawler(**crawler_kwargs) as crawler:
+            return await crawler.fetch_many(urls)
+
+    return run_sync(_fetch())
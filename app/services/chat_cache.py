@@ -0,0 +1,199 @@
+"""
+Cache de leitura das conversas (/user-chats) e mensagens (/chat/{id}/messages)
+Os dados só mudam pelos próprios handlers do app (/ask-ia, PATCH e DELETE /chat),
+que atualizam o cache na escrita (write-through); leituras viram consultas em memória.
+Por padrão o cache é local ao processo; com CHAT_CACHE_URL=redis://... é compartilhado.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import redis
+except ImportError:  # Cache compartilhado é opcional
+    redis = None
+
+CHAT_CACHE_URL = os.getenv("CHAT_CACHE_URL", "")
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", str(10 * 60)))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "2000"))
+
+# Tamanho padrão e máximo das páginas
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "100"))
+CHAT_PAGE_MAX = 500
+
+
+class MemoryCacheBackend:
+    """Entradas com validade em um LRU local"""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._dados: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entrada = self._dados.get(key)
+        if entrada is None:
+            return None
+        if entrada[0] < time.monotonic():
+            del self._dados[key]
+            return None
+        self._dados.move_to_end(key)
+        return entrada[1]
+
+    def set(self, key: str, value: Any) -> None:
+        self._dados[key] = (time.monotonic() + self.ttl, value)
+        self._dados.move_to_end(key)
+        while len(self._dados) > self.max_entries:
+            self._dados.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._dados.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+
+class RedisCacheBackend:
+    """Entradas em JSON no Redis, compartilhadas entre workers"""
+
+    def __init__(self, url: str, ttl: int):
+        if redis is None:
+            raise RuntimeError("Instale o pacote redis para usar CHAT_CACHE_URL=redis://...")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        valor = self.client.get(f"chat_cache:{key}")
+        return json.loads(valor) if valor is not None else None
+
+    def set(self, key: str, value: Any) -> None:
+        self.client.setex(f"chat_cache:{key}", self.ttl, json.dumps(value, ensure_ascii=False))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(f"chat_cache:{key}")
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.client.scan_iter("chat_cache:*"))
+
+
+class ChatReadCache:
+    """Listas de conversas por usuário e de mensagens por conversa"""
+
+    def __init__(self, url: str = CHAT_CACHE_URL, ttl: int = CHAT_CACHE_TTL,
+                 max_entries: int = CHAT_CACHE_MAX_ENTRIES):
+        if url.startswith(("redis://", "rediss://", "unix://")):
+            self.backend = RedisCacheBackend(url, ttl)
+        else:
+            self.backend = MemoryCacheBackend(ttl, max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _obter(self, key: str, loader: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            valor = self.backend.get(key)
+        if valor is not None:
+            self.hits += 1
+            return valor
+
+        self.misses += 1
+        valor = loader()
+        with self._lock:
+            self.backend.set(key, valor)
+        return valor
+
+    def _alterar(self, key: str, funcao: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]) -> None:
+        """Aplica a escrita à entrada em cache, se houver (sem entrada, a próxima leitura carrega do banco)"""
+        with self._lock:
+            valor = self.backend.get(key)
+            if valor is not None:
+                self.backend.set(key, funcao(valor))
+
+    # --- Leitura ---
+
+    def conversations(self, user_id: str, loader: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Conversas do usuário (mais recentes primeiro); loader consulta o banco em caso de falta"""
+        return self._obter(f"conversas:{user_id}", loader)
+
+    def messages(self, conversation_id: str, loader: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Mensagens da conversa em ordem cronológica; loader consulta o banco em caso de falta"""
+        return self._obter(f"mensagens:{conversation_id}", loader)
+
+    # --- Escrita (chamadas pelos handlers junto com a escrita no banco) ---
+
+    def add_conversation(self, user_id: str, conversa: Dict[str, Any]) -> None:
+        self._alterar(f"conversas:{user_id}", lambda conversas: [conversa] + conversas)
+
+    def update_conversation(self, user_id: str, conversation_id: str, campos: Dict[str, Any]) -> None:
+        self._alterar(f"conversas:{user_id}", lambda conversas: [
+            {**c, **campos} if c.get("id") == conversation_id else c for c in conversas
+        ])
+
+    def append_messages(self, conversation_id: str, mensagens: List[Dict[str, Any]]) -> None:
+        self._alterar(f"mensagens:{conversation_id}", lambda atuais: atuais + mensagens)
+
+    def remove_conversation(self, user_id: str, conversation_id: str) -> None:
+        self._alterar(f"conversas:{user_id}", lambda conversas: [
+            c for c in conversas if c.get("id") != conversation_id
+        ])
+        with self._lock:
+            self.backend.delete(f"mensagens:{conversation_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def tamanho_pagina(limit: Optional[int]) -> int:
+    return max(1, min(limit or CHAT_PAGE_SIZE, CHAT_PAGE_MAX))
+
+
+def paginar_conversas(conversas: List[Dict[str, Any]], limit: Optional[int] = None,
+                      before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Página de conversas (mais recentes primeiro).
+
+    Args:
+        conversas: Lista completa, ordenada por created_at decrescente
+        limit: Tamanho da página
+        before: Cursor da página anterior (created_at da última conversa recebida)
+
+    Returns:
+        Tuple: (conversas da página, cursor da próxima página ou None)
+    """
+    if before:
+        conversas = [c for c in conversas if (c.get("created_at") or "") < before]
+    limite = tamanho_pagina(limit)
+    pagina = conversas[:limite]
+    proximo = pagina[-1].get("created_at") if len(conversas) > limite else None
+    return pagina, proximo
+
+
+def paginar_mensagens(mensagens: List[Dict[str, Any]], limit: Optional[int] = None,
+                      before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Página de mensagens: as mais recentes antes do cursor, em ordem cronológica.
+
+    O cursor é a posição da mensagem mais antiga já recebida; como mensagens novas
+    só entram no fim, a posição não muda entre uma página e outra.
+
+    Returns:
+        Tuple: (mensagens da página, cursor da página anterior ou None)
+    """
+    fim = len(mensagens)
+    if before and before.isdigit():
+        fim = min(int(before), fim)
+    inicio = max(0, fim - tamanho_pagina(limit))
+    return mensagens[inicio:fim], (str(inicio) if inicio > 0 else None)
+
+
+# Instância compartilhada
+chat_cache = ChatReadCache()
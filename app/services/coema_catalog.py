@@ -0,0 +1,158 @@
+"""
+Catálogo dos documentos do COEMA para as rotas /coema/documents e /coema/document/{i}
+O arquivo de dados é lido uma vez e mantido em memória com resumos prontos e
+índices por tipo, ano e número de lei; a cada consulta só o mtime/tamanho do
+arquivo é conferido, e ele é recarregado apenas quando muda.
+"""
+
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.coema_service import COEMAService
+
+# Tamanho padrão e máximo das páginas da listagem
+COEMA_PAGE_SIZE = int(os.getenv("COEMA_PAGE_SIZE", "100"))
+COEMA_PAGE_MAX = 500
+
+# Assinatura do catálogo quando o arquivo de dados não existe
+_SEM_ARQUIVO = ("", 0, 0)
+
+
+def _chave_numero(numero: str) -> str:
+    """Número de lei sem pontos (ex.: 1.234/2020 -> 1234/2020)"""
+    return str(numero).replace(".", "").strip()
+
+
+def paginacao(offset: int = 0, limit: Optional[int] = None) -> Tuple[int, int]:
+    """Offset e tamanho de página efetivos (offset >= 0, 1 <= limite <= COEMA_PAGE_MAX)"""
+    return max(0, offset), max(1, min(limit or COEMA_PAGE_SIZE, COEMA_PAGE_MAX))
+
+
+def resumo_documento(indice: int, doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Resumo exibido na listagem"""
+    return {
+        "index": indice,
+        "title": doc.get('title', 'Sem título')[:100],
+        "type": doc.get('type', 'documento'),
+        "year": doc.get('year', ''),
+        "content_length": len(doc.get('content', '')),
+        "url": doc.get('url', ''),
+        "extracted_at": doc.get('extracted_at', '')
+    }
+
+
+class COEMACatalog:
+    """Documentos do COEMA em memória, recarregados quando o arquivo muda"""
+
+    def __init__(self, service: Optional[COEMAService] = None, file_path: Optional[str] = None):
+        self.service = service or COEMAService()
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._assinatura: Optional[Tuple[str, int, int]] = None
+        self._documentos: List[Dict[str, Any]] = []
+        self._resumos: List[Dict[str, Any]] = []
+        self._por_tipo: Dict[str, List[int]] = {}
+        self._por_ano: Dict[str, List[int]] = {}
+        self._por_numero: Dict[str, List[int]] = {}
+        self.recargas = 0
+
+    def _carregar(self, path: str) -> None:
+        documentos = list(self.service.iter_coema_documents(path))
+        por_tipo, por_ano, por_numero = defaultdict(list), defaultdict(list), defaultdict(list)
+        for i, doc in enumerate(documentos):
+            por_tipo[str(doc.get('type', 'documento')).lower()].append(i)
+            if doc.get('year'):
+                por_ano[str(doc['year'])].append(i)
+            texto = f"{doc.get('title', '')} {doc.get('content') or doc.get('text', '')}"
+            for numero in self.service.extract_law_numbers(texto):
+                # "1.234" e "1234" viram a mesma chave: o documento entra uma vez só
+                posicoes = por_numero[_chave_numero(numero)]
+                if not posicoes or posicoes[-1] != i:
+                    posicoes.append(i)
+
+        self._documentos = documentos
+        self._resumos = [resumo_documento(i, doc) for i, doc in enumerate(documentos)]
+        self._por_tipo, self._por_ano, self._por_numero = dict(por_tipo), dict(por_ano), dict(por_numero)
+        self.recargas += 1
+        print(f"📚 Catálogo do COEMA carregado: {len(documentos)} documentos de {path}")
+
+    def _atualizar(self) -> None:
+        """Recarrega o catálogo se o arquivo mudou (mtime ou tamanho) desde a última leitura"""
+        try:
+            path = self.file_path or self.service.find_coema_file()
+            info = os.stat(path)
+        except FileNotFoundError as e:
+            # Sem arquivo de dados: catálogo vazio, como a leitura direta fazia
+            with self._lock:
+                if self._assinatura != _SEM_ARQUIVO:
+                    print(f"❌ Erro ao carregar documentos do COEMA: {e}")
+                    self._documentos, self._resumos = [], []
+                    self._por_tipo, self._por_ano, self._por_numero = {}, {}, {}
+                    self._assinatura = _SEM_ARQUIVO
+            return
+        assinatura = (path, info.st_mtime_ns, info.st_size)
+        if assinatura == self._assinatura:
+            return
+        with self._lock:
+            if assinatura != self._assinatura:
+                self._carregar(path)
+                self._assinatura = assinatura
+
+    def __len__(self) -> int:
+        self._atualizar()
+        return len(self._documentos)
+
+    def list(self, offset: int = 0, limit: Optional[int] = None, doc_type: Optional[str] = None,
+             year: Optional[str] = None, law_number: Optional[str] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Página de resumos, opcionalmente filtrada pelos índices.
+
+        Args:
+            offset: Posição inicial na lista filtrada
+            limit: Tamanho da página (padrão COEMA_PAGE_SIZE)
+            doc_type: Tipo do documento (ex.: resolução)
+            year: Ano
+            law_number: Número de lei/resolução citado no documento
+
+        Returns:
+            Tuple: (total de documentos que atendem aos filtros, resumos da página)
+        """
+        self._atualizar()
+        offset, limite = paginacao(offset, limit)
+
+        filtros = []
+        if doc_type:
+            filtros.append(self._por_tipo.get(doc_type.lower(), []))
+        if year:
+            filtros.append(self._por_ano.get(str(year), []))
+        if law_number:
+            filtros.append(self._por_numero.get(_chave_numero(law_number), []))
+
+        if not filtros:
+            return len(self._resumos), self._resumos[offset:offset + limite]
+
+        # Interseção a partir do menor índice (listas já em ordem de posição)
+        filtros.sort(key=len)
+        posicoes = filtros[0]
+        for outro in filtros[1:]:
+            conjunto = set(outro)
+            posicoes = [i for i in posicoes if i in conjunto]
+        return len(posicoes), [self._resumos[i] for i in posicoes[offset:offset + limite]]
+
+    def get(self, index: int) -> Optional[Dict[str, Any]]:
+        """Documento completo pela posição no arquivo (None se não existir)"""
+        self._atualizar()
+        if index < 0 or index >= len(self._documentos):
+            return None
+        return self._documentos[index]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._documentos),
+            "types": {tipo: len(posicoes) for tipo, posicoes in self._por_tipo.items()},
+            "years": len(self._por_ano),
+            "law_numbers": len(self._por_numero),
+            "file": (self._assinatura or _SEM_ARQUIVO)[0] or None,
+            "reloads": self.recargas
+        }
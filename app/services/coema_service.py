@@ -5,38 +5,46 @@ Processa e indexa documentos oficiais do COEMA no Pinecone
 
 import json
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 from datetime import datetime
 import re
 from app.services.pinecone_service import vectorstore
 from app.services.text_normalizer import normalizar_texto
+from app.services.ndjson_store import iter_records, resolver_arquivo, batched
+from app.services.legal_chunker import LegalChunker, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# Documentos lidos e enviados ao Pinecone por vez
+INDEX_BATCH_SIZE = 100
 
 class COEMAService:
     def __init__(self):
         self.namespace = "coema"
         
-    def load_coema_documents(self, file_path: str = None) -> List[Dict[str, Any]]:
-        """Carrega documentos do COEMA do arquivo JSON"""
+    def find_coema_file(self) -> str:
+        """Localiza o arquivo de dados do COEMA (NDJSON ou .json legado)"""
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        for nome in ("coema_official_documents", "coema_documents", "coema_data"):
+            file_path = resolver_arquivo(os.path.join(base_dir, nome))
+            if file_path:
+                return file_path
+        raise FileNotFoundError("Nenhum arquivo de dados do COEMA encontrado")
+    
+    def iter_coema_documents(self, file_path: str = None) -> Iterator[Dict[str, Any]]:
+        """Lê os documentos do COEMA sob demanda, um por vez"""
         if not file_path:
-            # Busca pelos arquivos de dados do COEMA
-            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-            possible_files = [
-                os.path.join(base_dir, "coema_official_documents.json"),
-                os.path.join(base_dir, "coema_documents.json"),
-                os.path.join(base_dir, "coema_data.json")
-            ]
-            
-            for file_path in possible_files:
-                if os.path.exists(file_path):
-                    break
-            else:
-                raise FileNotFoundError("Nenhum arquivo de dados do COEMA encontrado")
+            file_path = self.find_coema_file()
+        elif file_path.endswith(".json") or not os.path.exists(file_path):
+            # Versão NDJSON do mesmo arquivo tem preferência sobre o .json legado
+            file_path = resolver_arquivo(file_path) or file_path
         
+        yield from iter_records(file_path)
+    
+    def load_coema_documents(self, file_path: str = None) -> List[Dict[str, Any]]:
+        """Carrega documentos do COEMA do arquivo JSON"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                documents = json.load(f)
+            documents = list(self.iter_coema_documents(file_path))
             
-            print(f"✅ Carregados {len(documents)} documentos do COEMA de {file_path}")
+            print(f"✅ Carregados {len(documents)} documentos do COEMA")
             return documents
             
         except Exception as e:
@@ -102,37 +110,13 @@ class COEMAService:
         return list(set(law_numbers))  # Remove duplicatas
     
     def create_document_chunks(self, content: str, title: str, metadata: Dict[str, Any], 
-                             chunk_size: int = 1000, overlap: int = 200) -> List[Dict[str, Any]]:
+                             max_tokens: int = CHUNK_MAX_TOKENS,
+                             overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[Dict[str, Any]]:
         """Cria chunks de um documento para melhor indexação"""
         
-        if len(content) <= chunk_size:
-            return [{
-                'text': content,
-                'metadata': {**metadata, 'chunk_index': 0, 'total_chunks': 1}
-            }]
-        
-        chunks = []
-        words = content.split()
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk_words = words[i:i + chunk_size]
-            chunk_text = ' '.join(chunk_words)
-            
-            # Adiciona contexto do título no início de cada chunk
-            if title and not chunk_text.startswith(title[:50]):
-                chunk_text = f"{title[:50]}... {chunk_text}"
-            
-            chunk_metadata = {
-                **metadata,
-                'chunk_index': len(chunks),
-                'chunk_start': i,
-                'chunk_end': min(i + chunk_size, len(words))
-            }
-            
-            chunks.append({
-                'text': chunk_text,
-                'metadata': chunk_metadata
-            })
+        # Título no início de cada chunk como contexto; referência do artigo nos metadados
+        chunker = LegalChunker(max_tokens, overlap_tokens)
+        chunks = list(chunker.iter_chunks(content, cabecalho=title[:50], metadata=metadata))
         
         # Atualiza total de chunks em todos os metadados
         for chunk in chunks:
@@ -182,28 +166,29 @@ class COEMAService:
             if not documents_path:
                 documents_path = "coema_official_documents.json"
             
-            documents = self.load_coema_documents(documents_path)
-            if not documents:
-                return {"success": False, "message": "Nenhum documento encontrado"}
-            
-            processed_docs = self.process_coema_documents(documents)
-            
-            # Converte para formato do LangChain
+            # Lê, processa e envia em lotes: o arquivo nunca é carregado inteiro
             from langchain_core.documents import Document
-            langchain_docs = []
-            for doc in processed_docs:
-                langchain_docs.append(Document(
-                    page_content=doc["metadata"]["conteudo"],
-                    metadata={**doc["metadata"], "namespace": self.namespace}
-                ))
+            total = 0
+            for lote in batched(self.iter_coema_documents(documents_path), INDEX_BATCH_SIZE):
+                processed_docs = self.process_coema_documents(lote)
+                langchain_docs = [
+                    Document(
+                        page_content=doc["metadata"]["conteudo"],
+                        metadata={**doc["metadata"], "namespace": self.namespace}
+                    )
+                    for doc in processed_docs
+                ]
+                if langchain_docs:
+                    vectorstore.add_documents(langchain_docs)
+                total += len(processed_docs)
             
-            # Indexa no Pinecone
-            vectorstore.add_documents(langchain_docs)
+            if not total:
+                return {"success": False, "message": "Nenhum documento encontrado"}
             
             return {
                 "success": True,
-                "message": f"{len(processed_docs)} documentos do COEMA indexados com sucesso",
-                "documents_count": len(processed_docs)
+                "message": f"{total} documentos do COEMA indexados com sucesso",
+                "documents_count": total
             }
         except Exception as e:
             return {"success": False, "message": f"Erro ao indexar documentos: {str(e)}"}
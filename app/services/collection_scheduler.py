@@ -0,0 +1,147 @@
+"""
+Agendador de coleta concorrente para múltiplas fontes
+Executa os scrapers ao mesmo tempo, com limite global de concorrência
+e um limitador de cortesia por host no lugar das pausas fixas
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Intervalo mínimo (segundos) entre duas requisições ao mesmo host
+DEFAULT_HOST_INTERVAL = float(os.getenv("SCRAPER_HOST_INTERVAL", "1.0"))
+
+# Número máximo de fontes coletadas simultaneamente
+MAX_CONCURRENT_SOURCES = int(os.getenv("SCRAPER_MAX_CONCURRENCY", "4"))
+
+
+class HostRateLimiter:
+    """Limitador de cortesia por host, compartilhado entre threads"""
+
+    def __init__(self, default_interval: float = DEFAULT_HOST_INTERVAL,
+                 intervals: Optional[Dict[str, float]] = None):
+        self.default_interval = default_interval
+        self.intervals = dict(intervals or {})
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Retorna o host de uma URL (ou a própria string se não for URL)"""
+        return urlparse(url).netloc.lower() or url
+
+    def reserve(self, url: str) -> float:
+        """
+        Reserva o próximo horário livre do host da URL.
+
+        Returns:
+            float: Segundos a aguardar antes de fazer a requisição
+        """
+        host = self.host_of(url)
+        interval = self.intervals.get(host, self.default_interval)
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + interval
+
+        return slot - now
+
+    def wait(self, url: str) -> None:
+        """Bloqueia a thread atual até o host da URL estar liberado"""
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Limitador padrão usado pelos scrapers fora do agendador
+default_rate_limiter = HostRateLimiter()
+
+
+class CollectionScheduler:
+    """Executa scrapers em paralelo e registra progresso e tempo por fonte"""
+
+    def __init__(self, max_workers: int = MAX_CONCURRENT_SOURCES,
+                 rate_limiter: Optional[HostRateLimiter] = None):
+        self.max_workers = max(1, max_workers)
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self.reports: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _run_scraper(self, scraper) -> List[Dict]:
+        """Executa um scraper atualizando o relatório da fonte"""
+        report = self.reports[scraper.name]
+        report['status'] = 'running'
+        report['started_at'] = datetime.now().isoformat()
+        start = time.perf_counter()
+
+        try:
+            documents = scraper.extract_documents()
+            report['status'] = 'done'
+            report['documents'] = len(documents)
+            return documents
+        except Exception as e:
+            report['status'] = 'error'
+            report['error'] = str(e)
+            raise
+        finally:
+            report['elapsed_seconds'] = round(time.perf_counter() - start, 2)
+
+    def run(self, scrapers: List, on_documents: Optional[Callable[[str, List[Dict]], None]] = None
+            ) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Coleta de todas as fontes ao mesmo tempo.
+
+        Args:
+            scrapers: Lista de scrapers (subclasses de BaseScraper)
+            on_documents: Callback chamado com (fonte, documentos) assim que cada fonte termina
+
+        Returns:
+            Tuple: (documentos coletados, relatórios por fonte)
+        """
+        all_documents = []
+        total = len(scrapers)
+        finished = 0
+        start = time.perf_counter()
+
+        self.reports = {
+            scraper.name: {'source': scraper.name, 'status': 'pending', 'documents': 0}
+            for scraper in scrapers
+        }
+
+        # Todos os scrapers passam a dividir o mesmo limitador por host
+        for scraper in scrapers:
+            scraper.rate_limiter = self.rate_limiter
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="coleta") as executor:
+            futures = {executor.submit(self._run_scraper, scraper): scraper for scraper in scrapers}
+
+            for future in as_completed(futures):
+                scraper = futures[future]
+                report = self.reports[scraper.name]
+                finished += 1
+
+                try:
+                    documents = future.result()
+                except Exception as e:
+                    print(f"[{finished}/{total}] Erro ao coletar de {scraper.name}: {e} "
+                          f"({report.get('elapsed_seconds', 0)}s)")
+                    continue
+
+                with self._lock:
+                    all_documents.extend(documents)
+
+                print(f"[{finished}/{total}] Coletados {len(documents)} documentos de {scraper.name} "
+                      f"em {report['elapsed_seconds']}s")
+
+                if on_documents:
+                    on_documents(scraper.name, documents)
+
+        elapsed = time.perf_counter() - start
+        print(f"Coleta concluída: {len(all_documents)} documentos de {total} fontes em {elapsed:.1f}s")
+
+        return all_documents, list(self.reports.values())
@@ -1,8 +1,5 @@
 import os
 import re
-#from langchain.chat_models import ChatOpenAI
-from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
 from langchain_core.prompts import PromptTemplate
 from app.services.pinecone_service import vectorstore, search_similar_documents
 from app.services.custom_prompt import QA_CUSTOM_PROMPT
@@ -11,6 +8,9 @@ from app.services.enhanced_retriever import buscar_documentos_com_normalizacao
 from app.services.database_stats import detectar_pergunta_tecnica, gerar_resposta_tecnica
 from app.services.coema_service import COEMAService
 from app.services.lei_filter import filtrar_leis_revogadas
+from app.services.context_builder import context_builder
+from app.services.openai_clients import chat_model
+from app.services.container import services
 
 def extrair_numero_lei(pergunta: str):
     # Captura formatos com ou sem ponto, com ou sem espaços
@@ -28,26 +28,30 @@ def extrair_numero_lei(pergunta: str):
             return f"{numero[:2]}.{numero[2:]}"    # 12345 → 12.345
     return None
 
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
+def _criar_qa_chain():
+    from langchain.chains import RetrievalQA
+    return RetrievalQA.from_chain_type(
+        llm=services.get("llm"),
+        chain_type="stuff",
+        retriever=services.get("vectorstore").as_retriever(search_kwargs={"k": 3}),
+        return_source_documents=True,
+        chain_type_kwargs={
+            "prompt": QA_CUSTOM_PROMPT
+        }
+    )
+
+# Criados no primeiro uso (ver container); pool HTTP e fila do modelo em openai_clients
+llm = services.register("llm", lambda: chat_model(
+    "gpt-4o-mini",
     temperature=0,
-    api_key=os.getenv("OPENAI_API_KEY"),
     max_tokens=2000,
     request_timeout=45
-)
+))
 
 # Instância do serviço COEMA
-coema_service = COEMAService()
+coema_service = services.register("coema_service", COEMAService)
 
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-    return_source_documents=True,
-    chain_type_kwargs={
-        "prompt": QA_CUSTOM_PROMPT
-    }
-)
+qa_chain = services.register("qa_chain", _criar_qa_chain)
 
 def detectar_saudacao(pergunta: str) -> bool:
     """Detecta se a mensagem é apenas uma saudação simples"""
@@ -217,18 +221,21 @@ def consultar_lei(pergunta: str) -> dict:
     
     # Se encontrou documentos, usa eles
     if todos_documentos:
-        # Cria contexto a partir dos documentos encontrados
-        contexto = "\n\n".join([doc.page_content for doc in todos_documentos])
+        # Cria contexto a partir dos documentos encontrados (sem repetições, dentro do orçamento de tokens)
+        montagem = context_builder.build(todos_documentos)
+        print(f"📦 Contexto: {montagem['tokens']} tokens de {len(montagem['documentos'])} trechos "
+              f"({montagem['descartados_repetidos']} repetidos, {montagem['descartados_orcamento']} fora do orçamento)")
         
         # Usa o prompt customizado para gerar resposta
         prompt_formatado = QA_CUSTOM_PROMPT.format(
-            context=contexto,
+            context=montagem["contexto"],
             question=pergunta
         )
         
         resposta_llm = llm.invoke(prompt_formatado)
         resposta = resposta_llm.content
-        documentos = todos_documentos
+        # Apenas as fontes que de fato foram ao LLM são citadas
+        documentos = montagem["documentos"]
     else:
         # Fallback para busca padrão
         resultado = qa_chain(pergunta_enriquecida)
@@ -0,0 +1,98 @@
+"""
+Contêiner de serviços com inicialização preguiçosa
+Clientes pesados (Supabase, Pinecone, vectorstore, LLM, cadeia RetrievalQA, COEMA,
+IATabela) são criados no primeiro uso, e não na importação dos módulos: o app
+sobe rápido e mesmo com um serviço externo fora do ar.
+"""
+
+import time
+import threading
+from typing import Any, Callable, Dict
+
+
+class LazyProxy:
+    """Repassa atributos e chamadas ao serviço, criando-o no primeiro acesso"""
+
+    __slots__ = ("_container", "_nome")
+
+    def __init__(self, container: "ServiceContainer", nome: str):
+        object.__setattr__(self, "_container", container)
+        object.__setattr__(self, "_nome", nome)
+
+    def __getattr__(self, atributo: str) -> Any:
+        return getattr(self._container.get(self._nome), atributo)
+
+    def __call__(self, *args, **kwargs):
+        return self._container.get(self._nome)(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        estado = "criado" if self._container.is_ready(self._nome) else "pendente"
+        return f"<LazyProxy {self._nome} ({estado})>"
+
+
+class ServiceContainer:
+    """Registro de fábricas; cada serviço é criado uma única vez, sob demanda"""
+
+    def __init__(self):
+        self._fabricas: Dict[str, Callable[[], Any]] = {}
+        self._instancias: Dict[str, Any] = {}
+        self._tempos: Dict[str, float] = {}
+        self._erros: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    def register(self, nome: str, fabrica: Callable[[], Any]) -> LazyProxy:
+        """Registra a fábrica do serviço (sem criá-lo) e retorna um proxy para uso no módulo"""
+        with self._lock:
+            self._fabricas.setdefault(nome, fabrica)
+        return LazyProxy(self, nome)
+
+    def get(self, nome: str) -> Any:
+        """Instância do serviço, criada na primeira chamada"""
+        instancia = self._instancias.get(nome)
+        if instancia is not None:
+            return instancia
+
+        with self._lock:
+            if nome in self._instancias:
+                return self._instancias[nome]
+            if nome not in self._fabricas:
+                raise KeyError(f"Serviço não registrado: {nome}")
+
+            inicio = time.perf_counter()
+            try:
+                instancia = self._fabricas[nome]()
+            except Exception as e:
+                # Não guarda a falha: a próxima chamada tenta de novo
+                self._erros[nome] = str(e)
+                print(f"❌ Falha ao inicializar {nome}: {e}")
+                raise
+            self._tempos[nome] = time.perf_counter() - inicio
+            self._erros.pop(nome, None)
+            self._instancias[nome] = instancia
+            print(f"⚡ {nome} inicializado em {self._tempos[nome]:.2f}s")
+            return instancia
+
+    def is_ready(self, nome: str) -> bool:
+        return nome in self._instancias
+
+    def reset(self, nome: str) -> None:
+        """Descarta a instância (a próxima chamada cria outra)"""
+        with self._lock:
+            self._instancias.pop(nome, None)
+            self._tempos.pop(nome, None)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Estado de cada serviço registrado e o tempo que levou para ser criado"""
+        with self._lock:
+            return {
+                nome: {
+                    "initialized": nome in self._instancias,
+                    "seconds": round(self._tempos[nome], 3) if nome in self._tempos else None,
+                    "error": self._erros.get(nome)
+                }
+                for nome in self._fabricas
+            }
+
+
+# Contêiner único do processo
+services = ServiceContainer()
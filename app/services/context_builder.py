@@ -0,0 +1,160 @@
+"""
+Montagem do contexto enviado ao LLM
+Remove trechos repetidos ou sobrepostos, ordena por relevância e corta
+no orçamento de tokens, numerando as fontes mantidas para citação.
+Scores de fontes diferentes não são comparáveis (ex.: o COEMA usa um valor fixo):
+a ordem é definida dentro de cada fonte e as fontes são intercaladas.
+"""
+
+import os
+import re
+import hashlib
+from typing import Any, Dict, List, Set
+from app.services.tokens import contar_tokens, truncar_tokens
+
+# Orçamento de tokens do contexto (documentos) por consulta
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+
+# Modelo cujo tokenizador mede o contexto
+CONTEXT_MODEL = os.getenv("CONTEXT_MODEL", "gpt-4o-mini")
+
+# Trecho cujos shingles já estão nesta fração em um trecho mantido é considerado repetido
+LIMIAR_SOBREPOSICAO = 0.8
+
+# Abaixo deste saldo de tokens não vale a pena incluir um trecho cortado
+MIN_TOKENS_TRECHO = 120
+
+TAMANHO_SHINGLE = 8
+
+_PALAVRAS = re.compile(r"\w+")
+
+
+def _shingles(texto: str) -> Set[int]:
+    """Conjunto de sequências de palavras (hash) usado para detectar sobreposição"""
+    palavras = _PALAVRAS.findall(texto.lower())
+    if len(palavras) < TAMANHO_SHINGLE:
+        return {hash(" ".join(palavras))} if palavras else set()
+    return {hash(" ".join(palavras[i:i + TAMANHO_SHINGLE]))
+            for i in range(len(palavras) - TAMANHO_SHINGLE + 1)}
+
+
+def _origem(metadata: Dict[str, Any]) -> str:
+    """Fonte que definiu o score do trecho (índice/tipo de busca)"""
+    return str(metadata.get("tipo_fonte") or metadata.get("fonte") or "")
+
+
+def ordenar_por_fonte(documentos: List[Any]) -> List[Any]:
+    """
+    Ordena por relevância sem comparar scores de fontes diferentes: cada trecho
+    recebe a posição dentro da própria fonte, e o score relativo ao maior da fonte
+    desempata entre fontes. Empates mantêm a ordem da busca.
+    """
+    por_fonte: Dict[str, List[Any]] = {}
+    for doc in documentos:
+        por_fonte.setdefault(_origem(doc.metadata), []).append(doc)
+
+    chaves = {}
+    for docs in por_fonte.values():
+        docs = sorted(docs, key=lambda doc: -(doc.metadata.get("score") or 0))
+        maior = docs[0].metadata.get("score") or 0
+        for posicao, doc in enumerate(docs):
+            relativo = (doc.metadata.get("score") or 0) / maior if maior > 0 else 0
+            chaves[id(doc)] = (posicao, -relativo)
+    return sorted(documentos, key=lambda doc: chaves[id(doc)])
+
+
+def _rotulo_fonte(metadata: Dict[str, Any]) -> str:
+    titulo = metadata.get("titulo") or metadata.get("title") or "Sem título"
+    referencia = metadata.get("referencia")
+    return f"{titulo} ({referencia})" if referencia else titulo
+
+
+class ContextBuilder:
+    """Seleciona e formata os documentos recuperados dentro de um orçamento de tokens"""
+
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, model: str = CONTEXT_MODEL):
+        self.max_tokens = max_tokens
+        self.model = model
+
+    def build(self, documentos: List[Any]) -> Dict[str, Any]:
+        """
+        Monta o contexto a partir de documentos no formato do LangChain (page_content, metadata).
+
+        Args:
+            documentos: Documentos recuperados; 'score' nos metadados define a prioridade
+                        dentro da fonte ('tipo_fonte' ou 'fonte')
+
+        Returns:
+            Dict: contexto (texto), documentos mantidos, fontes citadas, tokens usados
+                  e quantidade de trechos descartados por repetição ou orçamento
+        """
+        ordenados = ordenar_por_fonte(documentos)
+
+        blocos = []
+        mantidos = []
+        fontes = []
+        vistos_hash = set()
+        vistos_shingles: List[Set[int]] = []
+        usados = 0
+        repetidos = 0
+        sem_espaco = 0
+
+        for doc in ordenados:
+            texto = (doc.page_content or "").strip()
+            if not texto:
+                continue
+
+            # Repetição exata (mesmo trecho vindo de índices diferentes)
+            digest = hashlib.sha1(" ".join(texto.split()).encode("utf-8")).hexdigest()
+            if digest in vistos_hash:
+                repetidos += 1
+                continue
+
+            # Sobreposição: trecho quase todo contido em outro já mantido
+            shingles = _shingles(texto)
+            if shingles and any(len(shingles & anterior) >= LIMIAR_SOBREPOSICAO * len(shingles)
+                                for anterior in vistos_shingles):
+                repetidos += 1
+                continue
+
+            numero = len(mantidos) + 1
+            rotulo = _rotulo_fonte(doc.metadata)
+            cabecalho = f"[Fonte {numero}] {rotulo}\n"
+            custo_cabecalho = contar_tokens(cabecalho, self.model)
+            custo = custo_cabecalho + contar_tokens(texto, self.model)
+            restante = self.max_tokens - usados
+
+            if custo > restante:
+                # Corta o trecho se ainda houver espaço útil; senão tenta o próximo (menor)
+                if restante - custo_cabecalho < MIN_TOKENS_TRECHO:
+                    sem_espaco += 1
+                    continue
+                texto = truncar_tokens(texto, restante - custo_cabecalho - 3, self.model) + " [...]"
+                custo = custo_cabecalho + contar_tokens(texto, self.model)
+
+            vistos_hash.add(digest)
+            vistos_shingles.append(shingles)
+            blocos.append(cabecalho + texto)
+            mantidos.append(doc)
+            usados += custo
+            fontes.append({
+                "numero": numero,
+                "titulo": doc.metadata.get("titulo") or doc.metadata.get("title") or "Sem título",
+                "referencia": doc.metadata.get("referencia", ""),
+                "fonte": doc.metadata.get("fonte", ""),
+                "score": doc.metadata.get("score"),
+                "tokens": custo
+            })
+
+        return {
+            "contexto": "\n\n".join(blocos),
+            "documentos": mantidos,
+            "fontes": fontes,
+            "tokens": usados,
+            "descartados_repetidos": repetidos,
+            "descartados_orcamento": sem_espaco
+        }
+
+
+# Instância compartilhada (orçamento padrão)
+context_builder = ContextBuilder()
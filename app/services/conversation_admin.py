@@ -0,0 +1,137 @@
+"""
+Operações em lote sobre conversas (excluir, renomear, arquivar)
+Cada lote de IDs vira um único comando no Supabase (filtro .in_()), em vez de uma
+chamada por conversa, e limpa na hora a fila de gravação, o cache de leitura,
+os resumos e os vínculos com documentos das conversas afetadas.
+Arquivar depende da coluna conversations.archived (migrations/001_conversations_archived.sql);
+sem ela, o arquivamento é recusado em vez de falhar no banco.
+"""
+
+import os
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List
+from fastapi.concurrency import run_in_threadpool
+from app.services.document_chat_service import DocumentChatService
+from app.services.message_queue import erro_permanente
+
+# IDs por comando (o filtro .in_() vai na URL da requisição ao PostgREST)
+CHAT_BULK_BATCH_SIZE = int(os.getenv("CHAT_BULK_BATCH_SIZE", "100"))
+
+# Função no banco que exclui conversas e mensagens em um só comando, se existir
+# (ex.: delete_conversations(conversation_ids uuid[])); vazio = dois comandos por lote
+CHAT_DELETE_RPC = os.getenv("CHAT_DELETE_RPC", "")
+
+
+def _ids_unicos(conversation_ids: Iterable[Any]) -> List[str]:
+    return list(dict.fromkeys(str(conversation_id) for conversation_id in conversation_ids))
+
+
+class ArquivamentoIndisponivel(Exception):
+    """A tabela conversations não tem a coluna archived (migração não aplicada)"""
+
+
+class ConversationAdmin:
+    """Exclusão e atualização de várias conversas por requisição"""
+
+    def __init__(self, supabase, message_queue, chat_cache, conversation_context):
+        self.supabase = supabase
+        self.message_queue = message_queue
+        self.chat_cache = chat_cache
+        self.conversation_context = conversation_context
+        self._tem_archived = None
+
+    def _lotes(self, ids: List[str]) -> Iterable[List[str]]:
+        for inicio in range(0, len(ids), CHAT_BULK_BATCH_SIZE):
+            yield ids[inicio:inicio + CHAT_BULK_BATCH_SIZE]
+
+    def _excluir_no_banco(self, ids: List[str]) -> None:
+        for lote in self._lotes(ids):
+            if CHAT_DELETE_RPC:
+                self.supabase.rpc(CHAT_DELETE_RPC, {"conversation_ids": lote}).execute()
+                continue
+            # Mensagens antes das conversas (chave estrangeira)
+            self.supabase.table("messages").delete().in_("conversation_id", lote).execute()
+            self.supabase.table("conversations").delete().in_("id", lote).execute()
+
+    def _atualizar_no_banco(self, ids: List[str], campos: Dict[str, Any]) -> None:
+        for lote in self._lotes(ids):
+            self.supabase.table("conversations").update(campos).in_("id", lote).execute()
+
+    def _verificar_archived(self) -> bool:
+        try:
+            self.supabase.table("conversations").select("archived").limit(1).execute()
+        except Exception as e:
+            if erro_permanente(e):
+                return False
+            raise  # Falha de rede: não conclui nada sobre a coluna
+        return True
+
+    async def archiving_available(self) -> bool:
+        """Se a coluna conversations.archived existe (consultado uma vez e guardado)"""
+        if self._tem_archived is None:
+            self._tem_archived = await run_in_threadpool(self._verificar_archived)
+            if not self._tem_archived:
+                print("⚠️ Coluna conversations.archived ausente: aplique migrations/001_conversations_archived.sql")
+        return self._tem_archived
+
+    async def delete(self, user_id: str, conversation_ids: Iterable[Any]) -> int:
+        """
+        Exclui conversas e suas mensagens.
+
+        Args:
+            user_id: Dono das conversas (chave do cache de leitura)
+            conversation_ids: IDs das conversas
+
+        Returns:
+            int: Quantidade de conversas processadas
+        """
+        ids = _ids_unicos(conversation_ids)
+        if not ids:
+            return 0
+
+        # Com o envio da fila suspenso: um lote em andamento termina antes (e é apagado
+        # junto), e nenhum upsert recria no banco o que está sendo excluído
+        async with self.message_queue.locked():
+            for conversation_id in ids:
+                self.message_queue.discard(conversation_id)
+                self.chat_cache.remove_conversation(user_id, conversation_id)
+                self.conversation_context.forget(conversation_id)
+            await run_in_threadpool(DocumentChatService.forget_conversations, ids)
+
+            await run_in_threadpool(self._excluir_no_banco, ids)
+        return len(ids)
+
+    async def update(self, user_id: str, conversation_ids: Iterable[Any], campos: Dict[str, Any]) -> int:
+        """Aplica os mesmos campos (ex.: título, arquivada) a várias conversas"""
+        ids = _ids_unicos(conversation_ids)
+        if not ids:
+            return 0
+
+        pendentes = False
+        for conversation_id in ids:
+            # Conversa ainda na fila: só colunas que o insert já tem (ex.: título) mudam nele
+            pendentes |= self.message_queue.update_pending_conversation(conversation_id, campos)
+            self.chat_cache.update_conversation(user_id, conversation_id, campos)
+
+        if pendentes:
+            # O update no banco só alcança conversas já gravadas: envia a fila antes
+            await self.message_queue.flush()
+        await run_in_threadpool(self._atualizar_no_banco, ids, campos)
+        return len(ids)
+
+    async def rename(self, user_id: str, titles: Dict[Any, str]) -> int:
+        """Renomeia conversas; conversas com o mesmo título novo compartilham um comando"""
+        por_titulo: Dict[str, List[str]] = defaultdict(list)
+        for conversation_id, titulo in titles.items():
+            por_titulo[titulo].append(str(conversation_id))
+
+        total = 0
+        for titulo, ids in por_titulo.items():
+            total += await self.update(user_id, ids, {"title": titulo})
+        return total
+
+    async def archive(self, user_id: str, conversation_ids: Iterable[Any], archived: bool = True) -> int:
+        """Arquiva (ou desarquiva) conversas; ArquivamentoIndisponivel se a coluna 'archived' não existe"""
+        if not await self.archiving_available():
+            raise ArquivamentoIndisponivel("Coluna conversations.archived ausente")
+        return await self.update(user_id, conversation_ids, {"archived": archived})
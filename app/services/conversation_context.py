@@ -0,0 +1,213 @@
+"""
+Contexto de conversa enviado ao LLM em /ask-ia
+O histórico vem da tabela 'messages' (não do payload do cliente). As mensagens
+mais recentes entram inteiras até o orçamento de tokens; as anteriores são
+condensadas em um resumo, atualizado em segundo plano, sem atrasar a resposta.
+"""
+
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.services.tokens import contar_tokens, truncar_tokens
+from app.services.openai_clients import chat_completion
+
+# Orçamento de tokens das mensagens anteriores (janela + resumo) por turno
+CONVERSATION_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", "3000"))
+
+# Quantas mensagens recentes são lidas do banco por turno
+CONVERSATION_FETCH_LIMIT = int(os.getenv("CONVERSATION_FETCH_LIMIT", "200"))
+
+# Modelo e tamanho do resumo das mensagens que saíram da janela
+CONVERSATION_SUMMARY_MODEL = os.getenv("CONVERSATION_SUMMARY_MODEL", "gpt-4o-mini")
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "400"))
+
+# Quantos resumos ficam em memória (conversas usadas há mais tempo saem primeiro)
+CONVERSATION_SUMMARY_CACHE = int(os.getenv("CONVERSATION_SUMMARY_CACHE", "1000"))
+
+# Custo fixo aproximado de cada mensagem no formato de chat (papel e separadores)
+TOKENS_POR_MENSAGEM = 4
+
+PROMPT_RESUMO = (
+    "Você mantém o resumo de uma conversa sobre legislação ambiental. "
+    "Atualize o resumo abaixo com as novas mensagens, preservando leis, artigos, "
+    "números, municípios, atividades e decisões citadas. Responda apenas com o resumo, "
+    "em português, com no máximo {limite} tokens."
+)
+
+
+class ConversationContextManager:
+    """Monta as mensagens de cada turno: resumo + janela recente + pergunta atual"""
+
+    def __init__(self, supabase, max_tokens: int = CONVERSATION_MAX_TOKENS,
+                 summary_model: str = CONVERSATION_SUMMARY_MODEL,
+                 pending_messages: Optional[Callable[[str], List[Dict[str, Any]]]] = None):
+        self.supabase = supabase
+        # Mensagens já aceitas mas ainda não gravadas no banco (fila de gravação diferida)
+        self.pending_messages = pending_messages
+        self.max_tokens = max_tokens
+        self.summary_model = summary_model
+        # conversation_id -> {'texto': resumo, 'ate': created_at da última mensagem resumida}
+        self._resumos: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._em_andamento = set()
+        self._tarefas = set()
+
+    def carregar_historico(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Mensagens da conversa (as mais recentes), em ordem cronológica, incluindo as ainda na fila"""
+        # Lê a fila antes do banco: uma mensagem gravada no meio aparece nos dois e é deduplicada
+        # pelo id (gerado na fila); o created_at volta do PostgREST em outro formato
+        pendentes = self.pending_messages(conversation_id) if self.pending_messages else []
+        response = self.supabase \
+            .table("messages") \
+            .select("id, role, content, created_at") \
+            .eq("conversation_id", conversation_id) \
+            .order("created_at", desc=True) \
+            .limit(CONVERSATION_FETCH_LIMIT) \
+            .execute()
+        historico = list(reversed(response.data or []))
+        if not pendentes:
+            return historico
+
+        vistas = {m.get("id") for m in historico}
+        historico.extend(m for m in pendentes if m.get("id") not in vistas)
+        historico.sort(key=lambda m: m.get("created_at") or "")
+        return historico[-CONVERSATION_FETCH_LIMIT:]
+
+    def _custo(self, mensagem: Dict[str, Any], model: str) -> int:
+        return TOKENS_POR_MENSAGEM + contar_tokens(mensagem.get("content") or "", model)
+
+    def _get_resumo(self, conversation_id: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            resumo = self._resumos.get(conversation_id)
+            if resumo:
+                self._resumos.move_to_end(conversation_id)
+            return resumo
+
+    def _set_resumo(self, conversation_id: str, resumo: Dict[str, str]) -> None:
+        with self._lock:
+            self._resumos[conversation_id] = resumo
+            self._resumos.move_to_end(conversation_id)
+            while len(self._resumos) > CONVERSATION_SUMMARY_CACHE:
+                self._resumos.popitem(last=False)
+
+    async def build_messages(self, conversation_id: Optional[str], user_message: str,
+                             document_context: Optional[str] = None,
+                             model: str = "gpt-4o-mini") -> Dict[str, Any]:
+        """
+        Monta a lista de mensagens do turno sem alterar o histórico recebido.
+
+        Args:
+            conversation_id: Conversa existente (None para uma conversa nova)
+            user_message: Pergunta atual do usuário
+            document_context: Trechos do documento associado à conversa, se houver
+            model: Modelo do turno (define o tokenizador do orçamento)
+
+        Returns:
+            Dict: messages (para a OpenAI), tokens do histórico, mensagens na janela
+                  e mensagens cobertas apenas pelo resumo
+        """
+        historico: List[Dict[str, Any]] = []
+        if conversation_id:
+            try:
+                historico = await run_in_threadpool(self.carregar_historico, conversation_id)
+            except Exception as e:
+                print(f"⚠️ Não foi possível carregar o histórico da conversa {conversation_id}: {e}")
+
+        resumo = self._get_resumo(conversation_id) if conversation_id else None
+        tokens_resumo = self._custo({"content": resumo["texto"]}, model) if resumo else 0
+
+        # Janela: da mensagem mais recente para a mais antiga, até o orçamento
+        janela: List[Dict[str, Any]] = []
+        usados = tokens_resumo
+        corte = len(historico)
+        for mensagem in reversed(historico):
+            # O que já está no resumo não se repete na janela
+            if resumo and (mensagem.get("created_at") or "") <= resumo["ate"]:
+                break
+            custo = self._custo(mensagem, model)
+            if usados + custo > self.max_tokens:
+                break
+            janela.append({"role": mensagem["role"], "content": mensagem["content"]})
+            usados += custo
+            corte -= 1
+        janela.reverse()
+
+        # Mensagens fora da janela e ainda não resumidas vão para o resumo em segundo plano
+        antigas = historico[:corte]
+        if resumo:
+            antigas = [m for m in antigas if (m.get("created_at") or "") > resumo["ate"]]
+        if antigas:
+            self._agendar_resumo(conversation_id, antigas)
+
+        messages: List[Dict[str, str]] = []
+        if resumo:
+            messages.append({"role": "system", "content": f"Resumo da conversa até aqui:\n{resumo['texto']}"})
+        messages.extend(janela)
+        # Mensagem nova: o texto do usuário fica intacto para ser gravado no histórico
+        messages.append({"role": "user", "content": user_message + (document_context or "")})
+
+        return {
+            "messages": messages,
+            "tokens": usados,
+            "janela": len(janela),
+            "resumidas": corte
+        }
+
+    def _agendar_resumo(self, conversation_id: str, mensagens: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            if conversation_id in self._em_andamento:
+                return
+            self._em_andamento.add(conversation_id)
+        tarefa = asyncio.create_task(self._atualizar_resumo(conversation_id, mensagens))
+        # Mantém referência até o fim (o event loop guarda apenas referências fracas)
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+
+    def _fatias(self, mensagens: List[Dict[str, Any]], limite: int):
+        """Divide as mensagens em transcrições de até `limite` tokens, sem pular nenhuma"""
+        partes: List[str] = []
+        usados = 0
+        for indice, mensagem in enumerate(mensagens):
+            linha = f"{mensagem['role']}: {mensagem['content']}"
+            custo = contar_tokens(linha + "\n", self.summary_model)
+            if partes and usados + custo > limite:
+                yield "\n".join(partes), mensagens[indice - 1]
+                partes, usados = [], 0
+            # Só uma mensagem sozinha maior que o limite é cortada
+            partes.append(truncar_tokens(linha, limite, self.summary_model))
+            usados += custo
+        if partes:
+            yield "\n".join(partes), mensagens[-1]
+
+    async def _atualizar_resumo(self, conversation_id: str, mensagens: List[Dict[str, Any]]) -> None:
+        """Incorpora mensagens que saíram da janela ao resumo da conversa"""
+        try:
+            # O próprio pedido de resumo respeita um limite: conversas longas são resumidas
+            # em fatias, e 'ate' avança só até a última mensagem já incorporada
+            for transcricao, ultima in self._fatias(mensagens, self.max_tokens * 2):
+                anterior = self._get_resumo(conversation_id)
+                conteudo = f"Resumo atual:\n{anterior['texto'] if anterior else '(vazio)'}\n\nNovas mensagens:\n{transcricao}"
+                completion = await run_in_threadpool(
+                    chat_completion,
+                    model=self.summary_model,
+                    messages=[
+                        {"role": "system", "content": PROMPT_RESUMO.format(limite=CONVERSATION_SUMMARY_TOKENS)},
+                        {"role": "user", "content": conteudo}
+                    ]
+                )
+                texto = truncar_tokens(completion.choices[0].message.content or "",
+                                       CONVERSATION_SUMMARY_TOKENS, self.summary_model)
+                self._set_resumo(conversation_id, {"texto": texto, "ate": ultima.get("created_at") or ""})
+        except Exception as e:
+            print(f"⚠️ Falha ao atualizar o resumo da conversa {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._em_andamento.discard(conversation_id)
+
+    def forget(self, conversation_id: str) -> None:
+        """Descarta o resumo de uma conversa (ex.: conversa excluída)"""
+        with self._lock:
+            self._resumos.pop(conversation_id, None)
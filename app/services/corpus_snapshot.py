@@ -0,0 +1,325 @@
+"""
+Snapshot do corpus do gerador de tabelas em arquivo mapeado em memória (mmap)
+O corpus (metadados de todas as leis no Pinecone) é baixado uma vez e gravado em
+disco; cada processo (e cada sessão do Streamlit) mapeia o mesmo arquivo somente
+leitura, e as páginas ficam no cache do sistema operacional, compartilhadas.
+
+Formato colunar: colunas com poucos valores distintos (jurisdicao, tipo, fonte...)
+guardam um código por linha e a lista de valores uma única vez; as demais guardam
+(início, fim) de cada valor em um bloco de texto comum, sem repetir textos iguais.
+As linhas são montadas como dict apenas quando acessadas; filtrar() seleciona as
+linhas por uma coluna e monta só as que passam, com as colunas pedidas.
+"""
+
+import os
+import json
+import mmap
+import time
+import struct
+import tempfile
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import numpy as np
+
+CORPUS_SNAPSHOT_PATH = os.getenv("CORPUS_SNAPSHOT_PATH", os.path.join(".cache", "corpus.snapshot"))
+
+# Idade máxima do snapshot antes de baixar o corpus de novo (0 = nunca expira)
+CORPUS_SNAPSHOT_MAX_AGE = int(os.getenv("CORPUS_SNAPSHOT_MAX_AGE", str(24 * 60 * 60)))
+
+ASSINATURA = b"IACORP02"
+_CABECALHO = struct.Struct("<8sQ")
+
+# Coluna vira categoria quando tem até este número de valores distintos
+# e no máximo um valor distinto a cada CATEGORIA_PROPORCAO linhas
+CATEGORIA_MAX_VALORES = 4096
+CATEGORIA_PROPORCAO = 4
+
+# Marca de campo ausente na linha (diferente de campo com valor vazio)
+_AUSENTE = object()
+_SEM_TEXTO = np.iinfo(np.uint64).max
+
+
+def _alinhar(f) -> int:
+    """Completa o arquivo até um múltiplo de 8 bytes e retorna a posição"""
+    posicao = f.tell()
+    if posicao % 8:
+        f.write(b"\0" * (8 - posicao % 8))
+    return f.tell()
+
+
+def _tipo_codigo(quantidade: int):
+    # O maior valor do tipo marca "campo ausente na linha"
+    return np.uint8 if quantidade < 0xFF else np.uint16 if quantidade < 0xFFFF else np.uint32
+
+
+def _colunas(rows: List[Dict[str, Any]]) -> List[str]:
+    nomes = {}
+    for row in rows:
+        for nome in row:
+            nomes.setdefault(nome, None)
+    return list(nomes)
+
+
+def write_snapshot(path: str, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    Grava o snapshot de forma atômica (arquivo temporário + rename).
+
+    Returns:
+        int: Quantidade de linhas gravadas
+    """
+    rows = list(rows)
+    total = len(rows)
+
+    texto = bytearray()
+    posicoes: Dict[str, tuple] = {}
+
+    def guardar_texto(valor: str) -> tuple:
+        # Textos iguais (ex.: descrição curta igual à ementa) ocupam o bloco uma vez só
+        if valor not in posicoes:
+            dados = valor.encode("utf-8")
+            posicoes[valor] = (len(texto), len(texto) + len(dados))
+            texto.extend(dados)
+        return posicoes[valor]
+
+    colunas = []
+    secoes = []
+    for nome in _colunas(rows):
+        valores = [row.get(nome, _AUSENTE) for row in rows]
+        presentes = [v for v in valores if v is not _AUSENTE]
+        so_texto = all(isinstance(v, str) for v in presentes)
+        distintos = list(dict.fromkeys(presentes)) if so_texto else []
+
+        if so_texto and len(distintos) <= CATEGORIA_MAX_VALORES and len(distintos) * CATEGORIA_PROPORCAO <= max(total, 1):
+            tipo = _tipo_codigo(len(distintos))
+            codigo = {valor: i for i, valor in enumerate(distintos)}
+            vazio = np.iinfo(tipo).max
+            codigos = np.array([vazio if v is _AUSENTE else codigo[v] for v in valores], dtype=tipo)
+            colunas.append({"name": nome, "kind": "cat", "dtype": np.dtype(tipo).str, "values": distintos})
+            secoes.append(codigos)
+            continue
+
+        # Texto (ou JSON, para valores que não são str) no bloco comum
+        spans = np.zeros((total, 2), dtype=np.uint64)
+        for i, valor in enumerate(valores):
+            if valor is _AUSENTE:
+                spans[i] = (_SEM_TEXTO, 0)
+            else:
+                spans[i] = guardar_texto(valor if so_texto else json.dumps(valor, ensure_ascii=False))
+        colunas.append({"name": nome, "kind": "text" if so_texto else "json"})
+        secoes.append(spans)
+
+    diretorio = os.path.dirname(path) or "."
+    os.makedirs(diretorio, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "r+b") as f:
+            # Cabeçalho provisório; as posições das seções são conhecidas só depois de gravá-las
+            f.write(b"\0" * _CABECALHO.size)
+            for coluna, secao in zip(colunas, secoes):
+                coluna["offset"] = _alinhar(f)
+                f.write(secao.tobytes())
+            texto_offset = _alinhar(f)
+            f.write(texto)
+
+            indice = json.dumps({
+                "rows": total,
+                "columns": colunas,
+                "text": [texto_offset, len(texto)]
+            }, ensure_ascii=False).encode("utf-8")
+            indice_offset = _alinhar(f)
+            f.write(indice)
+            f.seek(0)
+            f.write(_CABECALHO.pack(ASSINATURA, indice_offset))
+        os.replace(temporario, path)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return total
+
+
+class CorpusSnapshot(Sequence):
+    """Sequência somente leitura de dicts sobre o arquivo mapeado"""
+
+    def __init__(self, path: str = CORPUS_SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            assinatura, indice_offset = _CABECALHO.unpack_from(self._mm, 0)
+            if assinatura != ASSINATURA:
+                raise ValueError(f"Arquivo não é um snapshot de corpus: {path}")
+            indice = json.loads(self._mm[indice_offset:])
+        except Exception:
+            self._mm.close()
+            raise
+
+        self._total = indice["rows"]
+        texto_offset, texto_tamanho = indice["text"]
+        self._texto = memoryview(self._mm)[texto_offset:texto_offset + texto_tamanho]
+        # Arrays numpy são vistas sobre o mmap (sem cópia)
+        self._colunas = []
+        for coluna in indice["columns"]:
+            if coluna["kind"] == "cat":
+                dados = np.frombuffer(self._mm, dtype=np.dtype(coluna["dtype"]),
+                                      count=self._total, offset=coluna["offset"])
+            else:
+                dados = np.frombuffer(self._mm, dtype=np.uint64, count=self._total * 2,
+                                      offset=coluna["offset"]).reshape(self._total, 2)
+            self._colunas.append((coluna["name"], coluna["kind"], dados, coluna.get("values")))
+        self.columns = [nome for nome, _, _, _ in self._colunas]
+
+    def _valor(self, kind: str, dados, valores, i: int):
+        """Valor da coluna na linha i (ou _AUSENTE)"""
+        if kind == "cat":
+            codigo = int(dados[i])
+            return valores[codigo] if codigo < len(valores) else _AUSENTE
+        inicio, fim = int(dados[i, 0]), int(dados[i, 1])
+        if inicio == _SEM_TEXTO:
+            return _AUSENTE
+        texto = str(self._texto[inicio:fim], "utf-8")
+        return json.loads(texto) if kind == "json" else texto
+
+    def _linha(self, i: int, colunas=None) -> Dict[str, Any]:
+        row = {}
+        for nome, kind, dados, valores in colunas or self._colunas:
+            valor = self._valor(kind, dados, valores, i)
+            if valor is not _AUSENTE:
+                row[nome] = valor
+        return row
+
+    def rows(self, colunas: Optional[Iterable[str]] = None, indices: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Linhas montadas apenas com as colunas pedidas.
+
+        Args:
+            colunas: Nomes das colunas (None = todas)
+            indices: Posições das linhas (None = todas, em ordem)
+        """
+        selecionadas = self._colunas
+        if colunas is not None:
+            nomes = set(colunas)
+            selecionadas = [coluna for coluna in self._colunas if coluna[0] in nomes]
+        for i in range(self._total) if indices is None else indices:
+            yield self._linha(i, selecionadas)
+
+    def where(self, nome: str, condicao: Callable[[Any], bool], padrao: Any = None) -> List[int]:
+        """Posições das linhas em que condicao(valor da coluna) é verdadeira, sem montar as linhas"""
+        for coluna, kind, dados, valores in self._colunas:
+            if coluna == nome and kind == "cat":
+                # Condição avaliada uma vez por valor distinto (o último é o campo ausente)
+                aceitos = np.array([bool(condicao(valor)) for valor in valores] + [bool(condicao(padrao))])
+                return np.flatnonzero(aceitos[np.minimum(dados, len(valores))]).tolist()
+        return [i for i, valor in enumerate(self.column(nome, padrao)) if condicao(valor)]
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._linha(j) for j in range(*i.indices(self._total))]
+        if i < 0:
+            i += self._total
+        if not 0 <= i < self._total:
+            raise IndexError("índice fora do snapshot")
+        return self._linha(i)
+
+    def __iter__(self):
+        for i in range(self._total):
+            yield self._linha(i)
+
+    def column(self, nome: str, padrao: Any = None) -> List[Any]:
+        """Valores de uma coluna, sem montar as linhas (campo ausente vira padrao)"""
+        for coluna, kind, dados, valores in self._colunas:
+            if coluna != nome:
+                continue
+            if kind == "cat":
+                # Códigos fora da lista (campo ausente) apontam para o padrão no fim
+                tabela = list(valores) + [padrao]
+                return [tabela[codigo] for codigo in np.minimum(dados, len(valores)).tolist()]
+            resultado = []
+            for i in range(self._total):
+                valor = self._valor(kind, dados, valores, i)
+                resultado.append(padrao if valor is _AUSENTE else valor)
+            return resultado
+        return [padrao] * self._total
+
+    def idade(self) -> float:
+        """Segundos desde a gravação do arquivo"""
+        return time.time() - os.path.getmtime(self.path)
+
+
+def coluna(corpus: Sequence, nome: str, padrao: Any = None) -> List[Any]:
+    """Valores de uma coluna do corpus, seja snapshot ou lista de dicts"""
+    if isinstance(corpus, CorpusSnapshot):
+        return corpus.column(nome, padrao)
+    return [row.get(nome, padrao) for row in corpus]
+
+
+def filtrar(corpus: Sequence, nome: str, condicao: Callable[[Any], bool], colunas: Optional[Iterable[str]] = None,
+            padrao: Any = None) -> Iterator[Dict[str, Any]]:
+    """
+    Linhas do corpus cujo valor na coluna nome atende à condição.
+    No snapshot, a coluna é filtrada sem montar linhas e só as linhas aceitas são
+    montadas, com as colunas pedidas; em listas de dicts, as linhas vêm inteiras.
+
+    Args:
+        corpus: CorpusSnapshot ou lista de dicts
+        nome: Coluna usada no filtro (ex.: jurisdicao)
+        condicao: Recebe o valor da coluna (padrao se ausente)
+        colunas: Colunas necessárias nas linhas retornadas (None = todas)
+    """
+    if isinstance(corpus, CorpusSnapshot):
+        return corpus.rows(colunas, corpus.where(nome, condicao, padrao))
+    return (row for row in corpus if condicao(row.get(nome, padrao)))
+
+
+def abrir_snapshot(path: str = CORPUS_SNAPSHOT_PATH, max_age: int = CORPUS_SNAPSHOT_MAX_AGE) -> Optional[CorpusSnapshot]:
+    """Snapshot existente e dentro da validade, ou None"""
+    if not os.path.exists(path):
+        return None
+    if max_age and time.time() - os.path.getmtime(path) > max_age:
+        return None
+    try:
+        return CorpusSnapshot(path)
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"⚠️ Snapshot do corpus inválido ({path}): {e}")
+        return None
+
+
+def carregar_corpus(loader: Callable[[], List[Dict[str, Any]]], path: str = CORPUS_SNAPSHOT_PATH,
+                    max_age: int = CORPUS_SNAPSHOT_MAX_AGE, refresh: bool = False) -> Sequence:
+    """
+    Corpus a partir do snapshot; baixa e grava um novo se não houver ou se expirou.
+
+    Args:
+        loader: Carrega o corpus da origem (ex.: IATabela._carregar_todas_fontes)
+        path: Arquivo do snapshot
+        max_age: Validade em segundos (0 = não expira)
+        refresh: Ignora o snapshot existente e baixa de novo
+
+    Returns:
+        Sequence: CorpusSnapshot, ou a lista do loader se não for possível gravar
+    """
+    snapshot = None if refresh else abrir_snapshot(path, max_age)
+    if snapshot is not None:
+        print(f"🗺️ Corpus mapeado de {path} ({len(snapshot)} documentos)")
+        return snapshot
+
+    rows = loader()
+    if not rows:
+        # Origem indisponível: um snapshot expirado é melhor que um corpus vazio
+        antigo = abrir_snapshot(path, max_age=0)
+        if antigo is not None:
+            print(f"⚠️ Corpus indisponível na origem; usando snapshot expirado ({len(antigo)} documentos)")
+            return antigo
+        return rows
+
+    try:
+        write_snapshot(path, rows)
+        print(f"💾 Snapshot do corpus gravado em {path} ({len(rows)} documentos)")
+        return CorpusSnapshot(path)
+    except OSError as e:
+        # Ex.: no Windows o arquivo não pode ser substituído enquanto outro processo o mapeia
+        print(f"⚠️ Não foi possível gravar o snapshot do corpus: {e}")
+        return rows
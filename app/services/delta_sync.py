@@ -0,0 +1,181 @@
+"""
+Sincronização incremental (delta) entre as coletas e o índice do Pinecone
+Mantém um manifesto com origem, hash do conteúdo e IDs dos vetores de cada lei,
+envia apenas o que foi adicionado ou alterado e remove os vetores de leis
+que saíram da fonte ou foram revogadas
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Tuple
+from langchain_core.documents import Document
+from app.services.lei_filter import is_revogado_por_metadados
+
+MANIFEST_PATH = os.getenv("INDEX_MANIFEST_PATH", "index_manifest.json")
+
+# Documentos enviados ao Pinecone por chamada
+UPSERT_BATCH_SIZE = 100
+
+
+def hash_documentos(documentos: List[Document]) -> str:
+    """Hash do conteúdo indexável (metadados voláteis, como datas, ficam de fora)"""
+    sha = hashlib.sha256()
+    for doc in documentos:
+        sha.update(doc.page_content.encode("utf-8"))
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+class IndexManifest:
+    """
+    Manifesto em JSON: escopo -> chave de origem -> {hash, vector_ids, ...}
+    Guarda também, por escopo, os vetores que ainda precisam ser apagados do índice
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self.data = {"version": 1, "escopos": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def escopo(self, nome: str) -> Dict[str, Dict]:
+        return self.data["escopos"].setdefault(nome, {})
+
+    def remocoes_pendentes(self, nome: str) -> List[str]:
+        """IDs de vetores já desligados do manifesto e ainda não apagados do índice"""
+        return self.data.setdefault("remocoes_pendentes", {}).setdefault(nome, [])
+
+    def save(self) -> None:
+        """Grava o manifesto de forma atômica"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class DeltaSync:
+    """Aplica no índice apenas a diferença entre a nova coleta e o manifesto"""
+
+    def __init__(self, vectorstore, escopo: str, manifest: IndexManifest = None):
+        self.vectorstore = vectorstore
+        self.escopo = escopo
+        self.manifest = manifest or IndexManifest()
+
+    def sync(self, itens: Iterable[Dict], chave: Callable[[Dict], str],
+             documentos: Callable[[Dict], Tuple[List[Document], List[str]]],
+             remove_missing: bool = False,
+             legado: Callable[[Dict], List[str]] = None) -> Dict[str, int]:
+        """
+        Sincroniza os itens coletados com o índice.
+
+        Args:
+            itens: Leis coletadas (dicts com titulo, descricao, conteudo, ...)
+            chave: Função que retorna a origem estável do item (URL do PDF ou título)
+            documentos: Função que monta (documentos, ids) de um item para indexação
+            remove_missing: Se a coleta foi completa, remove do índice o que não apareceu nela
+            legado: Função que retorna os IDs com que o item foi indexado antes do manifesto;
+                    são apagados quando o item entra no manifesto pela primeira vez
+
+        Returns:
+            Dict: Contagem de leis adicionadas, alteradas, inalteradas, revogadas e removidas
+        """
+        entradas = self.manifest.escopo(self.escopo)
+        # Vetores que saem do índice entram nesta lista no mesmo passo em que a lei
+        # muda no manifesto; se a remoção falhar, a próxima sincronização tenta de novo
+        remocoes = self.manifest.remocoes_pendentes(self.escopo)
+        stats = {"adicionadas": 0, "alteradas": 0, "inalteradas": 0, "revogadas": 0,
+                 "removidas": 0, "vetores_enviados": 0, "vetores_removidos": 0}
+        vistos = set()
+        pendentes_docs: List[Document] = []
+        pendentes_ids: List[str] = []
+        # O manifesto só muda depois que o Pinecone confirma: uma falha no meio deixa
+        # as leis afetadas com o estado anterior, e a próxima sincronização as refaz
+        pendentes_entradas: Dict[str, Dict] = {}
+        pendentes_obsoletos: List[str] = []
+        agora = datetime.now().isoformat()
+
+        def enviar_pendentes():
+            if pendentes_docs:
+                self.vectorstore.add_documents(list(pendentes_docs), ids=list(pendentes_ids))
+                stats["vetores_enviados"] += len(pendentes_docs)
+                entradas.update(pendentes_entradas)
+                remocoes.extend(pendentes_obsoletos)
+                pendentes_docs.clear()
+                pendentes_ids.clear()
+                pendentes_entradas.clear()
+                pendentes_obsoletos.clear()
+
+        try:
+            for item in itens:
+                origem = chave(item)
+                if not origem or origem in vistos:
+                    continue
+                vistos.add(origem)
+                anterior = entradas.get(origem)
+
+                # Leis revogadas saem do índice mesmo que continuem listadas na fonte
+                if is_revogado_por_metadados(item.get("titulo", ""), item.get("status", "")):
+                    if anterior:
+                        remocoes.extend(entradas.pop(origem)["vector_ids"])
+                        stats["revogadas"] += 1
+                    continue
+
+                docs, ids = documentos(item)
+                conteudo_hash = hash_documentos(docs)
+
+                if anterior and anterior["content_hash"] == conteudo_hash:
+                    stats["inalteradas"] += 1
+                    continue
+
+                stats["alteradas" if anterior else "adicionadas"] += 1
+                if anterior:
+                    pendentes_obsoletos.extend(set(anterior["vector_ids"]) - set(ids))
+                elif legado:
+                    pendentes_obsoletos.extend(set(legado(item)) - set(ids))
+
+                pendentes_docs.extend(docs)
+                pendentes_ids.extend(ids)
+                pendentes_entradas[origem] = {
+                    "titulo": item.get("titulo", ""),
+                    "content_hash": conteudo_hash,
+                    "vector_ids": ids,
+                    "updated_at": agora
+                }
+                if len(pendentes_docs) >= UPSERT_BATCH_SIZE:
+                    enviar_pendentes()
+
+            enviar_pendentes()
+
+            if remove_missing:
+                for origem in [origem for origem in entradas if origem not in vistos]:
+                    remocoes.extend(entradas.pop(origem)["vector_ids"])
+                    stats["removidas"] += 1
+
+            # Vetores ainda referenciados por outra lei (mesmo conteúdo) são preservados
+            ativos = {vector_id for entrada in entradas.values() for vector_id in entrada["vector_ids"]}
+            remocoes[:] = [vector_id for vector_id in dict.fromkeys(remocoes) if vector_id not in ativos]
+
+            # Cada lote sai da lista só depois que o Pinecone confirma a remoção
+            while remocoes:
+                lote = remocoes[:UPSERT_BATCH_SIZE]
+                self.vectorstore.delete(ids=lote)
+                del remocoes[:len(lote)]
+                stats["vetores_removidos"] += len(lote)
+        finally:
+            # Grava o que já foi confirmado, mesmo se a sincronização parou no meio
+            self.manifest.save()
+        return stats
+
+    @staticmethod
+    def imprimir_estatisticas(stats: Dict[str, int]) -> None:
+        """Mostra o resumo da sincronização"""
+        print(f"📊 Sincronização incremental:")
+        print(f"   - Adicionadas: {stats['adicionadas']}")
+        print(f"   - Alteradas: {stats['alteradas']}")
+        print(f"   - Inalteradas (sem reindexação): {stats['inalteradas']}")
+        print(f"   - Revogadas removidas: {stats['revogadas']}")
+        print(f"   - Ausentes na fonte removidas: {stats['removidas']}")
+        print(f"   - Vetores enviados/removidos: {stats['vetores_enviados']}/{stats['vetores_removidos']}")
@@ -1,20 +1,47 @@
 from typing import List, Dict, Optional
 from datetime import datetime
 import uuid
+import numpy as np
+from app.services.embedding_service import gerar_embedding, gerar_embeddings
+from app.services.document_store import DocumentStore
 
 class DocumentChatService:
     """
     Serviço para gerenciar contexto de documentos carregados e conversas baseadas em documentos.
     """
     
-    # Armazenamento em memória dos documentos processados
-    _documents: Dict[str, Dict] = {}
-    _document_chats: Dict[str, List[Dict]] = {}
-    # Mapeamento de conversation_id para document_id
-    _conversation_documents: Dict[str, str] = {}
+    # Documentos processados, históricos de chat e vínculos com conversas
+    # (memória limitada, com transbordo para disco e expiração)
+    _store = DocumentStore()
+    
+    @staticmethod
+    def embed_chunks(chunks: List[str]) -> Optional[np.ndarray]:
+        """
+        Gera a matriz de embeddings normalizados (uma linha por chunk) de um documento.
+        
+        Args:
+            chunks: Lista de chunks de texto do documento
+            
+        Returns:
+            np.ndarray: Matriz float32 (chunks x dimensões) ou None se a geração falhar
+        """
+        if not chunks:
+            return None
+        
+        try:
+            matrix = np.asarray(gerar_embeddings(chunks), dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Falha ao gerar embeddings do documento, usando busca por palavras: {e}")
+            return None
+        
+        # Normaliza as linhas: o produto escalar passa a ser a similaridade de cosseno
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
     
     @classmethod
-    def store_document(cls, document_id: str, filename: str, chunks: List[str]) -> str:
+    def store_document(cls, document_id: str, filename: str, chunks: List[str],
+                       embeddings: Optional[np.ndarray] = None) -> str:
         """
         Armazena um documento processado em chunks.
         
@@ -22,20 +49,21 @@ class DocumentChatService:
             document_id: ID único do documento
             filename: Nome do arquivo original
             chunks: Lista de chunks de texto extraídos do documento
+            embeddings: Matriz de embeddings normalizados dos chunks (ver embed_chunks)
             
         Returns:
             str: ID do documento armazenado
         """
-        cls._documents[document_id] = {
+        cls._store.put({
             'id': document_id,
             'filename': filename,
             'chunks': chunks,
+            # Versão em minúsculas para a busca por palavras (calculada uma única vez)
+            'chunks_lower': [chunk.lower() for chunk in chunks],
+            'embeddings': embeddings,
             'created_at': datetime.now().isoformat(),
             'total_chunks': len(chunks)
-        }
-        
-        # Inicializa lista de conversas para este documento
-        cls._document_chats[document_id] = []
+        })
         
         return document_id
     
@@ -50,14 +78,14 @@ class DocumentChatService:
         Returns:
             Dict: Informações do documento ou None se não encontrado
         """
-        return cls._documents.get(document_id)
+        return cls._store.get(document_id)
     
     @classmethod
     def search_relevant_chunks(cls, document_id: str, query: str, max_chunks: int = 3) -> List[str]:
         """
         Busca chunks relevantes do documento baseado na query.
-        Por simplicidade, retorna os primeiros chunks. Em uma implementação
-        mais avançada, usaria embeddings e similaridade semântica.
+        Usa similaridade de cosseno com os embeddings gerados no upload
+        (um produto matriz-vetor) e, se não houver embeddings, busca por palavras.
         
         Args:
             document_id: ID do documento
@@ -72,16 +100,35 @@ class DocumentChatService:
             return []
         
         chunks = document['chunks']
+        matrix = document.get('embeddings')
+        
+        if matrix is not None and len(chunks):
+            try:
+                query_vector = np.asarray(gerar_embedding(query), dtype=np.float32)
+                query_vector /= (np.linalg.norm(query_vector) or 1.0)
+                
+                scores = matrix @ query_vector
+                k = min(max_chunks, len(chunks))
+                best = np.argpartition(-scores, k - 1)[:k]
+                best = best[np.argsort(-scores[best])]
+                return [chunks[i] for i in best]
+            except Exception as e:
+                print(f"⚠️ Falha na busca por embeddings, usando busca por palavras: {e}")
         
-        # Implementação simples: busca por palavras-chave
-        query_words = query.lower().split()
+        return cls._search_by_keywords(document, query, max_chunks)
+    
+    @staticmethod
+    def _search_by_keywords(document: Dict, query: str, max_chunks: int) -> List[str]:
+        """Busca por palavras-chave sobre os chunks já em minúsculas"""
+        chunks = document['chunks']
+        chunks_lower = document.get('chunks_lower') or [chunk.lower() for chunk in chunks]
+        query_words = set(query.lower().split())
         scored_chunks = []
         
-        for i, chunk in enumerate(chunks):
-            chunk_lower = chunk.lower()
+        for i, chunk_lower in enumerate(chunks_lower):
             score = sum(1 for word in query_words if word in chunk_lower)
             if score > 0:
-                scored_chunks.append((score, i, chunk))
+                scored_chunks.append((score, i))
         
         # Ordena por relevância e retorna os melhores
         scored_chunks.sort(key=lambda x: x[0], reverse=True)
@@ -90,7 +137,7 @@ class DocumentChatService:
         if not scored_chunks:
             return chunks[:max_chunks]
         
-        return [chunk for _, _, chunk in scored_chunks[:max_chunks]]
+        return [chunks[i] for _, i in scored_chunks[:max_chunks]]
     
     @classmethod
     def add_chat_message(cls, document_id: str, role: str, content: str) -> None:
@@ -102,10 +149,7 @@ class DocumentChatService:
             role: 'user' ou 'assistant'
             content: Conteúdo da mensagem
         """
-        if document_id not in cls._document_chats:
-            cls._document_chats[document_id] = []
-        
-        cls._document_chats[document_id].append({
+        cls._store.add_chat_message(document_id, {
             'role': role,
             'content': content,
             'timestamp': datetime.now().isoformat()
@@ -122,7 +166,7 @@ class DocumentChatService:
         Returns:
             List[Dict]: Lista de mensagens do chat
         """
-        return cls._document_chats.get(document_id, [])
+        return cls._store.get_chat_history(document_id)
     
     @classmethod
     def build_context_prompt(cls, document_id: str, user_question: str) -> str:
@@ -161,20 +205,12 @@ Responda baseando-se exclusivamente no conteúdo do documento fornecido. Se a in
         Returns:
             List[Dict]: Lista de informações dos documentos
         """
-        return [
-            {
-                'id': doc_id,
-                'filename': doc['filename'],
-                'created_at': doc['created_at'],
-                'total_chunks': doc['total_chunks']
-            }
-            for doc_id, doc in cls._documents.items()
-        ]
+        return cls._store.list()
     
     @classmethod
     def delete_document(cls, document_id: str) -> bool:
         """
-        Remove um documento e seu histórico de chat.
+        Remove um documento, seu histórico de chat e os vínculos com conversas.
         
         Args:
             document_id: ID do documento
@@ -182,12 +218,17 @@ Responda baseando-se exclusivamente no conteúdo do documento fornecido. Se a in
         Returns:
             bool: True se removido com sucesso, False se não encontrado
         """
-        if document_id in cls._documents:
-            del cls._documents[document_id]
-            if document_id in cls._document_chats:
-                del cls._document_chats[document_id]
-            return True
-        return False
+        return cls._store.delete(document_id)
+    
+    @classmethod
+    def store_stats(cls) -> Dict:
+        """
+        Uso de memória e disco do armazenamento de documentos.
+        
+        Returns:
+            Dict: Documentos em memória/disco, bytes usados e limite
+        """
+        return cls._store.stats()
     
     @classmethod
     def generate_document_id(cls) -> str:
@@ -208,7 +249,20 @@ Responda baseando-se exclusivamente no conteúdo do documento fornecido. Se a in
             document_id: ID do documento
             conversation_id: ID da conversa
         """
-        cls._conversation_documents[conversation_id] = document_id
+        cls._store.link_conversation(conversation_id, document_id)
+    
+    @classmethod
+    def forget_conversations(cls, conversation_ids: List[str]) -> int:
+        """
+        Remove os vínculos de conversas excluídas com seus documentos.
+        
+        Args:
+            conversation_ids: IDs das conversas
+            
+        Returns:
+            int: Quantidade de vínculos removidos
+        """
+        return cls._store.unlink_conversations(conversation_ids)
     
     @classmethod
     def get_document_for_conversation(cls, conversation_id: str) -> Optional[Dict]:
@@ -221,7 +275,7 @@ Responda baseando-se exclusivamente no conteúdo do documento fornecido. Se a in
         Returns:
             Dict: Informações do documento ou None se não encontrado
         """
-        document_id = cls._conversation_documents.get(conversation_id)
+        document_id = cls._store.document_id_for_conversation(conversation_id)
         if document_id:
             return cls.get_document(document_id)
         return None
@@ -243,7 +297,7 @@ Responda baseando-se exclusivamente no conteúdo do documento fornecido. Se a in
         if not document:
             return None
         
-        document_id = cls._conversation_documents[conversation_id]
+        document_id = document['id']
         relevant_chunks = cls.search_relevant_chunks(document_id, query, max_chunks)
         
         if relevant_chunks:
@@ -0,0 +1,516 @@
+"""
+Armazenamento dos documentos enviados para chat, compartilhado entre workers
+Documentos, embeddings, históricos e vínculos com conversas ficam em um backend
+comum (SQLite em modo WAL ou Redis, via DOCUMENT_STORE_URL), gravados na hora
+(write-through). Cada processo mantém apenas um cache LRU limitado dos documentos
+mais usados. Documentos sem acesso além do TTL expiram com tudo o que depende deles.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+
+try:
+    import redis
+except ImportError:  # Backend Redis é opcional
+    redis = None
+
+# Orçamento de memória do cache local (bytes) e tempo de vida sem acesso (segundos)
+DOCUMENT_STORE_MAX_BYTES = int(os.getenv("DOCUMENT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+DOCUMENT_STORE_TTL = int(os.getenv("DOCUMENT_STORE_TTL", str(24 * 60 * 60)))
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", os.path.join(".cache", "documents.sqlite3"))
+
+# sqlite:///caminho/arquivo.sqlite3 ou redis://host:6379/0
+DOCUMENT_STORE_URL = os.getenv("DOCUMENT_STORE_URL", f"sqlite:///{DOCUMENT_STORE_PATH}")
+
+# Intervalo mínimo entre duas varreduras de expiração
+INTERVALO_EXPIRACAO = 60
+
+# Leituras de um documento em cache só renovam o TTL no backend depois deste intervalo
+DOCUMENT_STORE_TOUCH_INTERVAL = int(os.getenv("DOCUMENT_STORE_TOUCH_INTERVAL", "300"))
+
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    created_at TEXT,
+    last_access REAL,
+    total_chunks INTEGER,
+    chunks TEXT,
+    embeddings BLOB,
+    embedding_dim INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_documents_last_access ON documents (last_access);
+CREATE TABLE IF NOT EXISTS document_chats (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_id TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_document_chats_document ON document_chats (document_id);
+CREATE TABLE IF NOT EXISTS conversation_documents (
+    conversation_id TEXT PRIMARY KEY,
+    document_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversation_documents_document ON conversation_documents (document_id);
+"""
+
+
+def tamanho_documento(document: Dict) -> int:
+    """Estimativa do espaço ocupado em memória por um documento"""
+    texto = sum(len(chunk) + 64 for chunk in document.get('chunks', []))
+    # chunks + versão em minúsculas
+    total = 2 * texto
+    embeddings = document.get('embeddings')
+    if embeddings is not None:
+        total += embeddings.nbytes
+    return total + 512
+
+
+def _montar_documento(document_id: str, filename: str, created_at: str, chunks: List[str],
+                      blob: Optional[bytes], dim: Optional[int]) -> Dict:
+    embeddings = np.frombuffer(blob, dtype=np.float32).reshape(-1, int(dim)) if blob else None
+    return {
+        'id': document_id,
+        'filename': filename,
+        'chunks': chunks,
+        'chunks_lower': [chunk.lower() for chunk in chunks],
+        'embeddings': embeddings,
+        'created_at': created_at,
+        'total_chunks': len(chunks)
+    }
+
+
+def _embeddings_bytes(document: Dict):
+    embeddings = document.get('embeddings')
+    if embeddings is None:
+        return None, None
+    return np.ascontiguousarray(embeddings, dtype=np.float32).tobytes(), embeddings.shape[1]
+
+
+class SQLiteBackend:
+    """Backend em arquivo SQLite (modo WAL: vários processos leem e gravam o mesmo arquivo)"""
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            diretorio = os.path.dirname(self.path)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            # Migração em uma transação exclusiva: vários workers abrindo o arquivo ao mesmo
+            # tempo não descartam as tabelas um do outro nem veem o esquema pela metade
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    # Versão anterior era apenas transbordo local: pode ser descartada
+                    db.execute("DROP TABLE IF EXISTS documents")
+                    db.execute("DROP TABLE IF EXISTS conversation_documents")
+                    db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                # executescript faria COMMIT antes de rodar: comandos um a um
+                for comando in _SCHEMA.split(";"):
+                    if comando.strip():
+                        db.execute(comando)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                db.close()
+                raise
+            self._db = db
+        return self._db
+
+    def save_document(self, document: Dict) -> None:
+        blob, dim = _embeddings_bytes(document)
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM document_chats WHERE document_id = ?", (document['id'],))
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (document['id'], document['filename'], document['created_at'], time.time(),
+                     document['total_chunks'], json.dumps(document['chunks'], ensure_ascii=False), blob, dim)
+                )
+
+    def load_document(self, document_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT filename, created_at, chunks, embeddings, embedding_dim FROM documents WHERE id = ?",
+                (document_id,)
+            ).fetchone()
+        if not row:
+            return None
+        filename, created_at, chunks_json, blob, dim = row
+        return _montar_documento(document_id, filename, created_at, json.loads(chunks_json), blob, dim)
+
+    def exists(self, document_id: str) -> bool:
+        with self._lock:
+            return self._conn().execute("SELECT 1 FROM documents WHERE id = ?", (document_id,)).fetchone() is not None
+
+    def touch(self, document_id: str) -> bool:
+        """Renova o TTL do documento; False se ele não existe mais"""
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                cursor = conn.execute("UPDATE documents SET last_access = ? WHERE id = ?",
+                                      (time.time(), document_id))
+            return cursor.rowcount > 0
+
+    def delete_document(self, document_id: str) -> bool:
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                removido = conn.execute("DELETE FROM documents WHERE id = ?", (document_id,)).rowcount > 0
+                conn.execute("DELETE FROM document_chats WHERE document_id = ?", (document_id,))
+                conn.execute("DELETE FROM conversation_documents WHERE document_id = ?", (document_id,))
+            return removido
+
+    def list_documents(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT id, filename, created_at, total_chunks FROM documents ORDER BY created_at").fetchall()
+        return [{'id': r[0], 'filename': r[1], 'created_at': r[2], 'total_chunks': r[3]} for r in rows]
+
+    def count_documents(self) -> int:
+        with self._lock:
+            return self._conn().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def add_chat_message(self, document_id: str, message: Dict) -> None:
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("INSERT INTO document_chats (document_id, message) VALUES (?, ?)",
+                             (document_id, json.dumps(message, ensure_ascii=False)))
+
+    def get_chat_history(self, document_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT message FROM document_chats WHERE document_id = ? ORDER BY seq", (document_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def link_conversation(self, conversation_id: str, document_id: str) -> None:
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO conversation_documents VALUES (?, ?)",
+                             (conversation_id, document_id))
+
+    def document_id_for_conversation(self, conversation_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT document_id FROM conversation_documents WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def unlink_conversations(self, conversation_ids: List[str]) -> int:
+        removidos = 0
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                # Em lotes: o SQLite limita o número de parâmetros por comando
+                for inicio in range(0, len(conversation_ids), 500):
+                    lote = conversation_ids[inicio:inicio + 500]
+                    marcadores = ",".join("?" * len(lote))
+                    removidos += conn.execute(
+                        f"DELETE FROM conversation_documents WHERE conversation_id IN ({marcadores})", lote
+                    ).rowcount
+        return removidos
+
+    def expire(self) -> List[str]:
+        """Remove documentos sem acesso há mais que o TTL e retorna seus IDs"""
+        limite = time.time() - self.ttl
+        with self._lock:
+            expirados = [row[0] for row in self._conn().execute(
+                "SELECT id FROM documents WHERE last_access < ?", (limite,))]
+        for document_id in expirados:
+            self.delete_document(document_id)
+        return expirados
+
+
+class RedisBackend:
+    """Backend Redis (ou compatível): compartilhado entre workers e servidores"""
+
+    def __init__(self, url: str, ttl: int, prefix: str = "docchat"):
+        if redis is None:
+            raise RuntimeError("Instale o pacote redis para usar DOCUMENT_STORE_URL=redis://...")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def save_document(self, document: Dict) -> None:
+        blob, dim = _embeddings_bytes(document)
+        key = self._key("doc", document['id'])
+        mapping = {
+            'filename': document['filename'],
+            'created_at': document['created_at'],
+            'total_chunks': document['total_chunks'],
+            'chunks': json.dumps(document['chunks'], ensure_ascii=False)
+        }
+        if blob is not None:
+            mapping['embeddings'] = blob
+            mapping['embedding_dim'] = dim
+
+        pipe = self.client.pipeline()
+        pipe.delete(key, self._key("chats", document['id']))
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, self.ttl)
+        pipe.zadd(self._key("docs"), {document['id']: time.time()})
+        pipe.execute()
+
+    def load_document(self, document_id: str) -> Optional[Dict]:
+        data = self.client.hgetall(self._key("doc", document_id))
+        if not data:
+            return None
+        return _montar_documento(
+            document_id,
+            data[b'filename'].decode('utf-8'),
+            data[b'created_at'].decode('utf-8'),
+            json.loads(data[b'chunks']),
+            data.get(b'embeddings'),
+            data.get(b'embedding_dim')
+        )
+
+    def exists(self, document_id: str) -> bool:
+        return bool(self.client.exists(self._key("doc", document_id)))
+
+    def touch(self, document_id: str) -> bool:
+        pipe = self.client.pipeline()
+        pipe.expire(self._key("doc", document_id), self.ttl)
+        pipe.expire(self._key("chats", document_id), self.ttl)
+        pipe.expire(self._key("convs", document_id), self.ttl)
+        pipe.zadd(self._key("docs"), {document_id: time.time()}, xx=True)
+        existe = pipe.execute()[0]
+        return bool(existe)
+
+    def delete_document(self, document_id: str) -> bool:
+        conversas = self.client.smembers(self._key("convs", document_id))
+        pipe = self.client.pipeline()
+        pipe.delete(self._key("doc", document_id))
+        pipe.delete(self._key("chats", document_id), self._key("convs", document_id))
+        for conversation_id in conversas:
+            pipe.delete(self._key("conv", conversation_id.decode('utf-8')))
+        pipe.zrem(self._key("docs"), document_id)
+        return bool(pipe.execute()[0])
+
+    def list_documents(self) -> List[Dict]:
+        ids = [doc_id.decode('utf-8') for doc_id in self.client.zrange(self._key("docs"), 0, -1)]
+        pipe = self.client.pipeline()
+        for document_id in ids:
+            pipe.hmget(self._key("doc", document_id), 'filename', 'created_at', 'total_chunks')
+
+        documentos = []
+        for document_id, data in zip(ids, pipe.execute()):
+            if data[0] is None:
+                continue
+            documentos.append({
+                'id': document_id,
+                'filename': data[0].decode('utf-8'),
+                'created_at': data[1].decode('utf-8'),
+                'total_chunks': int(data[2])
+            })
+        return documentos
+
+    def count_documents(self) -> int:
+        return self.client.zcard(self._key("docs"))
+
+    def add_chat_message(self, document_id: str, message: Dict) -> None:
+        key = self._key("chats", document_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps(message, ensure_ascii=False))
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def get_chat_history(self, document_id: str) -> List[Dict]:
+        return [json.loads(item) for item in self.client.lrange(self._key("chats", document_id), 0, -1)]
+
+    def link_conversation(self, conversation_id: str, document_id: str) -> None:
+        pipe = self.client.pipeline()
+        pipe.set(self._key("conv", conversation_id), document_id, ex=self.ttl)
+        pipe.sadd(self._key("convs", document_id), conversation_id)
+        pipe.expire(self._key("convs", document_id), self.ttl)
+        pipe.execute()
+
+    def document_id_for_conversation(self, conversation_id: str) -> Optional[str]:
+        # Conversa em uso mantém o vínculo vivo pelo mesmo TTL do documento
+        key = self._key("conv", conversation_id)
+        pipe = self.client.pipeline()
+        pipe.get(key)
+        pipe.expire(key, self.ttl)
+        document_id = pipe.execute()[0]
+        return document_id.decode('utf-8') if document_id else None
+
+    def unlink_conversations(self, conversation_ids: List[str]) -> int:
+        if not conversation_ids:
+            return 0
+        document_ids = self.client.mget([self._key("conv", c) for c in conversation_ids])
+        pipe = self.client.pipeline()
+        for conversation_id, document_id in zip(conversation_ids, document_ids):
+            if document_id:
+                pipe.delete(self._key("conv", conversation_id))
+                pipe.srem(self._key("convs", document_id.decode('utf-8')), conversation_id)
+        pipe.execute()
+        return sum(1 for document_id in document_ids if document_id)
+
+    def expire(self) -> List[str]:
+        """As chaves expiram sozinhas no Redis; aqui só limpa o índice de documentos"""
+        limite = time.time() - self.ttl
+        expirados = [doc_id.decode('utf-8') for doc_id in
+                     self.client.zrangebyscore(self._key("docs"), 0, limite)]
+        for document_id in expirados:
+            self.delete_document(document_id)
+        return expirados
+
+
+def criar_backend(url: str = DOCUMENT_STORE_URL, ttl: int = DOCUMENT_STORE_TTL):
+    """Instancia o backend a partir da URL (sqlite:///arquivo ou redis://host/db)"""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url, ttl)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):], ttl)
+    raise ValueError(f"DOCUMENT_STORE_URL não suportada: {url}")
+
+
+class DocumentStore:
+    """Backend compartilhado com um cache LRU local limitado por bytes"""
+
+    def __init__(self, max_bytes: int = DOCUMENT_STORE_MAX_BYTES, backend=None):
+        self.max_bytes = max_bytes
+        self._backend = backend
+        self._lock = threading.RLock()
+        # document_id -> {'document', 'size', 'tocado' (último toque no backend)}
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._cache_bytes = 0
+        self._ultima_expiracao = 0.0
+
+    @property
+    def backend(self):
+        # Criado no primeiro uso: importar o módulo não abre arquivos nem conexões
+        if self._backend is None:
+            self._backend = criar_backend()
+        return self._backend
+
+    # ---------- Cache local ----------
+
+    def _cache_put(self, document: Dict) -> None:
+        self._cache_drop(document['id'])
+        size = tamanho_documento(document)
+        self._cache[document['id']] = {'document': document, 'size': size, 'tocado': time.time()}
+        self._cache_bytes += size
+        while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+            _, antigo = self._cache.popitem(last=False)
+            self._cache_bytes -= antigo['size']
+
+    def _cache_drop(self, document_id: str) -> None:
+        entry = self._cache.pop(document_id, None)
+        if entry:
+            self._cache_bytes -= entry['size']
+
+    def _expire(self) -> None:
+        with self._lock:
+            agora = time.time()
+            if agora - self._ultima_expiracao < INTERVALO_EXPIRACAO:
+                return
+            self._ultima_expiracao = agora
+
+        expirados = self.backend.expire()
+        with self._lock:
+            for document_id in expirados:
+                self._cache_drop(document_id)
+        if expirados:
+            print(f"🧹 {len(expirados)} documentos expirados removidos")
+
+    # ---------- API ----------
+    # O backend é chamado fora do lock: só o cache local é protegido por ele
+
+    def put(self, document: Dict) -> None:
+        """Armazena um documento novo (substitui se o ID já existir)"""
+        self._expire()
+        self.backend.save_document(document)
+        with self._lock:
+            self._cache_put(document)
+
+    def get(self, document_id: str) -> Optional[Dict]:
+        self._expire()
+        agora = time.time()
+        with self._lock:
+            entry = self._cache.get(document_id)
+            recente = entry is not None and agora - entry['tocado'] < DOCUMENT_STORE_TOUCH_INTERVAL
+
+        # Todo acerto confirma que nenhum outro worker removeu o documento; só a escrita
+        # que renova o TTL (o toque, que também confirma a existência) é espaçada
+        existe = self.backend.exists(document_id) if recente else self.backend.touch(document_id)
+        if not existe:
+            with self._lock:
+                self._cache_drop(document_id)
+            return None
+
+        with self._lock:
+            entry = self._cache.get(document_id)
+            if entry:
+                if not recente:
+                    entry['tocado'] = agora
+                self._cache.move_to_end(document_id)
+                return entry['document']
+
+        document = self.backend.load_document(document_id)
+        if document:
+            with self._lock:
+                self._cache_put(document)
+        return document
+
+    def add_chat_message(self, document_id: str, message: Dict) -> None:
+        if self.backend.touch(document_id):
+            self.backend.add_chat_message(document_id, message)
+
+    def get_chat_history(self, document_id: str) -> List[Dict]:
+        return self.backend.get_chat_history(document_id)
+
+    def delete(self, document_id: str) -> bool:
+        """Remove o documento, seu histórico e os vínculos com conversas"""
+        with self._lock:
+            self._cache_drop(document_id)
+        return self.backend.delete_document(document_id)
+
+    def list(self) -> List[Dict]:
+        """Resumo de todos os documentos do backend"""
+        self._expire()
+        return self.backend.list_documents()
+
+    def link_conversation(self, conversation_id: str, document_id: str) -> None:
+        """Associa o documento a uma conversa"""
+        self.backend.link_conversation(conversation_id, document_id)
+
+    def document_id_for_conversation(self, conversation_id: str) -> Optional[str]:
+        return self.backend.document_id_for_conversation(conversation_id)
+
+    def unlink_conversations(self, conversation_ids: List[str]) -> int:
+        """Remove os vínculos das conversas com documentos e retorna quantos existiam"""
+        return self.backend.unlink_conversations(list(conversation_ids))
+
+    def stats(self) -> Dict:
+        """Uso do cache local e total de documentos no backend"""
+        total = self.backend.count_documents()
+        with self._lock:
+            return {
+                'backend': type(self.backend).__name__,
+                'documents_in_memory': len(self._cache),
+                'memory_bytes': self._cache_bytes,
+                'max_bytes': self.max_bytes,
+                'documents_in_backend': total
+            }
@@ -1,17 +1,25 @@
-import openai
 import os
+from typing import List
 from dotenv import load_dotenv
 from pathlib import Path
+from app.services.tokens import EMBEDDING_MODEL
+from app.services.openai_clients import create_embeddings
 
 # Garante que o .env da raiz seja carregado corretamente
 load_dotenv(dotenv_path=Path('.') / '.env')
 
-# Inicializa o cliente com a chave da API
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Textos enviados por requisição ao gerar embeddings em lote
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
 
 def gerar_embedding(texto: str) -> list:
-    response = client.embeddings.create(
-        input=texto,
-        model="text-embedding-3-small"
-    )
+    # Cliente compartilhado (pool HTTP e fila do modelo em openai_clients)
+    response = create_embeddings(EMBEDDING_MODEL, texto)
     return response.data[0].embedding
+
+def gerar_embeddings(textos: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[list]:
+    """Gera embeddings de vários textos com uma requisição por lote (mesma ordem da entrada)"""
+    embeddings = []
+    for inicio in range(0, len(textos), batch_size):
+        response = create_embeddings(EMBEDDING_MODEL, textos[inicio:inicio + batch_size])
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
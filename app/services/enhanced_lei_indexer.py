@@ -3,12 +3,14 @@ Indexador aprimorado que coleta PDFs completos das leis ambientais
 e os indexa no Pinecone para consultas mais precisas
 """
 
-import json
 import os
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Iterable, Tuple
 from app.services.pdf_lei_service import PDFLeiCollector
 from app.services.indexar import vectorstore, gerar_id_unico
+from app.services.delta_sync import DeltaSync
+from app.services.legal_chunker import legal_chunker
+from app.services.ndjson_store import caminho_ndjson, eh_arquivo_de_registros, iter_records, write_records
 from langchain_core.documents import Document
 
 class EnhancedLeiIndexer:
@@ -17,14 +19,18 @@ class EnhancedLeiIndexer:
     def __init__(self):
         self.collector = PDFLeiCollector()
         self.vectorstore = vectorstore
+        self.delta_sync = DeltaSync(vectorstore, escopo="leis_estaduais_pdf")
     
-    def collect_and_index_pdf_laws(self, max_pages: int = 250, save_backup: bool = True):
+    def collect_and_index_pdf_laws(self, max_pages: int = 250, save_backup: bool = True,
+                                   remove_missing: bool = False):
         """
         Coleta leis ambientais com PDFs e indexa no Pinecone
         
         Args:
             max_pages: Número máximo de páginas para processar
             save_backup: Se deve salvar backup em JSON
+            remove_missing: Remove do índice as leis que não aparecem mais na fonte
+                            (só faz sentido em coletas completas)
         """
         print("=== INICIANDO COLETA E INDEXAÇÃO DE LEIS COM PDFs ===")
         
@@ -41,56 +47,19 @@ class EnhancedLeiIndexer:
         # 2. Salva backup se solicitado
         if save_backup:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_file = f"tests/leis_pdf_backup_{timestamp}.json"
-            
-            with open(backup_file, "w", encoding="utf-8") as f:
-                json.dump(leis_coletadas, f, ensure_ascii=False, indent=2)
+            backup_file = caminho_ndjson(f"tests/leis_pdf_backup_{timestamp}")
+            write_records(backup_file, leis_coletadas)
             
             print(f"Backup salvo em: {backup_file}")
         
-        # 3. Prepara documentos para indexação
-        print("Preparando documentos para indexação...")
-        documentos = []
-        ids = []
-        
-        for lei in leis_coletadas:
-            # Cria conteúdo completo
-            conteudo_completo = f"""TÍTULO: {lei['titulo']}
-
-DESCRIÇÃO: {lei['descricao']}
-
-CONTEÚDO COMPLETO:
-{lei['conteudo']}"""
-            
-            # Cria metadados enriquecidos
-            metadata = {
-                "titulo": lei['titulo'],
-                "descricao": lei['descricao'],
-                "fonte": lei['fonte'],
-                "tipo": "lei_estadual_tocantins",
-                "categoria": "ambiental",
-                "pdf_links": lei.get('pdf_links', []),
-                "tamanho_conteudo": len(lei['conteudo']),
-                "data_indexacao": datetime.now().isoformat()
-            }
-            
-            # Gera ID único
-            doc_id = gerar_id_unico(conteudo_completo)
-            
-            # Cria documento
-            doc = Document(
-                page_content=conteudo_completo,
-                metadata=metadata
-            )
-            
-            documentos.append(doc)
-            ids.append(doc_id)
-        
-        # 4. Indexa no Pinecone
-        print("Indexando documentos no Pinecone...")
+        # 3. Indexa apenas o que mudou desde a última coleta
+        print("Sincronizando leis com o Pinecone...")
         try:
-            self.vectorstore.add_documents(documentos, ids=ids)
-            print(f"✅ {len(documentos)} leis indexadas com sucesso!")
+            stats = self.delta_sync.sync(
+                leis_coletadas, chave=self.chave_lei, documentos=self.documentos_da_lei,
+                remove_missing=remove_missing, legado=self.ids_legados
+            )
+            DeltaSync.imprimir_estatisticas(stats)
             
             # Estatísticas
             leis_com_pdf = sum(1 for lei in leis_coletadas if lei['fonte'] == 'PDF')
@@ -99,20 +68,65 @@ CONTEÚDO COMPLETO:
             print(f"📊 Estatísticas:")
             print(f"   - Leis com PDF completo: {leis_com_pdf}")
             print(f"   - Leis apenas com HTML: {leis_sem_pdf}")
-            print(f"   - Total indexado: {len(documentos)}")
+            print(f"   - Total coletado: {len(leis_coletadas)}")
             
-            return len(documentos)
+            return stats['adicionadas'] + stats['alteradas']
             
         except Exception as e:
             print(f"❌ Erro ao indexar documentos: {e}")
             return 0
     
+    @staticmethod
+    def chave_lei(lei: Dict) -> str:
+        """Origem estável da lei no manifesto: URL do PDF ou, na falta dela, o título"""
+        pdf_links = lei.get('pdf_links') or []
+        return sorted(pdf_links)[0] if pdf_links else lei['titulo']
+    
+    @staticmethod
+    def documentos_da_lei(lei: Dict) -> Tuple[List[Document], List[str]]:
+        """Divide a lei em chunks por dispositivo e monta os documentos (e IDs determinísticos)"""
+        # Cria metadados enriquecidos
+        metadata = {
+            "titulo": lei['titulo'],
+            "descricao": lei['descricao'],
+            "fonte": lei.get('fonte', 'HTML'),
+            "tipo": "lei_estadual_tocantins",
+            "categoria": "ambiental",
+            "pdf_links": lei.get('pdf_links', []),
+            "tamanho_conteudo": len(lei['conteudo']),
+            "data_indexacao": datetime.now().isoformat()
+        }
+        
+        texto = f"""DESCRIÇÃO: {lei['descricao']}
+
+CONTEÚDO COMPLETO:
+{lei['conteudo']}"""
+        
+        chunks = list(legal_chunker.iter_chunks(texto, cabecalho=f"TÍTULO: {lei['titulo']}", metadata=metadata))
+        documentos = [
+            Document(page_content=chunk['text'], metadata={**chunk['metadata'], "total_chunks": len(chunks)})
+            for chunk in chunks
+        ]
+        return documentos, [gerar_id_unico(doc.page_content) for doc in documentos]
+    
+    @staticmethod
+    def ids_legados(lei: Dict) -> List[str]:
+        """ID do vetor único por lei usado antes da divisão em chunks (apagado na primeira sincronização)"""
+        conteudo_completo = f"""TÍTULO: {lei['titulo']}
+
+DESCRIÇÃO: {lei['descricao']}
+
+CONTEÚDO COMPLETO:
+{lei['conteudo']}"""
+        return [gerar_id_unico(conteudo_completo)]
+    
     def update_existing_laws(self):
         """Atualiza leis existentes com conteúdo completo dos PDFs"""
         print("=== ATUALIZANDO LEIS EXISTENTES COM PDFs ===")
         
         # Carrega leis existentes do backup mais recente
-        backup_files = [f for f in os.listdir("tests") if f.startswith("leis_pdf_backup_")]
+        backup_files = [f for f in os.listdir("tests")
+                        if f.startswith("leis_pdf_backup_") and eh_arquivo_de_registros(f)]
         
         if not backup_files:
             print("Nenhum backup encontrado. Execute collect_and_index_pdf_laws primeiro.")
@@ -124,47 +138,20 @@ CONTEÚDO COMPLETO:
         
         print(f"Carregando backup: {backup_path}")
         
-        with open(backup_path, "r", encoding="utf-8") as f:
-            leis_coletadas = json.load(f)
-        
-        return self.index_laws_from_data(leis_coletadas)
+        # O backup é lido sob demanda direto para a sincronização
+        return self.index_laws_from_data(iter_records(backup_path))
     
-    def index_laws_from_data(self, leis_data: List[Dict]) -> int:
-        """Indexa leis a partir de dados já coletados"""
-        print(f"Indexando {len(leis_data)} leis...")
-        
-        documentos = []
-        ids = []
-        
-        for lei in leis_data:
-            conteudo_completo = f"""TÍTULO: {lei['titulo']}
-
-DESCRIÇÃO: {lei['descricao']}
-
-CONTEÚDO COMPLETO:
-{lei['conteudo']}"""
-            
-            metadata = {
-                "titulo": lei['titulo'],
-                "descricao": lei['descricao'],
-                "fonte": lei.get('fonte', 'HTML'),
-                "tipo": "lei_estadual_tocantins",
-                "categoria": "ambiental",
-                "pdf_links": lei.get('pdf_links', []),
-                "tamanho_conteudo": len(lei['conteudo']),
-                "data_indexacao": datetime.now().isoformat()
-            }
-            
-            doc_id = gerar_id_unico(conteudo_completo)
-            doc = Document(page_content=conteudo_completo, metadata=metadata)
-            
-            documentos.append(doc)
-            ids.append(doc_id)
+    def index_laws_from_data(self, leis_data: Iterable[Dict], remove_missing: bool = False) -> int:
+        """Indexa leis a partir de dados já coletados (apenas as novas ou alteradas)"""
+        print("Sincronizando leis...")
         
         try:
-            self.vectorstore.add_documents(documentos, ids=ids)
-            print(f"✅ {len(documentos)} leis indexadas com sucesso!")
-            return len(documentos)
+            stats = self.delta_sync.sync(
+                leis_data, chave=self.chave_lei, documentos=self.documentos_da_lei,
+                remove_missing=remove_missing, legado=self.ids_legados
+            )
+            DeltaSync.imprimir_estatisticas(stats)
+            return stats['adicionadas'] + stats['alteradas']
         except Exception as e:
             print(f"❌ Erro ao indexar: {e}")
             return 0
@@ -181,7 +168,7 @@ def main():
     opcao = input("Digite sua opção (1-3): ")
     
     if opcao == "1":
-        return indexer.collect_and_index_pdf_laws(max_pages=250)
+        return indexer.collect_and_index_pdf_laws(max_pages=250, remove_missing=True)
     elif opcao == "2":
         return indexer.collect_and_index_pdf_laws(max_pages=5)
     elif opcao == "3":
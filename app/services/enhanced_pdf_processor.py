@@ -5,9 +5,9 @@ e enriquece o conteúdo das leis existentes
 
 import sys
 import os
-import json
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator
 import re
 
 # Adicionar o diretório raiz ao path
@@ -16,31 +16,44 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 try:
     from app.services.indexar import vectorstore, gerar_id_unico
     from app.services.leis_html_service import contem_palavra_chave
+    from app.services.ndjson_store import iter_records, resolver_arquivo, caminho_ndjson, NDJSONWriter
 except ImportError:
     # Fallback para execução direta
     sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
     from app.services.indexar import vectorstore, gerar_id_unico
     from app.services.leis_html_service import contem_palavra_chave
+    from app.services.ndjson_store import iter_records, resolver_arquivo, caminho_ndjson, NDJSONWriter
 
 from langchain_core.documents import Document
+from app.services.delta_sync import DeltaSync
+from app.services.legal_chunker import legal_chunker
 
 class EnhancedPDFProcessor:
     """Processador que enriquece leis existentes simulando leitura de PDFs"""
     
     def __init__(self):
         self.vectorstore = vectorstore
+        self.delta_sync = DeltaSync(vectorstore, escopo="leis_enriquecidas")
         self.leis_file = "tests/leis.json"
+        # Arquivo e totais da última execução (preenchidos enquanto as leis são consumidas)
+        self.output_file = None
+        self.totais = {"leis": 0, "tamanho_original": 0, "tamanho_enriquecido": 0}
     
-    def load_existing_laws(self) -> List[Dict]:
-        """Carrega leis existentes do arquivo JSON"""
-        if not os.path.exists(self.leis_file):
+    def iter_existing_laws(self):
+        """Lê as leis existentes sob demanda (prefere a versão NDJSON do arquivo)"""
+        leis_path = resolver_arquivo(self.leis_file)
+        if not leis_path:
             print(f"Arquivo {self.leis_file} não encontrado.")
-            return []
+            return
         
-        with open(self.leis_file, "r", encoding="utf-8") as f:
-            leis = json.load(f)
+        yield from iter_records(leis_path)
+    
+    def load_existing_laws(self) -> List[Dict]:
+        """Carrega leis existentes do arquivo JSON"""
+        leis = list(self.iter_existing_laws())
         
-        print(f"Carregadas {len(leis)} leis ambientais existentes")
+        if leis:
+            print(f"Carregadas {len(leis)} leis ambientais existentes")
         return leis
     
     def enhance_law_content(self, lei: Dict) -> Dict:
@@ -174,102 +187,118 @@ Art. Final - Revogam-se as disposições em contrário.
 
 Art. Final - O Poder Executivo regulamentará esta Lei no prazo de 90 (noventa) dias."""
     
-    def process_all_laws(self) -> List[Dict]:
-        """Processa todas as leis existentes"""
+    def process_all_laws(self) -> Iterator[Dict]:
+        """Processa as leis existentes sob demanda: cada lei enriquecida é gravada e devolvida"""
         print("=== PROCESSANDO LEIS EXISTENTES ===")
         
-        leis_originais = self.load_existing_laws()
-        if not leis_originais:
-            return []
-        
-        leis_processadas = []
-        
-        for i, lei in enumerate(leis_originais):
-            print(f"Processando lei {i+1}/{len(leis_originais)}: {lei['titulo'][:60]}...")
-            
-            lei_enriquecida = self.enhance_law_content(lei)
-            leis_processadas.append(lei_enriquecida)
-            
-            print(f"✅ Conteúdo expandido de {lei_enriquecida['tamanho_original']} para {lei_enriquecida['tamanho_enriquecido']} caracteres")
-        
-        # Salva resultado
+        # Cada lei enriquecida é gravada assim que fica pronta
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f"tests/leis_enriquecidas_{timestamp}.json"
-        
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(leis_processadas, f, ensure_ascii=False, indent=2)
-        
-        print(f"\n✅ {len(leis_processadas)} leis processadas e salvas em {output_file}")
+        output_file = caminho_ndjson(f"tests/leis_enriquecidas_{timestamp}")
+        self.output_file = output_file
+        
+        processadas = 0
+        
+        with NDJSONWriter(output_file) as writer:
+            for i, lei in enumerate(self.iter_existing_laws()):
+                print(f"Processando lei {i+1}: {lei['titulo'][:60]}...")
+                
+                lei_enriquecida = self.enhance_law_content(lei)
+                writer.write(lei_enriquecida)
+                processadas += 1
+                
+                print(f"✅ Conteúdo expandido de {lei_enriquecida['tamanho_original']} para {lei_enriquecida['tamanho_enriquecido']} caracteres")
+                yield lei_enriquecida
+        
+        if not processadas:
+            os.remove(output_file)
+            self.output_file = None
+            return
+        
+        print(f"\n✅ {processadas} leis processadas e salvas em {output_file}")
+    
+    @staticmethod
+    def documentos_lei_enriquecida(lei: Dict):
+        """Divide a lei enriquecida em chunks por dispositivo e monta os documentos (e IDs)"""
+        # Metadados enriquecidos
+        metadata = {
+            "titulo": lei['titulo'],
+            "descricao": lei['descricao'],
+            "fonte": lei['fonte'],
+            "tipo": "lei_estadual_tocantins",
+            "categoria": "ambiental",
+            "tamanho_original": lei.get('tamanho_original', 0),
+            "tamanho_enriquecido": lei.get('tamanho_enriquecido', 0),
+            "data_processamento": lei.get('data_processamento', ''),
+            "data_indexacao": datetime.now().isoformat()
+        }
+        
+        texto = f"""DESCRIÇÃO: {lei['descricao']}
+
+CONTEÚDO COMPLETO DA LEI:
+{lei['conteudo']}"""
         
-        return leis_processadas
+        chunks = list(legal_chunker.iter_chunks(texto, cabecalho=f"TÍTULO: {lei['titulo']}", metadata=metadata))
+        documentos = [
+            Document(page_content=chunk['text'], metadata={**chunk['metadata'], "total_chunks": len(chunks)})
+            for chunk in chunks
+        ]
+        return documentos, [gerar_id_unico(doc.page_content) for doc in documentos]
+    
+    @staticmethod
+    def ids_legados(lei: Dict) -> List[str]:
+        """ID do vetor único por lei usado antes da divisão em chunks (apagado na primeira sincronização)"""
+        conteudo_indexacao = f"""TÍTULO: {lei['titulo']}
+
+DESCRIÇÃO: {lei['descricao']}
+
+CONTEÚDO COMPLETO DA LEI:
+{lei['conteudo']}"""
+        return [gerar_id_unico(conteudo_indexacao)]
     
-    def index_enhanced_laws(self, leis_processadas: List[Dict] = None) -> int:
-        """Indexa as leis enriquecidas no Pinecone"""
+    def index_enhanced_laws(self, leis_processadas: Iterable[Dict] = None) -> int:
+        """Indexa as leis enriquecidas no Pinecone (processando-as sob demanda se não forem dadas)"""
         if leis_processadas is None:
             leis_processadas = self.process_all_laws()
         
-        if not leis_processadas:
-            print("Nenhuma lei para indexar.")
-            return 0
+        # Totais acumulados enquanto a sincronização consome as leis
+        totais = {"leis": 0, "tamanho_original": 0, "tamanho_enriquecido": 0}
+        self.totais = totais
         
-        print("\n=== INDEXANDO LEIS ENRIQUECIDAS NO PINECONE ===")
+        def contar(leis: Iterable[Dict]) -> Iterator[Dict]:
+            for lei in leis:
+                totais["leis"] += 1
+                totais["tamanho_original"] += lei.get('tamanho_original', 0)
+                totais["tamanho_enriquecido"] += lei.get('tamanho_enriquecido', 0)
+                yield lei
         
-        documentos = []
-        ids = []
+        print("\n=== INDEXANDO LEIS ENRIQUECIDAS NO PINECONE ===")
         
-        for lei in leis_processadas:
-            # Cria conteúdo completo para indexação
-            conteudo_indexacao = f"""TÍTULO: {lei['titulo']}
-
-DESCRIÇÃO: {lei['descricao']}
-
-CONTEÚDO COMPLETO DA LEI:
-{lei['conteudo']}"""
-            
-            # Metadados enriquecidos
-            metadata = {
-                "titulo": lei['titulo'],
-                "descricao": lei['descricao'],
-                "fonte": lei['fonte'],
-                "tipo": "lei_estadual_tocantins",
-                "categoria": "ambiental",
-                "tamanho_original": lei.get('tamanho_original', 0),
-                "tamanho_enriquecido": lei.get('tamanho_enriquecido', 0),
-                "data_processamento": lei.get('data_processamento', ''),
-                "data_indexacao": datetime.now().isoformat()
-            }
-            
-            # Gera ID único
-            doc_id = gerar_id_unico(conteudo_indexacao)
+        try:
+            # Envia apenas leis novas ou alteradas desde a última indexação
+            print("Sincronizando documentos...")
             
-            # Cria documento
-            doc = Document(
-                page_content=conteudo_indexacao,
-                metadata=metadata
+            stats = self.delta_sync.sync(
+                contar(leis_processadas), chave=lambda lei: lei['titulo'],
+                documentos=self.documentos_lei_enriquecida, legado=self.ids_legados
             )
             
-            documentos.append(doc)
-            ids.append(doc_id)
-        
-        try:
-            # Remove documentos antigos das leis do Tocantins (opcional)
-            print("Indexando documentos...")
+            if not totais["leis"]:
+                print("Nenhuma lei para indexar.")
+                return 0
             
-            self.vectorstore.add_documents(documentos, ids=ids)
-            
-            print(f"✅ {len(documentos)} leis enriquecidas indexadas com sucesso!")
+            DeltaSync.imprimir_estatisticas(stats)
             
             # Estatísticas
-            tamanho_total_original = sum(lei.get('tamanho_original', 0) for lei in leis_processadas)
-            tamanho_total_enriquecido = sum(lei.get('tamanho_enriquecido', 0) for lei in leis_processadas)
+            tamanho_total_original = totais["tamanho_original"]
+            tamanho_total_enriquecido = totais["tamanho_enriquecido"]
             
             print(f"\n📊 Estatísticas:")
-            print(f"   - Total de leis: {len(leis_processadas)}")
+            print(f"   - Total de leis: {totais['leis']}")
             print(f"   - Conteúdo original: {tamanho_total_original:,} caracteres")
             print(f"   - Conteúdo enriquecido: {tamanho_total_enriquecido:,} caracteres")
             print(f"   - Expansão: {((tamanho_total_enriquecido/tamanho_total_original - 1) * 100):.1f}%")
             
-            return len(documentos)
+            return stats['adicionadas'] + stats['alteradas']
             
         except Exception as e:
             print(f"❌ Erro ao indexar documentos: {e}")
@@ -282,25 +311,24 @@ def main():
     print("=== PROCESSADOR APRIMORADO DE LEIS AMBIENTAIS ===")
     print("Este processador enriquece as leis existentes simulando leitura completa de PDFs")
     
-    # Processa e indexa as leis
-    leis_processadas = processor.process_all_laws()
+    # Processa e indexa as leis em um único passe (sem manter todas em memória)
+    indexadas = processor.index_enhanced_laws()
+    total = processor.totais["leis"]
     
-    if leis_processadas:
-        # Indexa no Pinecone
-        indexadas = processor.index_enhanced_laws(leis_processadas)
-        
+    if total:
         print(f"\n🎉 Processo concluído!")
-        print(f"📋 {len(leis_processadas)} leis processadas")
+        print(f"📋 {total} leis processadas")
         print(f"🔍 {indexadas} leis indexadas no Pinecone")
         
-        # Mostra exemplos
-        print(f"\n📋 Exemplos de leis processadas:")
-        for i, lei in enumerate(leis_processadas[:3]):
-            print(f"{i+1}. {lei['titulo'][:80]}...")
-            print(f"   Fonte: {lei['fonte']}")
-            print(f"   Tamanho: {lei['tamanho_original']} → {lei['tamanho_enriquecido']} caracteres")
+        # Mostra exemplos (relidos do NDJSON gravado)
+        if processor.output_file:
+            print(f"\n📋 Exemplos de leis processadas:")
+            for i, lei in enumerate(islice(iter_records(processor.output_file), 3)):
+                print(f"{i+1}. {lei['titulo'][:80]}...")
+                print(f"   Fonte: {lei['fonte']}")
+                print(f"   Tamanho: {lei['tamanho_original']} → {lei['tamanho_enriquecido']} caracteres")
     
-    return leis_processadas
+    return total
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Cache HTTP em disco para os coletores
+Guarda respostas por URL, revalida com If-None-Match/If-Modified-Since
+(304 reaproveita o corpo salvo) e mantém o texto extraído dos PDFs
+indexado pelo hash do conteúdo
+"""
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(".cache", "http"))
+
+
+def hash_conteudo(content: bytes) -> str:
+    """SHA-256 do conteúdo (chave do cache de texto extraído)"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def _escrever_atomico(path: str, data, mode: str = "wb") -> None:
+    """Escreve em arquivo temporário único e renomeia (seguro entre threads e processos)"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    encoding = None if "b" in mode else "utf-8"
+    with open(tmp_path, mode, encoding=encoding) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class CachedResponse:
+    """Resposta vinda da rede ou do cache, com a mesma interface mínima para os coletores"""
+
+    def __init__(self, url: str, content: bytes, headers: Dict[str, str], status_code: int = 200,
+                 from_cache: bool = False, changed: bool = True):
+        self.url = url
+        self.content = content
+        self.headers = headers
+        self.status_code = status_code
+        self.from_cache = from_cache
+        # False quando o servidor respondeu 304 (conteúdo igual ao da última coleta)
+        self.changed = changed
+
+    @property
+    def text(self) -> str:
+        encoding = 'utf-8'
+        content_type = self.headers.get('content-type', '')
+        if 'charset=' in content_type:
+            encoding = content_type.split('charset=')[-1].split(';')[0].strip() or encoding
+        return self.content.decode(encoding, errors='replace')
+
+    @property
+    def content_hash(self) -> str:
+        return hash_conteudo(self.content)
+
+
+class HTTPCache:
+    """Armazena respostas em disco por URL e faz requisições condicionais"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.responses_dir = os.path.join(cache_dir, "responses")
+        self.texts_dir = os.path.join(cache_dir, "pdf_text")
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.responses_dir, key)
+        return base + ".json", base + ".body"
+
+    def load(self, url: str) -> Optional[CachedResponse]:
+        """Retorna a resposta salva para a URL, se houver"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+        return CachedResponse(url, content, meta.get("headers", {}), from_cache=True, changed=False)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Cabeçalhos de revalidação para a URL (vazio se não estiver em cache)"""
+        meta_path, _ = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                headers = json.load(f).get("headers", {})
+        except (OSError, ValueError):
+            return {}
+
+        conditional = {}
+        if headers.get("etag"):
+            conditional["If-None-Match"] = headers["etag"]
+        if headers.get("last-modified"):
+            conditional["If-Modified-Since"] = headers["last-modified"]
+        return conditional
+
+    def store(self, url: str, content: bytes, headers) -> CachedResponse:
+        """Salva a resposta em disco (escrita atômica) e a retorna"""
+        headers = {k.lower(): v for k, v in dict(headers).items()
+                   if k.lower() in ("etag", "last-modified", "content-type")}
+        meta_path, body_path = self._paths(url)
+        meta = {
+            "url": url,
+            "headers": headers,
+            "content_hash": hash_conteudo(content),
+            "stored_at": datetime.now().isoformat()
+        }
+
+        with self._lock:
+            os.makedirs(self.responses_dir, exist_ok=True)
+            _escrever_atomico(body_path, content)
+            _escrever_atomico(meta_path, json.dumps(meta, ensure_ascii=False), "w")
+
+        return CachedResponse(url, content, headers)
+
+    def get(self, session, url: str, timeout: int = 30, **kwargs) -> CachedResponse:
+        """
+        GET condicional com uma requests.Session.
+        Em 304 devolve o corpo salvo (changed=False); em erro de rede, usa o cache se existir.
+        """
+        cached = self.load(url)
+        headers = {**kwargs.pop("headers", {}), **(self.conditional_headers(url) if cached else {})}
+
+        try:
+            response = session.get(url, timeout=timeout, headers=headers, **kwargs)
+        except Exception:
+            if cached:
+                print(f"Falha de rede, usando cache: {url}")
+                return cached
+            raise
+
+        if response.status_code == 304 and cached:
+            return cached
+
+        response.raise_for_status()
+        return self.store(url, response.content, response.headers)
+
+    def get_pdf_text(self, content_hash: str) -> Optional[str]:
+        """Texto já extraído de um PDF com este hash"""
+        try:
+            with open(os.path.join(self.texts_dir, content_hash + ".txt"), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put_pdf_text(self, content_hash: str, text: str) -> None:
+        """Guarda o texto extraído de um PDF pelo hash do conteúdo"""
+        os.makedirs(self.texts_dir, exist_ok=True)
+        _escrever_atomico(os.path.join(self.texts_dir, content_hash + ".txt"), text, "w")
+
+    def pdf_text(self, content: bytes, extrair: Callable[[bytes], str]) -> str:
+        """Retorna o texto do PDF, extraindo apenas se este conteúdo ainda não foi visto"""
+        content_hash = hash_conteudo(content)
+        text = self.get_pdf_text(content_hash)
+        if text is None:
+            text = extrair(content)
+            if text:
+                self.put_pdf_text(content_hash, text)
+        return text
+
+
+# Instância compartilhada pelos coletores
+http_cache = HTTPCache()
@@ -1,15 +1,11 @@
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
-from langchain_pinecone import PineconeVectorStore
-import os
 import hashlib
 
 from dotenv import load_dotenv
 load_dotenv()
 
-index_name = os.getenv("PINECONE_INDEX_NAME", "leis-ambientais")
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-vectorstore = PineconeVectorStore(index_name=index_name, embedding=embeddings)
+# Mesmo par embeddings/vectorstore do pinecone_service (criados no primeiro uso)
+from app.services.pinecone_service import index_name, embeddings, vectorstore
 
 def gerar_id_unico(texto: str) -> str:
     """Gera um hash MD5 a partir do texto para usar como ID único."""
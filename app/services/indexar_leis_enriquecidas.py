@@ -4,31 +4,38 @@ Script para indexar leis ambientais enriquecidas no Pinecone
 
 import sys
 import os
-import json
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 
 # Adicionar o diretório raiz ao path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 try:
     from app.services.indexar import vectorstore, gerar_id_unico
+    from app.services.ndjson_store import iter_records, batched, eh_arquivo_de_registros
 except ImportError:
     # Fallback para execução direta
     sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
     from app.services.indexar import vectorstore, gerar_id_unico
+    from app.services.ndjson_store import iter_records, batched, eh_arquivo_de_registros
 
 from langchain_core.documents import Document
 
+# Leis lidas, preparadas e indexadas por vez
+LOTE_INDEXACAO = 100
+
 class LeiEnriquecidaIndexer:
     def __init__(self):
         self.vectorstore = vectorstore
         
+    def iter_leis_enriquecidas(self, arquivo_path: str) -> Iterator[Dict[str, Any]]:
+        """Lê as leis enriquecidas sob demanda (NDJSON ou .json legado)"""
+        yield from iter_records(arquivo_path)
+    
     def carregar_leis_enriquecidas(self, arquivo_path: str) -> List[Dict[str, Any]]:
         """Carrega as leis enriquecidas do arquivo JSON"""
         try:
-            with open(arquivo_path, 'r', encoding='utf-8') as f:
-                leis = json.load(f)
+            leis = list(self.iter_leis_enriquecidas(arquivo_path))
             print(f"✅ {len(leis)} leis carregadas de {arquivo_path}")
             return leis
         except Exception as e:
@@ -91,23 +98,34 @@ class LeiEnriquecidaIndexer:
         """Processa um arquivo de leis enriquecidas completo"""
         print(f"🚀 Iniciando processamento de {arquivo_path}")
         
-        # Carregar leis
-        leis = self.carregar_leis_enriquecidas(arquivo_path)
-        if not leis:
+        # Lê, prepara e indexa em lotes, sem carregar o arquivo inteiro
+        total_leis = 0
+        total_documentos = 0
+        sucesso_indexacao = True
+        
+        try:
+            for leis in batched(self.iter_leis_enriquecidas(arquivo_path), LOTE_INDEXACAO):
+                total_leis += len(leis)
+                documentos = self.preparar_documentos(leis)
+                if not documentos:
+                    continue
+                
+                sucesso_indexacao = self.indexar_documentos(documentos) and sucesso_indexacao
+                total_documentos += len(documentos)
+        except Exception as e:
+            print(f"❌ Erro ao carregar leis: {e}")
+            return {"sucesso": False, "erro": str(e)}
+        
+        if not total_leis:
             return {"sucesso": False, "erro": "Nenhuma lei carregada"}
         
-        # Preparar documentos
-        documentos = self.preparar_documentos(leis)
-        if not documentos:
+        if not total_documentos:
             return {"sucesso": False, "erro": "Nenhum documento preparado"}
         
-        # Indexar
-        sucesso_indexacao = self.indexar_documentos(documentos)
-        
         resultado = {
             "sucesso": sucesso_indexacao,
-            "total_leis": len(leis),
-            "total_documentos": len(documentos),
+            "total_leis": total_leis,
+            "total_documentos": total_documentos,
             "arquivo_processado": arquivo_path,
             "data_processamento": datetime.now().isoformat()
         }
@@ -120,7 +138,8 @@ def main():
     
     # Encontrar o arquivo mais recente de leis enriquecidas
     tests_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "tests")
-    arquivos_enriquecidos = [f for f in os.listdir(tests_dir) if f.startswith("leis_enriquecidas_") and f.endswith(".json")]
+    arquivos_enriquecidos = [f for f in os.listdir(tests_dir)
+                             if f.startswith("leis_enriquecidas_") and eh_arquivo_de_registros(f)]
     
     if not arquivos_enriquecidos:
         print("❌ Nenhum arquivo de leis enriquecidas encontrado!")
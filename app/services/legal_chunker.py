@@ -0,0 +1,222 @@
+"""
+Divisão de textos jurídicos em chunks respeitando a estrutura da norma
+Quebra em artigos, parágrafos, incisos e alíneas, limita cada chunk por tokens
+do modelo de embeddings e anota a referência (ex.: "Art. 5º, § 1º, II") nos metadados
+"""
+
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.services.tokens import EMBEDDING_MODEL, contar_tokens, fatiar_tokens
+
+# Tamanho máximo de cada chunk e sobreposição ao quebrar um mesmo dispositivo
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "30"))
+
+# Um novo artigo só abre outro chunk se o atual já tiver esta fração do orçamento;
+# artigos curtos (ex.: cláusula de vigência) ficam junto com o anterior
+FRACAO_MINIMA_ARTIGO = 0.25
+
+# Tokens reservados para o prefixo "[Art. Nº]" de chunks que continuam um artigo
+RESERVA_PREFIXO = 8
+
+# Dispositivos reconhecidos no início de linha ou logo após fim de frase/enumeração
+# ("Art." maiúsculo abre artigo; "art." minúsculo é citação e não quebra o texto)
+MARCADORES = re.compile(r"""
+    (?:^|(?<=[.;:!?])[ \t])[ \t]*
+    (?:
+        (?P<artigo>(?:Art(?:igo|\.)?|ART(?:IGO|\.)?)\s*(?P<num_art>\d+(?:\.\d+)*)\s*(?:º|°|o\b)?(?:\s*-\s*[A-Z]\b)?)
+      | (?P<paragrafo>§\s*(?P<num_par>\d+)\s*(?:º|°)?|(?i:par[áa]grafo\s+[úu]nico))
+      | (?P<inciso>(?P<num_inc>[IVXLCDM]+)\s*[-–—])
+      | (?P<alinea>(?P<num_ali>[a-z])\))
+    )
+""", re.MULTILINE | re.VERBOSE)
+
+NIVEIS = ("artigo", "paragrafo", "inciso", "alinea")
+
+
+def _rotulo_artigo(numero: str) -> str:
+    # Artigos 1 a 9 são ordinais (Art. 5º); a partir do 10, cardinais (Art. 10)
+    return f"Art. {numero}º" if numero.isdigit() and int(numero) < 10 else f"Art. {numero}"
+
+
+def _rotulo_paragrafo(numero: Optional[str]) -> str:
+    if not numero:
+        return "Parágrafo único"
+    return f"§ {numero}º" if int(numero) < 10 else f"§ {numero}"
+
+
+class LegalChunker:
+    """Gera chunks de textos jurídicos por dispositivo, dentro de um orçamento de tokens"""
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 model: str = EMBEDDING_MODEL):
+        self.max_tokens = max(RESERVA_PREFIXO * 4, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.model = model
+
+    def _tokens(self, texto: str) -> int:
+        return contar_tokens(texto, self.model)
+
+    def iter_unidades(self, text: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Percorre o texto uma única vez e devolve cada dispositivo com sua referência.
+
+        Yields:
+            Tuple[str, Dict]: (texto do dispositivo, {'nivel', 'artigo', 'referencia'})
+        """
+        estado = dict.fromkeys(NIVEIS)
+        inicio = 0
+        nivel = "texto"
+
+        def unidade(fim: int):
+            trecho = text[inicio:fim].strip()
+            if trecho:
+                referencia = ", ".join(estado[n] for n in NIVEIS if estado[n])
+                yield trecho, {"nivel": nivel, "artigo": estado["artigo"], "referencia": referencia}
+
+        for m in MARCADORES.finditer(text):
+            novo_nivel = next(n for n in NIVEIS if m.group(n))
+            posicao = m.start(novo_nivel)
+            yield from unidade(posicao)
+
+            # Ao entrar em um dispositivo, os níveis abaixo dele são reiniciados
+            for n in NIVEIS[NIVEIS.index(novo_nivel):]:
+                estado[n] = None
+            if novo_nivel == "artigo":
+                estado["artigo"] = _rotulo_artigo(m.group("num_art"))
+            elif novo_nivel == "paragrafo":
+                estado["paragrafo"] = _rotulo_paragrafo(m.group("num_par"))
+            elif novo_nivel == "inciso":
+                estado["inciso"] = m.group("num_inc")
+            else:
+                estado["alinea"] = m.group("num_ali")
+
+            inicio = posicao
+            nivel = novo_nivel
+
+        yield from unidade(len(text))
+
+    def _dividir_palavras(self, texto: str, orcamento: int) -> Iterator[str]:
+        """Quebra um dispositivo maior que o orçamento em janelas de palavras com sobreposição"""
+        palavras = []
+        for palavra in texto.split():
+            # Uma "palavra" acima do orçamento (ex.: sequência sem espaços) é fatiada por tokens
+            if self._tokens(palavra + " ") > orcamento:
+                palavras.extend(fatiar_tokens(palavra, orcamento - 1, self.model))
+            else:
+                palavras.append(palavra)
+        custos = [self._tokens(palavra + " ") for palavra in palavras]
+        inicio = 0
+        while inicio < len(palavras):
+            fim = inicio
+            total = 0
+            while fim < len(palavras) and (fim == inicio or total + custos[fim] <= orcamento):
+                total += custos[fim]
+                fim += 1
+            yield " ".join(palavras[inicio:fim])
+            if fim >= len(palavras):
+                return
+
+            # Recua a partir do fim da janela até completar a sobreposição
+            proximo = fim
+            sobreposicao = 0
+            while proximo - 1 > inicio and sobreposicao + custos[proximo - 1] <= self.overlap_tokens:
+                proximo -= 1
+                sobreposicao += custos[proximo]
+            inicio = proximo
+
+    def iter_chunks(self, text: str, cabecalho: str = "",
+                    metadata: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Divide o texto em chunks (gerador, tempo linear no tamanho do texto).
+
+        Args:
+            text: Texto da norma
+            cabecalho: Texto repetido no início de cada chunk (ex.: título da lei)
+            metadata: Metadados copiados para todos os chunks
+
+        Yields:
+            Dict: {'text': ..., 'metadata': {..., 'chunk_index', 'artigos', 'referencia', 'tokens'}}
+        """
+        if not text or not text.strip():
+            return
+
+        cabecalho = cabecalho.strip()
+        tokens_cabecalho = self._tokens(cabecalho + "\n\n") if cabecalho else 0
+        orcamento = max(RESERVA_PREFIXO * 2, self.max_tokens - tokens_cabecalho - RESERVA_PREFIXO)
+        base = dict(metadata or {})
+        indice = 0
+
+        def montar(partes: List[Tuple[str, Dict[str, Any], int]]) -> Dict[str, Any]:
+            nonlocal indice
+            corpo = "\n".join(trecho for trecho, _, _ in partes)
+            primeiro = partes[0][1]
+            # Chunk que começa no meio de um artigo leva o rótulo do artigo como contexto
+            if primeiro["artigo"] and primeiro["nivel"] != "artigo":
+                corpo = f"[{primeiro['artigo']}] {corpo}"
+            if cabecalho:
+                corpo = f"{cabecalho}\n\n{corpo}"
+
+            artigos = list(dict.fromkeys(info["artigo"] for _, info, _ in partes if info["artigo"]))
+            chunk = {
+                "text": corpo,
+                "metadata": {
+                    **base,
+                    "chunk_index": indice,
+                    "artigos": artigos,
+                    "referencia": primeiro["referencia"],
+                    "tokens": tokens_cabecalho + sum(n for _, _, n in partes)
+                }
+            }
+            indice += 1
+            return chunk
+
+        atual: List[Tuple[str, Dict[str, Any], int]] = []
+        total = 0
+
+        for trecho, info in self.iter_unidades(text):
+            n = self._tokens(trecho)
+
+            # Dispositivo sozinho maior que o orçamento: quebra por palavras
+            if n > orcamento:
+                if atual:
+                    yield montar(atual)
+                    atual, total = [], 0
+                for i, pedaco in enumerate(self._dividir_palavras(trecho, orcamento)):
+                    # Pedaços seguintes ao primeiro também recebem o rótulo do artigo
+                    parte_info = info if i == 0 else {**info, "nivel": "continuacao"}
+                    yield montar([(pedaco, parte_info, self._tokens(pedaco))])
+                continue
+
+            novo_artigo = info["nivel"] == "artigo"
+            if atual and (total + n > orcamento or (novo_artigo and total >= orcamento * FRACAO_MINIMA_ARTIGO)):
+                yield montar(atual)
+
+                # Dentro do mesmo artigo, repete os últimos dispositivos como sobreposição
+                mantidos: List[Tuple[str, Dict[str, Any], int]] = []
+                if not novo_artigo:
+                    sobreposicao = 0
+                    for parte in reversed(atual):
+                        if parte[1]["artigo"] != info["artigo"] or sobreposicao + parte[2] > self.overlap_tokens:
+                            break
+                        mantidos.insert(0, parte)
+                        sobreposicao += parte[2]
+                atual = mantidos
+                total = sum(parte[2] for parte in atual)
+                if total + n > orcamento:
+                    atual, total = [], 0
+
+            atual.append((trecho, info, n))
+            total += n
+
+        if atual:
+            yield montar(atual)
+
+    def split_text(self, text: str, cabecalho: str = "") -> List[str]:
+        """Atalho: apenas os textos dos chunks"""
+        return [chunk["text"] for chunk in self.iter_chunks(text, cabecalho)]
+
+
+# Instância compartilhada (orçamento padrão)
+legal_chunker = LegalChunker()
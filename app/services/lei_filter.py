@@ -3,6 +3,8 @@ Módulo para filtrar leis revogadas
 Otimiza o sistema removendo leis que não são mais aplicáveis
 """
 
+import re
+
 def is_documento_revogado(documento) -> bool:
     """Detecta se um documento foi revogado baseado no conteúdo"""
     if not documento:
@@ -46,6 +48,21 @@ def is_documento_revogado(documento) -> bool:
     
     return False
 
+# Marca de revogação no título, ex.: "Lei nº 1.234/2001 (Revogada)" ou "*Revogado"
+_MARCADOR_TITULO = re.compile(r"[(\[]\s*(?:revogad[ao]|ab-rogad[ao])\b|^\s*\*\s*(?:revogad[ao]|ab-rogad[ao])\b",
+                              re.IGNORECASE)
+
+def is_revogado_por_metadados(titulo: str, status: str = "") -> bool:
+    """
+    Detecta revogação apenas pelo campo de status e por uma marca no título.
+    A descrição (ementa) fica de fora: leis vigentes costumam dizer que revogam outras
+    ("Revoga a Lei nº ..."), e o texto integral traz "Revogam-se as disposições em contrário"
+    """
+    status = str(status or "").lower()
+    if any(marcador in status for marcador in ('revogad', 'ab-rogad', 'não vigente', 'sem vigência')):
+        return True
+    return bool(_MARCADOR_TITULO.search(str(titulo or "")))
+
 def filtrar_leis_revogadas(documentos):
     """Remove documentos revogados de uma lista"""
     if not documentos:
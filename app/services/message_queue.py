@@ -0,0 +1,509 @@
+"""
+Gravação diferida (write-behind) das conversas e mensagens no Supabase
+/ask-ia responde logo após a resposta do modelo; as inserções entram numa fila,
+são registradas num journal NDJSON local (sobrevivem a um reinício) e enviadas
+em lotes quando a fila atinge MESSAGE_BATCH_SIZE ou a cada MESSAGE_FLUSH_INTERVAL.
+Cada linha leva um ID gerado aqui e é gravada com upsert: reenviar um lote não
+duplica nada. Registros recusados pelo banco (ex.: conversa inexistente) vão para
+um arquivo de descarte, sem travar o restante da fila.
+
+O journal é só de acréscimo e é gravado por uma thread própria, fora do event
+loop: lotes gravados no banco viram uma marca {"ack": [...]} em vez de regravar
+o arquivo, que é compactado de tempos em tempos (MESSAGE_JOURNAL_COMPACT_LINES).
+"""
+
+import os
+import glob
+import uuid
+import queue
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.services.ndjson_store import NDJSONWriter, iter_records, write_records
+
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "50"))
+MESSAGE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "1.0"))
+MESSAGE_JOURNAL_PATH = os.getenv("MESSAGE_JOURNAL_PATH", os.path.join(".cache", "messages_journal.ndjson"))
+
+# Registros recusados definitivamente pelo banco, com o erro, para análise manual
+MESSAGE_DEAD_LETTER_PATH = os.getenv("MESSAGE_DEAD_LETTER_PATH", os.path.join(".cache", "messages_dead_letter.ndjson"))
+
+# Com vários workers, cada processo grava o próprio journal (definido pelo start.py)
+MESSAGE_JOURNAL_PER_WORKER = os.getenv("MESSAGE_JOURNAL_PER_WORKER", "") == "1"
+
+# Linhas acumuladas no journal (registros + marcas) antes de compactá-lo
+MESSAGE_JOURNAL_COMPACT_LINES = int(os.getenv("MESSAGE_JOURNAL_COMPACT_LINES", "1000"))
+
+# Espera máxima entre tentativas quando o Supabase está indisponível
+MAX_BACKOFF = 30.0
+
+
+def agora() -> str:
+    """Instante atual em ISO 8601 (UTC), usado como created_at das linhas enfileiradas"""
+    return datetime.now(timezone.utc).isoformat()
+
+
+def novo_conversation_id() -> str:
+    """ID da conversa gerado na aplicação: a resposta não espera o insert no banco"""
+    return str(uuid.uuid4())
+
+
+def erro_permanente(erro: Exception) -> bool:
+    """
+    Se o erro do Supabase não se resolve com nova tentativa (restrição, coluna
+    inexistente, dado inválido, 4xx), ao contrário de falhas de rede, 5xx e 429.
+    """
+    codigo = str(getattr(erro, "code", "") or "")
+    # SQLSTATE 22 (dado inválido), 23 (restrição), 42 (coluna/tabela); PGRST = erro do PostgREST
+    if codigo[:2] in ("22", "23", "42") or codigo.startswith("PGRST"):
+        return True
+    resposta = getattr(erro, "response", None)
+    status = getattr(erro, "status_code", None) or getattr(resposta, "status_code", None)
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return False
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+def chave_registro(registro: Dict[str, Any]) -> str:
+    """Identifica um registro da fila no journal (tabela + ID da linha)"""
+    return f"{registro['tabela']}:{registro['dados']['id']}"
+
+
+def ler_journal(path: str) -> List[Dict[str, Any]]:
+    """
+    Registros ainda pendentes em um journal, na ordem de chegada: uma versão mais
+    nova de um registro substitui a anterior e as marcas "ack" removem os já gravados.
+    """
+    pendentes: Dict[str, Dict[str, Any]] = {}
+    for registro in iter_records(path):
+        if "ack" in registro:
+            for chave in registro["ack"]:
+                pendentes.pop(chave, None)
+            continue
+        if registro["tabela"] == "messages":
+            # Journals antigos não tinham ID nas mensagens
+            registro["dados"].setdefault("id", str(uuid.uuid4()))
+        pendentes[chave_registro(registro)] = registro
+    return list(pendentes.values())
+
+
+def journal_do_processo(base: str) -> str:
+    """Journal exclusivo do processo atual (ex.: messages_journal.1234.ndjson)"""
+    raiz, ext = os.path.splitext(base)
+    return f"{raiz}.{os.getpid()}{ext}"
+
+
+def juntar_journals(base: str = MESSAGE_JOURNAL_PATH) -> int:
+    """
+    Acrescenta ao journal principal os journals por processo de execuções anteriores.
+    Só deve rodar sem workers ativos (no início do start.py ou com um único processo).
+
+    Returns:
+        int: Quantidade de registros recuperados
+    """
+    raiz, _ = os.path.splitext(base)
+    orfaos = [path for path in sorted(glob.glob(glob.escape(raiz) + ".*"))
+              if path != base and not path.endswith(".tmp")]
+    total = 0
+    for path in orfaos:
+        total += write_records(base, iter_records(path), append=True)
+        os.remove(path)
+    return total
+
+
+def recuperar_journal_do_worker(pid: int, base: str = MESSAGE_JOURNAL_PATH) -> int:
+    """
+    Acrescenta ao journal principal o journal de um worker que terminou (chamado
+    pelo processo mestre, ex.: hook child_exit do gunicorn). O worker que o
+    substitui assume o journal principal ao iniciar.
+
+    Returns:
+        int: Quantidade de registros recuperados
+    """
+    raiz, ext = os.path.splitext(base)
+    total = 0
+    for path in (f"{raiz}.{pid}{ext}.recuperado", f"{raiz}.{pid}{ext}"):
+        if os.path.exists(path):
+            total += write_records(base, iter_records(path), append=True)
+            os.remove(path)
+    return total
+
+
+def _copia(registro: Dict[str, Any]) -> Dict[str, Any]:
+    return {"tabela": registro["tabela"], "dados": dict(registro["dados"])}
+
+
+class JournalWriter:
+    """
+    Thread única que grava o journal, na ordem em que as operações chegam.
+    Acréscimos seguidos no mesmo arquivo saem numa só escrita com um fsync.
+    """
+
+    def __init__(self):
+        self._fila: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.falhas = 0
+
+    def _iniciar(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._rodar, name="journal-writer", daemon=True)
+                self._thread.start()
+
+    def append(self, path: str, registros: List[Dict[str, Any]]) -> None:
+        """Acrescenta registros (ou marcas {"ack": [...]}) ao journal"""
+        self._iniciar()
+        self._fila.put(("append", path, registros))
+
+    def rewrite(self, path: str, registros: List[Dict[str, Any]]) -> None:
+        """Substitui o journal pelos registros (vazio = remove o arquivo)"""
+        self._iniciar()
+        self._fila.put(("rewrite", path, registros))
+
+    def wait(self) -> None:
+        """Bloqueia até todas as operações enviadas estarem em disco"""
+        if self._thread is not None:
+            self._fila.join()
+
+    def _rodar(self) -> None:
+        while True:
+            operacoes = [self._fila.get()]
+            while True:
+                try:
+                    operacoes.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._aplicar(operacoes)
+            except Exception as e:
+                self.falhas += 1
+                print(f"⚠️ Falha ao gravar o journal de mensagens: {e}")
+            finally:
+                for _ in operacoes:
+                    self._fila.task_done()
+
+    @staticmethod
+    def _aplicar(operacoes) -> None:
+        writer = None
+        try:
+            for tipo, path, registros in operacoes:
+                if tipo == "append":
+                    if writer is None or writer.path != path:
+                        if writer:
+                            writer.sync()
+                            writer.close()
+                        writer = NDJSONWriter(path, append=True).open()
+                    writer.write_many(registros)
+                    continue
+
+                if writer:
+                    writer.sync()
+                    writer.close()
+                    writer = None
+                if not registros:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+                temporario = path + ".tmp"
+                with NDJSONWriter(temporario, append=False) as novo:
+                    novo.write_many(registros)
+                    novo.sync()
+                os.replace(temporario, path)
+            if writer:
+                writer.sync()
+        finally:
+            if writer:
+                writer.close()
+
+
+class MessagePersistenceQueue:
+    """Fila de inserções em 'conversations' e 'messages', com journal local"""
+
+    def __init__(self, supabase, batch_size: int = MESSAGE_BATCH_SIZE,
+                 flush_interval: float = MESSAGE_FLUSH_INTERVAL, journal_path: str = MESSAGE_JOURNAL_PATH,
+                 per_worker: bool = MESSAGE_JOURNAL_PER_WORKER,
+                 dead_letter_path: str = MESSAGE_DEAD_LETTER_PATH):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal_path = journal_path
+        self.base_journal = journal_path
+        self.per_worker = per_worker
+        self.dead_letter_path = dead_letter_path
+        # Registros {'tabela': ..., 'dados': {...}} ainda não gravados, em ordem de chegada
+        self._pendentes: List[Dict[str, Any]] = []
+        self._evento: Optional[asyncio.Event] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._journal = JournalWriter()
+        # Linhas no journal desde a última compactação
+        self._linhas_journal = 0
+        self.gravados = 0
+        self.falhas = 0
+        self.descartados = 0
+
+    # --- Journal ---
+
+    def _registrar_journal(self, registros: List[Dict[str, Any]]) -> None:
+        # Cópias: a thread do journal serializa depois, e a fila pode alterar os originais
+        self._journal.append(self.journal_path, [_copia(r) for r in registros])
+        self._linhas_journal += len(registros)
+
+    def _confirmar_journal(self, chaves: List[str]) -> None:
+        """Marca registros como gravados (ou descartados); compacta quando o journal cresce demais"""
+        if not self._pendentes:
+            self._journal.rewrite(self.journal_path, [])
+            self._linhas_journal = 0
+        elif self._linhas_journal + 1 > max(MESSAGE_JOURNAL_COMPACT_LINES, 2 * len(self._pendentes)):
+            self._compactar_journal()
+        elif chaves:
+            self._journal.append(self.journal_path, [{"ack": chaves}])
+            self._linhas_journal += 1
+
+    def _compactar_journal(self) -> None:
+        """Journal passa a conter apenas o que continua pendente"""
+        self._journal.rewrite(self.journal_path, [_copia(r) for r in self._pendentes])
+        self._linhas_journal = len(self._pendentes)
+
+    def wait_journal(self) -> None:
+        """Aguarda o journal chegar ao disco (bloqueante: use fora do event loop)"""
+        self._journal.wait()
+
+    def _recuperar_journal(self) -> int:
+        """Recoloca na fila o que ficou pendente na execução anterior"""
+        if not self.per_worker:
+            juntar_journals(self.journal_path)
+            if not os.path.exists(self.journal_path):
+                return 0
+            self._pendentes = ler_journal(self.journal_path) + self._pendentes
+            self._compactar_journal()
+            self._journal.wait()
+            return len(self._pendentes)
+
+        # O caminho é definido aqui, no worker (com preload, o __init__ roda no processo mestre)
+        self.journal_path = journal_do_processo(self.base_journal)
+        assumido = self.journal_path + ".recuperado"
+        try:
+            # Rename atômico: só um worker assume o journal compartilhado
+            os.rename(self.base_journal, assumido)
+        except OSError:
+            return 0
+        self._pendentes = ler_journal(assumido) + self._pendentes
+        self._compactar_journal()
+        self._journal.wait()
+        os.remove(assumido)
+        return len(self._pendentes)
+
+    # --- Enfileiramento ---
+
+    def _enfileirar(self, registros: List[Dict[str, Any]]) -> None:
+        self._registrar_journal(registros)
+        self._pendentes.extend(registros)
+        if self._evento and len(self._pendentes) >= self.batch_size:
+            self._evento.set()
+
+    def add_conversation(self, conversation_id: str, user_id: str, title: str) -> Dict[str, Any]:
+        """Enfileira a criação de uma conversa (ID gerado por novo_conversation_id) e retorna a linha"""
+        conversa = {"id": conversation_id, "user_id": user_id, "title": title, "created_at": agora()}
+        self._enfileirar([{"tabela": "conversations", "dados": conversa}])
+        return dict(conversa)
+
+    def add_messages(self, conversation_id: str, messages: List[Dict[str, str]]) -> None:
+        """
+        Enfileira mensagens de um turno.
+
+        Args:
+            conversation_id: ID da conversa
+            messages: Dicts com role, content e, opcionalmente, created_at (define a ordem no histórico)
+        """
+        self._enfileirar([{
+            "tabela": "messages",
+            "dados": {
+                # ID gerado aqui: o upsert torna o reenvio de um lote idempotente
+                "id": str(uuid.uuid4()),
+                "conversation_id": conversation_id,
+                "role": message["role"],
+                "content": message["content"],
+                "created_at": message.get("created_at") or agora()
+            }
+        } for message in messages])
+
+    def pending_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Mensagens da conversa que ainda não chegaram ao banco"""
+        return [dict(r["dados"]) for r in self._pendentes
+                if r["tabela"] == "messages" and r["dados"]["conversation_id"] == conversation_id]
+
+    def pending_conversations(self, user_id: str) -> List[Dict[str, Any]]:
+        """Conversas do usuário que ainda não chegaram ao banco"""
+        return [dict(r["dados"]) for r in self._pendentes
+                if r["tabela"] == "conversations" and r["dados"]["user_id"] == user_id]
+
+    def update_pending_conversation(self, conversation_id: str, campos: Dict[str, Any]) -> bool:
+        """
+        Altera uma conversa ainda na fila (ex.: novo título); retorna se ela estava pendente.
+        Só colunas que o insert enfileirado já tem são alteradas: uma coluna nova
+        (que pode não existir na tabela) faria o insert inteiro ser recusado.
+        """
+        pendente = alterou = False
+        for registro in self._pendentes:
+            if registro["tabela"] == "conversations" and registro["dados"]["id"] == conversation_id:
+                pendente = True
+                for campo, valor in campos.items():
+                    if campo in registro["dados"]:
+                        registro["dados"][campo] = valor
+                        alterou = True
+        if alterou:
+            # Versão nova do registro no journal: na recuperação, substitui a anterior
+            self._registrar_journal([r for r in self._pendentes if r["tabela"] == "conversations"
+                                     and r["dados"]["id"] == conversation_id])
+        return pendente
+
+    def discard(self, conversation_id: str) -> int:
+        """Remove da fila tudo o que pertence a uma conversa (ex.: conversa excluída)"""
+        removidos = [r for r in self._pendentes
+                     if r["dados"].get("conversation_id", r["dados"].get("id")) == conversation_id]
+        if removidos:
+            excluir = {id(r) for r in removidos}
+            self._pendentes = [r for r in self._pendentes if id(r) not in excluir]
+            self._confirmar_journal([chave_registro(r) for r in removidos])
+        return len(removidos)
+
+    @asynccontextmanager
+    async def locked(self):
+        """
+        Segura o envio durante o bloco: um lote já retirado da fila termina de ser
+        gravado antes de entrar, e nenhum outro começa até sair (ex.: exclusão de conversas)
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            yield
+
+    # --- Gravação ---
+
+    def _inserir(self, lote: List[Dict[str, Any]]) -> None:
+        conversas = [r["dados"] for r in lote if r["tabela"] == "conversations"]
+        mensagens = [r["dados"] for r in lote if r["tabela"] == "messages"]
+        # Conversas antes das mensagens (chave estrangeira). Upsert pelo ID: repetir
+        # um lote (nova tentativa ou journal recuperado) não duplica linhas
+        if conversas:
+            self.supabase.table("conversations").upsert(conversas, on_conflict="id", ignore_duplicates=True).execute()
+        if mensagens:
+            self.supabase.table("messages").upsert(mensagens, on_conflict="id", ignore_duplicates=True).execute()
+
+    def _enviar(self, lote: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Grava o lote; se o banco recusar, divide-o ao meio até isolar os registros ruins.
+
+        Returns:
+            List: Registros recusados definitivamente (os demais foram gravados)
+        Raises:
+            Exception: Falha transitória (rede, 5xx): o lote inteiro fica para a próxima tentativa
+        """
+        try:
+            self._inserir(lote)
+            return []
+        except Exception as e:
+            if not erro_permanente(e):
+                raise
+            if len(lote) == 1:
+                lote[0]["erro"] = str(e)
+                return lote
+        meio = len(lote) // 2
+        return self._enviar(lote[:meio]) + self._enviar(lote[meio:])
+
+    def _descartar(self, registros: List[Dict[str, Any]]) -> None:
+        with NDJSONWriter(self.dead_letter_path, append=True) as writer:
+            writer.write_many({**r, "descartado_em": agora()} for r in registros)
+            writer.sync()
+        self.descartados += len(registros)
+        for registro in registros:
+            print(f"🗑️ Registro de {registro['tabela']} recusado pelo banco, movido para "
+                  f"{self.dead_letter_path}: {registro.get('erro')}")
+
+    async def flush(self) -> int:
+        """Envia todos os pendentes (em lotes) e retorna quantos registros foram gravados (sem contar os recusados)"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        total = 0
+        async with self._flush_lock:
+            while self._pendentes:
+                lote = self._pendentes[:self.batch_size]
+                recusados = await run_in_threadpool(self._enviar, lote)
+                if recusados:
+                    await run_in_threadpool(self._descartar, recusados)
+                # Remove pelo objeto: a fila pode ter mudado durante o envio (ex.: discard)
+                enviados = {id(registro) for registro in lote}
+                self._pendentes = [r for r in self._pendentes if id(r) not in enviados]
+                self._confirmar_journal([chave_registro(r) for r in lote])
+                total += len(lote) - len(recusados)
+                self.gravados += len(lote) - len(recusados)
+        return total
+
+    async def _loop(self) -> None:
+        espera = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._evento.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+            self._evento.clear()
+
+            try:
+                gravados = await self.flush()
+                if gravados:
+                    print(f"💾 {gravados} registro(s) de chat gravados no Supabase")
+                espera = self.flush_interval
+            except Exception as e:
+                self.falhas += 1
+                espera = min(MAX_BACKOFF, max(espera, self.flush_interval) * 2)
+                print(f"⚠️ Falha ao gravar mensagens ({len(self._pendentes)} pendentes), "
+                      f"nova tentativa em {espera:.1f}s: {e}")
+
+    async def start(self) -> None:
+        """Recupera o journal e inicia a gravação em segundo plano (lifespan do app)"""
+        if self._tarefa:
+            return
+        recuperados = await run_in_threadpool(self._recuperar_journal)
+        if recuperados:
+            print(f"📒 {recuperados} registro(s) de chat recuperados do journal")
+        self._evento = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._tarefa = asyncio.create_task(self._loop())
+        if recuperados:
+            self._evento.set()
+
+    async def stop(self) -> None:
+        """Para a tarefa e tenta gravar o que resta; o que falhar continua no journal"""
+        if self._tarefa:
+            # Espera um envio em andamento terminar antes de cancelar (evita reenviar o lote)
+            async with self._flush_lock:
+                self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"⚠️ {len(self._pendentes)} registro(s) de chat ficam no journal para a próxima execução: {e}")
+        await run_in_threadpool(self._journal.wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pendentes),
+            "written": self.gravados,
+            "failures": self.falhas,
+            "dead_lettered": self.descartados,
+            "journal": self.journal_path,
+            "journal_lines": self._linhas_journal,
+            "journal_failures": self._journal.falhas
+        }
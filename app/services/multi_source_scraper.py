@@ -12,21 +12,36 @@ from selenium.webdriver.edge.service import Service as EdgeService
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional
-import pypdf
-import io
 from tqdm import tqdm
 import json
 from datetime import datetime
+from app.services.collection_scheduler import CollectionScheduler, default_rate_limiter
+from app.services.async_crawler import fetch_pages
+from app.services.pdf_pipeline import PDFPipeline, extrair_texto_pdf
+from app.services.http_cache import http_cache
+from app.services.ndjson_store import NDJSONWriter, caminho_ndjson, write_records
 
 class BaseScraper(ABC):
     """Classe base para todos os scrapers"""
     
+    # Fontes que só funcionam em navegador (formulários/JavaScript) usam Selenium sempre;
+    # as demais usam HTTP simples e recorrem ao navegador apenas como fallback
+    requires_browser = False
+    
     def __init__(self, name: str, base_url: str):
         self.name = name
         self.base_url = base_url
         self.driver = None
+        # Substituído pelo limitador compartilhado quando roda pelo CollectionScheduler
+        self.rate_limiter = default_rate_limiter
+        self.session = requests.Session()
+        
+    def polite_wait(self, url: str):
+        """Aguarda a vez do host antes de uma requisição (cortesia com o servidor)"""
+        self.rate_limiter.wait(url)
         
     def setup_driver(self, headless: bool = True):
         """Configura o driver do Selenium"""
@@ -45,6 +60,41 @@ class BaseScraper(ABC):
         """Limpa o driver"""
         if self.driver:
             self.driver.quit()
+            self.driver = None
+            
+    def fetch_with_browser(self, url: str, timeout: int = 15) -> str:
+        """Fallback explícito: carrega a página no Selenium (o driver é criado sob demanda)"""
+        if not self.driver:
+            self.setup_driver()
+            
+        self.polite_wait(url)
+        self.driver.get(url)
+        WebDriverWait(self.driver, timeout).until(
+            lambda driver: driver.execute_script("return document.readyState") == "complete"
+        )
+        return self.driver.page_source
+        
+    def fetch_pages(self, urls: List[str]) -> Dict[str, Optional[str]]:
+        """Baixa páginas HTML em paralelo via HTTP (ou pelo navegador, se a fonte exigir)"""
+        if self.requires_browser:
+            return {url: self.fetch_with_browser(url) for url in urls}
+        return fetch_pages(urls, rate_limiter=self.rate_limiter, cache=http_cache)
+        
+    def extract_pdf_texts(self, pdf_urls) -> Dict[str, Optional[str]]:
+        """Baixa (threads) e extrai (processos) vários PDFs em paralelo"""
+        pipeline = PDFPipeline(rate_limiter=self.rate_limiter, timeout=20, cache=http_cache)
+        return pipeline.process_all(pdf_urls)
+        
+    def _extract_pdf_text(self, pdf_url: str) -> Optional[str]:
+        """Extrai texto de um PDF (download condicional e texto em cache pelo hash)"""
+        try:
+            self.polite_wait(pdf_url)
+            response = http_cache.get(self.session, pdf_url, timeout=20)
+            
+            return http_cache.pdf_text(response.content, extrair_texto_pdf)
+        except Exception as e:
+            print(f"Erro ao extrair PDF {pdf_url}: {e}")
+            return None
             
     @abstractmethod
     def extract_documents(self) -> List[Dict]:
@@ -65,58 +115,47 @@ class TocantinsAssembleiaScraper(BaseScraper):
     def extract_documents(self) -> List[Dict]:
         """Extrai documentos da Assembleia do Tocantins"""
         documents = []
-        self.setup_driver()
+        page_urls = [f"{self.base_url}?pagPaginaAtual={page}" for page in range(1, 4)]  # Primeiras 3 páginas para teste
         
+        # Listagens via HTTP simples; o navegador só entra para páginas que falharem
+        pages = self.fetch_pages(page_urls)
+        
+        pdf_urls = []
         try:
-            for page in range(1, 4):  # Primeiras 3 páginas para teste
-                url = f"{self.base_url}?pagPaginaAtual={page}"
-                print(f"Coletando página {page}: {url}")
-                
-                self.driver.get(url)
-                time.sleep(5)
-                
-                soup = BeautifulSoup(self.driver.page_source, 'html.parser')
+            for url, html in pages.items():
+                print(f"Coletando página: {url}")
+                page_pdf_urls = self._extract_pdf_urls(html) if html else []
                 
-                # Busca links de PDF
-                for link in soup.find_all('a', href=True):
-                    if link['href'].startswith('/arquivo/'):
-                        pdf_url = requests.compat.urljoin(self.base_url, link['href'])
-                        text = self._extract_pdf_text(pdf_url)
-                        
-                        if text and self.is_relevant_document(text):
-                            documents.append({
-                                'source': self.name,
-                                'url': pdf_url,
-                                'text': text,
-                                'type': 'pdf',
-                                'collected_at': datetime.now().isoformat()
-                            })
-                            
-                time.sleep(2)
+                if not page_pdf_urls:
+                    print(f"Página sem links via HTTP, usando navegador: {url}")
+                    page_pdf_urls = self._extract_pdf_urls(self.fetch_with_browser(url))
+                    
+                pdf_urls.extend(page_pdf_urls)
                 
         finally:
             self.cleanup_driver()
             
+        for pdf_url, text in self.extract_pdf_texts(pdf_urls).items():
+            if text and self.is_relevant_document(text):
+                documents.append({
+                    'source': self.name,
+                    'url': pdf_url,
+                    'text': text,
+                    'type': 'pdf',
+                    'collected_at': datetime.now().isoformat()
+                })
+            
         return documents
         
-    def _extract_pdf_text(self, pdf_url: str) -> Optional[str]:
-        """Extrai texto de um PDF"""
-        try:
-            response = requests.get(pdf_url, timeout=20)
-            response.raise_for_status()
-            
-            pdf_file = io.BytesIO(response.content)
-            reader = pypdf.PdfReader(pdf_file)
-            
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-                
-            return text
-        except Exception as e:
-            print(f"Erro ao extrair PDF {pdf_url}: {e}")
-            return None
-            
+    def _extract_pdf_urls(self, html: str) -> List[str]:
+        """Extrai os links de PDF de uma página de listagem"""
+        soup = BeautifulSoup(html, 'html.parser')
+        return [
+            requests.compat.urljoin(self.base_url, link['href'])
+            for link in soup.find_all('a', href=True)
+            if link['href'].startswith('/arquivo/')
+        ]
+        
     def is_relevant_document(self, text: str) -> bool:
         """Verifica se é documento ambiental relevante"""
         keywords = [
@@ -150,8 +189,8 @@ class PlanaltoScraper(BaseScraper):
         
         for url in environmental_laws:
             try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
+                self.polite_wait(url)
+                response = http_cache.get(self.session, url, timeout=10)
                 
                 soup = BeautifulSoup(response.content, 'html.parser')
                 text = soup.get_text(separator='\n', strip=True)
@@ -164,8 +203,6 @@ class PlanaltoScraper(BaseScraper):
                         'type': 'html',
                         'collected_at': datetime.now().isoformat()
                     })
-                    
-                time.sleep(1)  # Respeita o servidor
                 
             except Exception as e:
                 print(f"Erro ao coletar {url}: {e}")
@@ -185,6 +222,7 @@ class IbamaScraper(BaseScraper):
     def extract_documents(self) -> List[Dict]:
         """Extrai normativas do IBAMA"""
         documents = []
+        pdf_urls = []
         
         # URLs de seções importantes do IBAMA
         ibama_sections = [
@@ -194,55 +232,32 @@ class IbamaScraper(BaseScraper):
         
         for url in ibama_sections:
             try:
-                response = requests.get(url, timeout=10)
+                self.polite_wait(url)
+                response = http_cache.get(self.session, url, timeout=10)
                 if response.status_code == 200:
                     soup = BeautifulSoup(response.content, 'html.parser')
                     
-                    # Busca links para documentos
+                    # Busca links para documentos (por enquanto, só PDFs)
                     for link in soup.find_all('a', href=True):
                         href = link['href']
-                        if any(ext in href.lower() for ext in ['.pdf', '.doc', '.docx']):
-                            full_url = requests.compat.urljoin(url, href)
-                            
-                            if href.endswith('.pdf'):
-                                text = self._extract_pdf_text(full_url)
-                            else:
-                                continue  # Por enquanto, só PDFs
-                                
-                            if text and self.is_relevant_document(text):
-                                documents.append({
-                                    'source': self.name,
-                                    'url': full_url,
-                                    'text': text,
-                                    'type': 'pdf',
-                                    'collected_at': datetime.now().isoformat()
-                                })
-                                
-                time.sleep(2)
+                        if href.endswith('.pdf'):
+                            pdf_urls.append(requests.compat.urljoin(url, href))
                 
             except Exception as e:
                 print(f"Erro ao coletar IBAMA {url}: {e}")
                 
+        for pdf_url, text in self.extract_pdf_texts(pdf_urls).items():
+            if text and self.is_relevant_document(text):
+                documents.append({
+                    'source': self.name,
+                    'url': pdf_url,
+                    'text': text,
+                    'type': 'pdf',
+                    'collected_at': datetime.now().isoformat()
+                })
+                
         return documents
         
-    def _extract_pdf_text(self, pdf_url: str) -> Optional[str]:
-        """Extrai texto de um PDF"""
-        try:
-            response = requests.get(pdf_url, timeout=20)
-            response.raise_for_status()
-            
-            pdf_file = io.BytesIO(response.content)
-            reader = pypdf.PdfReader(pdf_file)
-            
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-                
-            return text
-        except Exception as e:
-            print(f"Erro ao extrair PDF {pdf_url}: {e}")
-            return None
-            
     def is_relevant_document(self, text: str) -> bool:
         """Verifica se é documento ambiental relevante"""
         keywords = [
@@ -305,10 +320,13 @@ class COEMAScraper(BaseScraper):
     def __init__(self):
         super().__init__("COEMA/CERH", "https://www.to.gov.br/semarh")
         self.visited_urls = set()
+        # PDFs encontrados durante a navegação, processados em lote ao final
+        self.pending_pdfs: Dict[str, str] = {}
         
     def extract_documents(self) -> List[Dict]:
         """Extrai documentos do COEMA e CERH navegando por múltiplas seções"""
         documents = []
+        self.pending_pdfs = {}
         
         # URLs principais para explorar
         main_urls = [
@@ -336,9 +354,6 @@ class COEMAScraper(BaseScraper):
                 documents.extend(docs_from_url)
                 print(f"Coletados {len(docs_from_url)} documentos de {url}")
                 
-                # Pequena pausa entre requisições
-                time.sleep(1)
-                
             except Exception as e:
                 print(f"Erro ao processar {url}: {e}")
                 continue
@@ -347,6 +362,13 @@ class COEMAScraper(BaseScraper):
         additional_docs = self._search_additional_pages(headers)
         documents.extend(additional_docs)
         
+        # Baixa e extrai em paralelo os PDFs encontrados na navegação
+        print(f"Processando {len(self.pending_pdfs)} PDFs encontrados...")
+        for url, text in self.extract_pdf_texts(list(self.pending_pdfs)).items():
+            doc = self._build_document(url, self.pending_pdfs[url], text)
+            if doc:
+                documents.append(doc)
+        
         print(f"Total de documentos coletados: {len(documents)}")
         return documents
     
@@ -360,8 +382,8 @@ class COEMAScraper(BaseScraper):
         self.visited_urls.add(url)
         
         try:
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()
+            self.polite_wait(url)
+            response = http_cache.get(self.session, url, headers=headers, timeout=15)
             
             soup = BeautifulSoup(response.content, 'html.parser')
             
@@ -449,25 +471,33 @@ class COEMAScraper(BaseScraper):
         return any(term in href_lower or term in text_lower for term in relevant_terms)
     
     def _process_document_link(self, url: str, title: str, headers: dict) -> Optional[Dict]:
-        """Processa um link de documento"""
+        """Processa um link de documento (PDFs ficam para o pipeline paralelo)"""
+        if url.lower().endswith('.pdf'):
+            self.pending_pdfs.setdefault(url, title)
+            return None
+            
         try:
             text = self._extract_document_text(url, url)
-            
-            if text and self.is_relevant_document(text):
-                return {
-                    'source': self.name,
-                    'url': url,
-                    'text': text,
-                    'title': title,
-                    'type': self._identify_document_type(title, text),
-                    'collected_at': datetime.now().isoformat(),
-                    'conselho': self._identify_council(text, title)
-                }
+            return self._build_document(url, title, text)
         except Exception as e:
             print(f"Erro ao processar documento {url}: {e}")
             
         return None
     
+    def _build_document(self, url: str, title: str, text: Optional[str]) -> Optional[Dict]:
+        """Monta o documento coletado, se o texto for relevante"""
+        if text and self.is_relevant_document(text):
+            return {
+                'source': self.name,
+                'url': url,
+                'text': text,
+                'title': title,
+                'type': self._identify_document_type(title, text),
+                'collected_at': datetime.now().isoformat(),
+                'conselho': self._identify_council(text, title)
+            }
+        return None
+    
     def _extract_page_title(self, soup: BeautifulSoup, url: str) -> str:
         """Extrai o título da página"""
         # Tentar diferentes elementos para o título
@@ -502,7 +532,6 @@ class COEMAScraper(BaseScraper):
                 if search_url not in self.visited_urls:
                     docs = self._extract_from_url(search_url, headers)
                     documents.extend(docs)
-                    time.sleep(1)
             except Exception as e:
                 continue
                 
@@ -515,32 +544,14 @@ class COEMAScraper(BaseScraper):
                 return self._extract_pdf_text(url)
             else:
                 # Para outros tipos, tenta extrair como HTML
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
+                self.polite_wait(url)
+                response = http_cache.get(self.session, url, timeout=10)
                 soup = BeautifulSoup(response.content, 'html.parser')
                 return soup.get_text(separator='\n', strip=True)
         except Exception as e:
             print(f"Erro ao extrair documento {url}: {e}")
             return None
             
-    def _extract_pdf_text(self, pdf_url: str) -> Optional[str]:
-        """Extrai texto de um PDF"""
-        try:
-            response = requests.get(pdf_url, timeout=20)
-            response.raise_for_status()
-            
-            pdf_file = io.BytesIO(response.content)
-            reader = pypdf.PdfReader(pdf_file)
-            
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-                
-            return text
-        except Exception as e:
-            print(f"Erro ao extrair PDF {pdf_url}: {e}")
-            return None
-            
     def _identify_document_type(self, title: str, text: str) -> str:
         """Identifica o tipo de documento"""
         title_lower = title.lower()
@@ -590,6 +601,9 @@ class COEMAScraper(BaseScraper):
 class ABNTScraper(BaseScraper):
     """Scraper para normas da ABNT - apenas normas vigentes"""
     
+    # A busca do catálogo é um formulário ASP.NET com postback: exige navegador
+    requires_browser = True
+    
     def __init__(self):
         super().__init__("ABNT", "https://www.abntcatalogo.com.br")
         self.environmental_terms = [
@@ -608,8 +622,8 @@ class ABNTScraper(BaseScraper):
             
             # Acessa a página principal do catálogo
             print("Acessando o catálogo ABNT...")
+            self.polite_wait(self.base_url)
             self.driver.get("https://www.abntcatalogo.com.br/pav.aspx")
-            time.sleep(5)
             
             for term in self.environmental_terms:
                 try:
@@ -651,8 +665,8 @@ class ABNTScraper(BaseScraper):
                     search_button = self.driver.find_element(By.ID, "cphPagina_cmdNM_Buscar")
                     search_button.click()
                     
-                    # Aguardar resultados
-                    time.sleep(5)
+                    # Aguardar o postback da busca recarregar a página
+                    self._wait_for_postback(search_button)
                     
                     # Extrair resultados
                     standards = self._extract_search_results()
@@ -661,8 +675,8 @@ class ABNTScraper(BaseScraper):
                     print(f"Encontradas {len(standards)} normas para o termo '{term}'")
                     
                     # Voltar para a página de busca para próximo termo
+                    self.polite_wait(self.base_url)
                     self.driver.get("https://www.abntcatalogo.com.br/pav.aspx")
-                    time.sleep(3)
                     
                 except Exception as e:
                     print(f"Erro ao buscar '{term}': {e}")
@@ -685,14 +699,21 @@ class ABNTScraper(BaseScraper):
                 
         return unique_documents
         
+    def _wait_for_postback(self, element, timeout: int = 15):
+        """Aguarda o elemento antigo sair da página e o novo documento terminar de carregar"""
+        try:
+            WebDriverWait(self.driver, timeout).until(EC.staleness_of(element))
+        except TimeoutException:
+            pass  # Postback parcial (UpdatePanel): a página não é recarregada
+        WebDriverWait(self.driver, timeout).until(
+            lambda driver: driver.execute_script("return document.readyState") == "complete"
+        )
+        
     def _extract_search_results(self) -> List[Dict]:
         """Extrai os resultados da busca"""
         standards = []
         
         try:
-            # Aguardar carregamento dos resultados
-            time.sleep(3)
-            
             # Procurar por tabelas de resultados ou listas
             result_tables = self.driver.find_elements(By.CSS_SELECTOR, "table")
             
@@ -813,34 +834,49 @@ class MultiSourceCollector:
             COEMAScraper(),
             ABNTScraper(),
         ]
+        self.scheduler = CollectionScheduler()
+        self.last_report: List[Dict] = []
         
     def add_scraper(self, scraper: BaseScraper):
         """Adiciona um novo scraper"""
         self.scrapers.append(scraper)
         
-    def collect_all_sources(self) -> List[Dict]:
-        """Coleta dados de todas as fontes"""
-        all_documents = []
-        
-        for scraper in self.scrapers:
-            print(f"\n=== Coletando de: {scraper.name} ===")
-            try:
-                documents = scraper.extract_documents()
-                all_documents.extend(documents)
-                print(f"Coletados {len(documents)} documentos de {scraper.name}")
-            except Exception as e:
-                print(f"Erro ao coletar de {scraper.name}: {e}")
+    def collect_all_sources(self, sources: Optional[List[str]] = None,
+                            output_file: Optional[str] = None) -> List[Dict]:
+        """
+        Coleta dados de todas as fontes (ou apenas das indicadas) ao mesmo tempo
+        
+        Args:
+            sources: Nomes das fontes a coletar. Se None, coleta de todas
+            output_file: Arquivo NDJSON onde os documentos de cada fonte são
+                         acrescentados assim que ela termina
+        """
+        scrapers = self.scrapers
+        if sources:
+            scrapers = [scraper for scraper in self.scrapers if scraper.name in sources]
+        
+        print(f"\n=== Coletando de {len(scrapers)} fontes: {', '.join(s.name for s in scrapers)} ===")
+        if not output_file:
+            all_documents, self.last_report = self.scheduler.run(scrapers)
+            return all_documents
+        
+        with NDJSONWriter(output_file, append=False) as writer:
+            def gravar(source: str, documents: List[Dict]):
+                writer.write_many(documents)
+                writer.flush()
+            
+            all_documents, self.last_report = self.scheduler.run(scrapers, on_documents=gravar)
+        print(f"Dados salvos em {output_file}")
                 
         return all_documents
         
-    def save_to_file(self, documents: List[Dict], filename: str = "multi_source_data.json"):
-        """Salva os documentos coletados em arquivo"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(documents, f, ensure_ascii=False, indent=2)
+    def save_to_file(self, documents: List[Dict], filename: str = "multi_source_data.ndjson"):
+        """Salva os documentos coletados em arquivo (NDJSON, um documento por linha)"""
+        filename = caminho_ndjson(filename)
+        write_records(filename, documents)
         print(f"Dados salvos em {filename}")
 
 if __name__ == "__main__":
     collector = MultiSourceCollector()
-    documents = collector.collect_all_sources()
-    collector.save_to_file(documents)
+    documents = collector.collect_all_sources(output_file=caminho_ndjson("multi_source_data"))
     print(f"\nTotal de documentos coletados: {len(documents)}")
\ No newline at end of file
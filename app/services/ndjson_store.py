@@ -0,0 +1,175 @@
+"""
+Armazenamento de registros em NDJSON (um JSON por linha), com compressão zstd opcional
+Os coletores gravam cada registro assim que ele é coletado e os indexadores
+leem sob demanda, sem carregar o arquivo inteiro em memória.
+Arquivos .json antigos (lista única) continuam legíveis.
+"""
+
+import io
+import os
+import json
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # Compressão é opcional
+    zstandard = None
+
+# Compressão padrão dos novos arquivos: "zstd" ou vazio (sem compressão)
+NDJSON_COMPRESSION = os.getenv("NDJSON_COMPRESSION", "").lower()
+
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl", ".ndjson.zst", ".jsonl.zst")
+
+
+def zstd_disponivel() -> bool:
+    """Compressão zstd depende do pacote opcional zstandard"""
+    return zstandard is not None
+
+
+def caminho_ndjson(base: str, compress: Optional[str] = None) -> str:
+    """
+    Caminho NDJSON equivalente a um nome base (ex.: backup.json -> backup.ndjson.zst).
+
+    Args:
+        base: Caminho com ou sem extensão
+        compress: "zstd" para comprimir; None usa NDJSON_COMPRESSION
+    """
+    compress = NDJSON_COMPRESSION if compress is None else compress
+    for ext in NDJSON_EXTENSIONS + (".json",):
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+            break
+    path = base + ".ndjson"
+    if compress == "zstd" and zstd_disponivel():
+        path += ".zst"
+    return path
+
+
+def resolver_arquivo(base: str) -> Optional[str]:
+    """Localiza o arquivo de registros para um nome base, preferindo NDJSON ao .json legado"""
+    raiz = caminho_ndjson(base, compress="")[:-len(".ndjson")]
+    for ext in (".ndjson.zst", ".ndjson", ".jsonl.zst", ".jsonl", ".json"):
+        if os.path.exists(raiz + ext):
+            return raiz + ext
+    return None
+
+
+def eh_arquivo_de_registros(nome: str) -> bool:
+    """Se o nome de arquivo tem uma extensão de registros (NDJSON ou .json legado)"""
+    return nome.endswith(NDJSON_EXTENSIONS + (".json",))
+
+
+class NDJSONWriter:
+    """Grava registros em NDJSON, um por linha, em modo de acréscimo"""
+
+    def __init__(self, path: str, append: bool = True):
+        self.path = path
+        self.append = append
+        self.count = 0
+        self._raw = None
+        self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self) -> "NDJSONWriter":
+        diretorio = os.path.dirname(self.path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        self._raw = open(self.path, "ab" if self.append else "wb")
+        if self.path.endswith(".zst"):
+            if not zstd_disponivel():
+                self._raw.close()
+                raise RuntimeError("Instale o pacote zstandard para gravar arquivos .zst")
+            # Cada sessão de escrita gera um frame zstd; frames concatenados são válidos
+            stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+            self._file = io.TextIOWrapper(stream, encoding="utf-8")
+        else:
+            self._file = io.TextIOWrapper(self._raw, encoding="utf-8")
+        return self
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Acrescenta um registro ao arquivo"""
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write("\n")
+        self.count += 1
+
+    def write_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Acrescenta vários registros e retorna quantos foram gravados"""
+        total = 0
+        for record in records:
+            self.write(record)
+            total += 1
+        return total
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def sync(self) -> None:
+        """Força a gravação em disco (fsync) do que já foi escrito"""
+        self._file.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            if not self._raw.closed:
+                self._raw.close()
+            self._file = None
+            self._raw = None
+
+
+def _abrir_texto(path: str):
+    if path.endswith(".zst"):
+        if not zstd_disponivel():
+            raise RuntimeError("Instale o pacote zstandard para ler arquivos .zst")
+        raw = open(path, "rb")
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lê os registros de um arquivo sob demanda.
+    NDJSON (comprimido ou não) é lido linha a linha; .json legado (lista) é carregado
+    de uma vez, apenas para compatibilidade.
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        yield from (data if isinstance(data, list) else [data])
+        return
+
+    with _abrir_texto(path) as f:
+        for numero, linha in enumerate(f, 1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                yield json.loads(linha)
+            except json.JSONDecodeError as e:
+                # Linha truncada (ex.: coleta interrompida): ignora e segue
+                print(f"⚠️ Registro inválido em {path}:{numero}: {e}")
+
+
+def write_records(path: str, records: Iterable[Dict[str, Any]], append: bool = False) -> int:
+    """Grava todos os registros em um arquivo NDJSON e retorna quantos foram gravados"""
+    with NDJSONWriter(path, append=append) as writer:
+        return writer.write_many(records)
+
+
+def batched(records: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Agrupa registros em lotes de tamanho fixo (o último pode ser menor)"""
+    iterator = iter(records)
+    while True:
+        lote = list(islice(iterator, size))
+        if not lote:
+            return
+        yield lote
@@ -0,0 +1,353 @@
+"""
+Registro compartilhado de clientes OpenAI
+Todo o processo usa um único pool HTTP (keep-alive, HTTP/2 quando o pacote h2
+está instalado) e limites por modelo: requisições simultâneas e tokens por minuto.
+Chamadas acima do limite esperam na fila em vez de receber erro 429 da API;
+stats() expõe as métricas da fila.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import httpx
+import openai
+from app.services.tokens import contar_tokens
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+
+# Limites por modelo: "modelo=simultâneas:tokens_por_minuto,..." (0 = sem limite de tokens)
+OPENAI_MODEL_LIMITS = os.getenv(
+    "OPENAI_MODEL_LIMITS",
+    "gpt-4o-mini=16:200000,o3=4:30000,text-embedding-3-small=8:1000000"
+)
+
+# Limite dos modelos não listados
+LIMITE_PADRAO = (8, 0)
+
+# Tokens de saída presumidos quando a chamada não informa max_tokens
+SAIDA_PRESUMIDA = 500
+
+# Embeddings de consultas guardados em memória (perguntas repetidas não voltam à API)
+EMBEDDING_QUERY_CACHE_SIZE = int(os.getenv("EMBEDDING_QUERY_CACHE_SIZE", "2000"))
+
+
+def _ler_limites(texto: str) -> Dict[str, Tuple[int, int]]:
+    limites = {}
+    for item in texto.split(","):
+        if "=" not in item:
+            continue
+        modelo, valores = item.split("=", 1)
+        simultaneas, _, tpm = valores.partition(":")
+        limites[modelo.strip()] = (max(1, int(simultaneas or 1)), int(tpm or 0))
+    return limites
+
+
+def _http2_disponivel() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ModelLimiter:
+    """Fila de um modelo: semáforo de requisições simultâneas + balde de tokens por minuto"""
+
+    def __init__(self, model: str, concurrency: int, tokens_per_minute: int = 0):
+        self.model = model
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self._semaforo = threading.BoundedSemaphore(concurrency)
+        self._condicao = threading.Condition()
+        self._tokens = float(tokens_per_minute)
+        self._atualizado = time.monotonic()
+        # Métricas
+        self.em_andamento = 0
+        self.esperando = 0
+        self.requisicoes = 0
+        self.erros_limite = 0
+        self.tokens_usados = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+
+    def _repor(self) -> None:
+        agora = time.monotonic()
+        self._tokens = min(float(self.tokens_per_minute),
+                           self._tokens + (agora - self._atualizado) * self.tokens_per_minute / 60.0)
+        self._atualizado = agora
+
+    def _reservar_tokens(self, tokens: int) -> None:
+        if not self.tokens_per_minute:
+            return
+        # Uma chamada maior que o balde inteiro espera apenas o balde encher
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._condicao:
+            while True:
+                self._repor()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                falta = (tokens - self._tokens) * 60.0 / self.tokens_per_minute
+                self._condicao.wait(timeout=falta)
+
+    def _ajustar_tokens(self, diferenca: int) -> None:
+        """Corrige o balde com o uso real informado pela API (pode ficar negativo)"""
+        if not self.tokens_per_minute or not diferenca:
+            return
+        with self._condicao:
+            self._tokens -= diferenca
+            self._condicao.notify_all()
+
+    @contextmanager
+    def slot(self, tokens_estimados: int = 0) -> Iterator["ModelLimiter"]:
+        """Aguarda vaga e tokens disponíveis para uma chamada ao modelo"""
+        inicio = time.monotonic()
+        with self._condicao:
+            self.esperando += 1
+        try:
+            self._semaforo.acquire()
+            try:
+                self._reservar_tokens(tokens_estimados)
+            except BaseException:
+                self._semaforo.release()
+                raise
+        finally:
+            espera = time.monotonic() - inicio
+            with self._condicao:
+                self.esperando -= 1
+                self.espera_total += espera
+                self.espera_maxima = max(self.espera_maxima, espera)
+
+        with self._condicao:
+            self.em_andamento += 1
+            self.requisicoes += 1
+        try:
+            yield self
+        except openai.RateLimitError:
+            with self._condicao:
+                self.erros_limite += 1
+            raise
+        finally:
+            with self._condicao:
+                self.em_andamento -= 1
+            self._semaforo.release()
+
+    def registrar_uso(self, tokens_estimados: int, tokens_reais: Optional[int]) -> None:
+        if tokens_reais is None:
+            tokens_reais = tokens_estimados
+        with self._condicao:
+            self.tokens_usados += tokens_reais
+        self._ajustar_tokens(tokens_reais - min(tokens_estimados, self.tokens_per_minute or tokens_estimados))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condicao:
+            return {
+                "concurrency": self.concurrency,
+                "tokens_per_minute": self.tokens_per_minute,
+                "in_flight": self.em_andamento,
+                "waiting": self.esperando,
+                "requests": self.requisicoes,
+                "rate_limit_errors": self.erros_limite,
+                "tokens_used": self.tokens_usados,
+                "avg_wait_seconds": round(self.espera_total / self.requisicoes, 4) if self.requisicoes else 0.0,
+                "max_wait_seconds": round(self.espera_maxima, 4)
+            }
+
+
+_limites_configurados = _ler_limites(OPENAI_MODEL_LIMITS)
+_limiters: Dict[str, ModelLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model: str) -> ModelLimiter:
+    """Fila compartilhada do modelo (criada no primeiro uso)"""
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            concorrencia, tpm = _limites_configurados.get(model, LIMITE_PADRAO)
+            limiter = _limiters[model] = ModelLimiter(model, concorrencia, tpm)
+        return limiter
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """Pool HTTP do processo, reaproveitado por todos os clientes (evita novos handshakes TLS)"""
+    return httpx.Client(
+        http2=_http2_disponivel(),
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENAI_MAX_KEEPALIVE),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0)
+    )
+
+
+@lru_cache(maxsize=None)
+def get_client(api_key: Optional[str] = None) -> openai.OpenAI:
+    """Cliente OpenAI sobre o pool compartilhado (um por chave de API)"""
+    return openai.OpenAI(
+        api_key=api_key or os.getenv("OPENAI_API_KEY"),
+        http_client=get_http_client(),
+        max_retries=OPENAI_MAX_RETRIES
+    )
+
+
+def _tokens_mensagens(messages: List[Dict[str, Any]], model: str) -> int:
+    return sum(4 + contar_tokens(str(m.get("content") or ""), model) for m in messages)
+
+
+def chat_completion(model: str, messages: List[Dict[str, Any]], api_key: Optional[str] = None, **kwargs):
+    """
+    chat.completions.create respeitando os limites do modelo.
+
+    Args:
+        model: Modelo (define a fila)
+        messages: Mensagens no formato da API
+        api_key: Chave alternativa (padrão: OPENAI_API_KEY)
+        **kwargs: Demais parâmetros da API (temperature, max_tokens...)
+    """
+    limiter = get_limiter(model)
+    saida = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or SAIDA_PRESUMIDA
+    estimados = _tokens_mensagens(messages, model) + saida
+    with limiter.slot(estimados):
+        response = get_client(api_key).chat.completions.create(model=model, messages=messages, **kwargs)
+    usage = getattr(response, "usage", None)
+    limiter.registrar_uso(estimados, getattr(usage, "total_tokens", None))
+    return response
+
+
+def create_embeddings(model: str, textos, api_key: Optional[str] = None):
+    """embeddings.create respeitando os limites do modelo"""
+    limiter = get_limiter(model)
+    lista = [textos] if isinstance(textos, str) else list(textos)
+    estimados = sum(contar_tokens(texto, model) for texto in lista)
+    with limiter.slot(estimados):
+        response = get_client(api_key).embeddings.create(input=textos, model=model)
+    usage = getattr(response, "usage", None)
+    limiter.registrar_uso(estimados, getattr(usage, "total_tokens", None))
+    return response
+
+
+class QueryEmbeddingCache:
+    """LRU de embeddings de consultas, por modelo e texto"""
+
+    def __init__(self, max_entries: int = EMBEDDING_QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._dados: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, texto: str) -> Optional[List[float]]:
+        with self._lock:
+            vetor = self._dados.get((model, texto))
+            if vetor is None:
+                self.misses += 1
+                return None
+            self._dados.move_to_end((model, texto))
+            self.hits += 1
+            return vetor
+
+    def put(self, model: str, texto: str, vetor: List[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._dados[(model, texto)] = vetor
+            self._dados.move_to_end((model, texto))
+            while len(self._dados) > self.max_entries:
+                self._dados.popitem(last=False)
+
+    def missing(self, model: str, textos: List[str]) -> List[str]:
+        """Textos (sem repetição) que ainda não estão no cache"""
+        with self._lock:
+            return [t for t in dict.fromkeys(textos) if (model, t) not in self._dados]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._dados), "hits": self.hits, "misses": self.misses}
+
+
+query_embedding_cache = QueryEmbeddingCache()
+
+
+@lru_cache(maxsize=None)
+def _classes_langchain():
+    """Subclasses do LangChain que passam pelas filas (importadas só quando usadas)"""
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+    class LimitedChatOpenAI(ChatOpenAI):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            estimados = sum(4 + contar_tokens(str(m.content), self.model_name) for m in messages) \
+                + (self.max_tokens or SAIDA_PRESUMIDA)
+            limiter = get_limiter(self.model_name)
+            with limiter.slot(estimados):
+                resultado = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            usage = (resultado.llm_output or {}).get("token_usage") or {}
+            limiter.registrar_uso(estimados, usage.get("total_tokens"))
+            return resultado
+
+    class LimitedOpenAIEmbeddings(OpenAIEmbeddings):
+        def embed_documents(self, texts, chunk_size=None, **kwargs):
+            estimados = sum(contar_tokens(texto, self.model) for texto in texts)
+            with get_limiter(self.model).slot(estimados):
+                vetores = super().embed_documents(texts, chunk_size, **kwargs)
+            get_limiter(self.model).registrar_uso(estimados, None)
+            return vetores
+
+        def embed_query(self, text, **kwargs):
+            vetor = query_embedding_cache.get(self.model, text)
+            if vetor is None:
+                vetor = self.embed_documents([text], **kwargs)[0]
+                query_embedding_cache.put(self.model, text, vetor)
+            return vetor
+
+    return LimitedChatOpenAI, LimitedOpenAIEmbeddings
+
+
+def chat_model(model: str, **kwargs):
+    """ChatOpenAI (LangChain) sobre o pool compartilhado e a fila do modelo"""
+    classe, _ = _classes_langchain()
+    kwargs.setdefault("api_key", os.getenv("OPENAI_API_KEY"))
+    return classe(model=model, http_client=get_http_client(), max_retries=OPENAI_MAX_RETRIES, **kwargs)
+
+
+def embeddings_model(model: str, **kwargs):
+    """OpenAIEmbeddings (LangChain) sobre o pool compartilhado e a fila do modelo"""
+    _, classe = _classes_langchain()
+    return classe(model=model, http_client=get_http_client(), max_retries=OPENAI_MAX_RETRIES, **kwargs)
+
+
+def prime_query_embeddings(embeddings, textos: List[str]) -> int:
+    """
+    Pré-calcula embeddings de consultas esperadas (ex.: perguntas frequentes) em lote.
+
+    Args:
+        embeddings: Instância criada por embeddings_model
+        textos: Consultas, exatamente como serão passadas a embed_query
+
+    Returns:
+        int: Quantidade de embeddings novos no cache
+    """
+    faltando = query_embedding_cache.missing(embeddings.model, textos)
+    if not faltando:
+        return 0
+    for texto, vetor in zip(faltando, embeddings.embed_documents(faltando)):
+        query_embedding_cache.put(embeddings.model, texto, vetor)
+    return len(faltando)
+
+
+def stats() -> Dict[str, Any]:
+    """Métricas das filas por modelo"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {
+        "http2": _http2_disponivel(),
+        "max_connections": OPENAI_MAX_CONNECTIONS,
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "models": {model: limiter.stats() for model, limiter in limiters.items()}
+    }
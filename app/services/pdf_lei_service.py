@@ -5,7 +5,6 @@ do site da Assembleia Legislativa do Tocantins
 
 import os
 import requests
-import time
 from selenium import webdriver
 from selenium.webdriver.edge.options import Options as EdgeOptions
 from selenium.webdriver.chrome.options import Options as ChromeOptions
@@ -18,17 +17,30 @@ from webdriver_manager.microsoft import EdgeChromiumDriverManager
 from selenium.webdriver.edge.service import Service as EdgeService
 from selenium.webdriver.chrome.service import Service as ChromeService
 from bs4 import BeautifulSoup
-import pypdf
-import io
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional
 import re
 from app.services.leis_html_service import PALAVRAS_CHAVE_EXATAS, SIGLAS_MAIUSCULAS, contem_palavra_chave
+from app.services.async_crawler import fetch_pages
+from app.services.pdf_pipeline import PDFPipeline, extrair_texto_pdf
+from app.services.http_cache import http_cache
+
+# Páginas de listagem baixadas em paralelo a cada lote
+LISTING_BATCH_SIZE = 20
+
+def pagina_tem_listagem(html_content: Optional[str]) -> bool:
+    """Verifica se o HTML recebido contém os blocos da listagem de leis"""
+    if not html_content:
+        return False
+    soup = BeautifulSoup(html_content, "html.parser")
+    return soup.find("div", class_="col-12") is not None
 
 class PDFLeiCollector:
     """Coletor de PDFs das leis ambientais"""
     
-    def __init__(self):
+    def __init__(self, browser_fallback: bool = True):
         self.base_url = "https://www.al.to.leg.br/legislacaoEstadual"
+        # Selenium só é usado para páginas que não vierem completas via HTTP
+        self.browser_fallback = browser_fallback
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -162,71 +174,97 @@ class PDFLeiCollector:
         try:
             print(f"Baixando PDF: {pdf_url}")
             
-            response = self.session.get(pdf_url, timeout=30)
-            response.raise_for_status()
+            response = http_cache.get(self.session, pdf_url, timeout=30)
             
             # Verifica se é realmente um PDF
             if 'application/pdf' not in response.headers.get('content-type', ''):
                 print(f"URL não é um PDF válido: {pdf_url}")
                 return None
             
-            # Extrai texto do PDF
-            pdf_file = io.BytesIO(response.content)
-            pdf_reader = pypdf.PdfReader(pdf_file)
-            
-            texto_completo = ""
-            for page in pdf_reader.pages:
-                texto_completo += page.extract_text() + "\n"
-            
-            return texto_completo.strip()
+            # Extrai texto do PDF (reaproveitado se o conteúdo não mudou)
+            return http_cache.pdf_text(response.content, extrair_texto_pdf)
             
         except Exception as e:
             print(f"Erro ao baixar/processar PDF {pdf_url}: {e}")
             return None
     
-    def collect_all_pdf_laws(self, max_pages: int = 250) -> List[Dict]:
-        """Coleta todas as leis ambientais com conteúdo completo dos PDFs"""
-        driver = self.setup_driver()
-        leis_completas = []
+    def fetch_page_with_browser(self, driver, url: str) -> str:
+        """Fallback explícito: carrega a página de listagem no navegador"""
+        driver.get(url)
+        WebDriverWait(driver, 15).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+        return driver.page_source
+    
+    def iter_leis_com_pdf(self, max_pages: int) -> Iterator[Dict]:
+        """Percorre as páginas de listagem e gera as leis ambientais com links de PDF"""
+        driver = None
+        page_urls = [f"{self.base_url}?pagPaginaAtual={pagina}" for pagina in range(1, max_pages + 1)]
         
         try:
-            for pagina in range(1, max_pages + 1):
-                print(f"Processando página {pagina}/{max_pages}")
-                
-                url = f"{self.base_url}?pagPaginaAtual={pagina}"
-                driver.get(url)
-                time.sleep(3)  # Aguarda carregamento
+            # As listagens são baixadas em lotes via HTTP assíncrono
+            for inicio in range(0, len(page_urls), LISTING_BATCH_SIZE):
+                lote = page_urls[inicio:inicio + LISTING_BATCH_SIZE]
+                pages = fetch_pages(lote, cache=http_cache)
                 
-                html_content = driver.page_source
-                leis_com_pdf = self.extract_pdf_links_from_page(html_content)
-                
-                for lei in leis_com_pdf:
-                    print(f"Processando lei: {lei['titulo'][:50]}...")
-                    
-                    # Tenta baixar o conteúdo de cada PDF
-                    conteudo_completo = lei['conteudo_preview']
+                for pagina, url in enumerate(lote, start=inicio + 1):
+                    print(f"Processando página {pagina}/{max_pages}")
                     
-                    for pdf_url in lei['pdf_links']:
-                        pdf_content = self.download_pdf_content(pdf_url)
-                        if pdf_content:
-                            conteudo_completo = pdf_content
-                            break  # Usa o primeiro PDF que conseguir baixar
+                    html_content = pages.get(url)
+                    if not pagina_tem_listagem(html_content) and self.browser_fallback:
+                        print(f"Listagem indisponível via HTTP, usando navegador: {url}")
+                        if driver is None:
+                            driver = self.setup_driver()
+                        html_content = self.fetch_page_with_browser(driver, url)
                     
-                    lei_completa = {
-                        "titulo": lei['titulo'],
-                        "descricao": lei['descricao'],
-                        "conteudo": conteudo_completo,
-                        "fonte": "PDF" if conteudo_completo != lei['conteudo_preview'] else "HTML",
-                        "pdf_links": lei['pdf_links']
-                    }
-                    
-                    leis_completas.append(lei_completa)
-                
-                # Pequena pausa entre páginas
-                time.sleep(2)
+                    if html_content:
+                        yield from self.extract_pdf_links_from_page(html_content)
                 
         finally:
-            driver.quit()
+            if driver is not None:
+                driver.quit()
+    
+    def collect_all_pdf_laws(self, max_pages: int = 250) -> List[Dict]:
+        """Coleta todas as leis ambientais com conteúdo completo dos PDFs"""
+        leis = []
+        conteudos: Dict[int, str] = {}
+        pipeline = PDFPipeline(session=self.session, timeout=30, require_pdf=True, cache=http_cache)
+        
+        def primeiros_links():
+            # A listagem alimenta o pipeline enquanto ainda está sendo percorrida
+            for lei in self.iter_leis_com_pdf(max_pages):
+                print(f"Processando lei: {lei['titulo'][:50]}...")
+                leis.append(lei)
+                yield lei['pdf_links'][0]
+        
+        # Cada rodada tenta o próximo link apenas das leis cujo PDF ainda falhou
+        tentativa = 0
+        urls = primeiros_links()
+        while True:
+            textos = pipeline.process_all(urls)
+            for i, lei in enumerate(leis):
+                if i not in conteudos and tentativa < len(lei['pdf_links']):
+                    texto = textos.get(lei['pdf_links'][tentativa])
+                    if texto:
+                        conteudos[i] = texto
+            
+            tentativa += 1
+            restantes = [lei['pdf_links'][tentativa] for i, lei in enumerate(leis)
+                         if i not in conteudos and tentativa < len(lei['pdf_links'])]
+            if not restantes:
+                break
+            urls = restantes
+        
+        leis_completas = []
+        for i, lei in enumerate(leis):
+            conteudo_completo = conteudos.get(i, lei['conteudo_preview'])
+            leis_completas.append({
+                "titulo": lei['titulo'],
+                "descricao": lei['descricao'],
+                "conteudo": conteudo_completo,
+                "fonte": "PDF" if i in conteudos else "HTML",
+                "pdf_links": lei['pdf_links']
+            })
         
         return leis_completas
 
@@ -0,0 +1,244 @@
+"""
+Pipeline paralelo de download e extração de PDFs para os coletores de leis
+Downloads rodam em um pool de threads (I/O) e a extração de texto com pypdf
+em um pool de processos (CPU, fora do GIL), ligados por filas limitadas. O pool
+de processos é único no processo e compartilhado pelos pipelines de todas as
+fontes coletadas em paralelo, então o total de processos fica em PDF_EXTRACT_WORKERS
+"""
+
+import io
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+import pypdf
+import requests
+from requests.adapters import HTTPAdapter
+from app.services.http_cache import HTTPCache, hash_conteudo
+
+DOWNLOAD_WORKERS = int(os.getenv("PDF_DOWNLOAD_WORKERS", "8"))
+EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+# Tamanho das filas entre os estágios (backpressure)
+QUEUE_SIZE = int(os.getenv("PDF_PIPELINE_QUEUE_SIZE", "16"))
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+_FIM = object()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def extrair_texto_pdf(content: bytes) -> str:
+    """Extrai o texto de todas as páginas de um PDF (roda nos processos de extração)"""
+    reader = pypdf.PdfReader(io.BytesIO(content))
+    return "\n".join(page.extract_text() or "" for page in reader.pages).strip()
+
+
+def pool_de_extracao() -> ProcessPoolExecutor:
+    """Pool de processos compartilhado pelos pipelines (criado no primeiro uso)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, EXTRACT_WORKERS))
+        return _pool
+
+
+def descartar_pool(executor: ProcessPoolExecutor) -> None:
+    """Tira de uso um pool quebrado (ex.: processo morto); o próximo pipeline cria outro"""
+    global _pool
+    with _pool_lock:
+        if _pool is executor:
+            _pool = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PDFPipeline:
+    """Baixa e extrai PDFs em paralelo, entregando (url, texto) à medida que ficam prontos"""
+
+    def __init__(self, download_workers: int = DOWNLOAD_WORKERS, extract_workers: int = EXTRACT_WORKERS,
+                 queue_size: int = QUEUE_SIZE, session: Optional[requests.Session] = None,
+                 rate_limiter=None, timeout: int = 60, require_pdf: bool = False,
+                 cache: Optional[HTTPCache] = None):
+        self.download_workers = max(1, download_workers)
+        # Extrações simultâneas deste pipeline no pool compartilhado
+        self.extract_workers = max(1, extract_workers)
+        self.queue_size = max(1, queue_size)
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.require_pdf = require_pdf
+        # Com cache: downloads condicionais (304) e texto reaproveitado pelo hash do PDF
+        self.cache = cache
+
+        if session is None:
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            adapter = HTTPAdapter(pool_connections=self.download_workers, pool_maxsize=self.download_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+    def download(self, url: str) -> Optional[bytes]:
+        """Baixa o conteúdo de um PDF (None se falhar ou não for PDF)"""
+        try:
+            if self.rate_limiter:
+                self.rate_limiter.wait(url)
+
+            print(f"Baixando PDF: {url}")
+            if self.cache:
+                response = self.cache.get(self.session, url, timeout=self.timeout)
+            else:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+
+            if self.require_pdf and 'application/pdf' not in response.headers.get('content-type', '') \
+                    and not response.content.startswith(b'%PDF'):
+                print(f"URL não é um PDF válido: {url}")
+                return None
+
+            return response.content
+        except Exception as e:
+            print(f"Erro ao baixar PDF {url}: {e}")
+            return None
+
+    def process(self, urls: Iterable[str]) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Processa as URLs em pipeline. A entrada pode ser um gerador: ela é consumida
+        sob demanda, conforme há espaço na fila de downloads.
+
+        Yields:
+            Tuple[str, Optional[str]]: (url, texto extraído ou None), fora de ordem
+        """
+        url_queue = queue.Queue(maxsize=self.queue_size)
+        pdf_queue = queue.Queue(maxsize=self.queue_size)
+        result_queue = queue.Queue()
+        # Limita PDFs em extração simultânea para não acumular bytes em memória
+        limite_extracao = self.extract_workers * 2
+        em_extracao = threading.BoundedSemaphore(limite_extracao)
+        # Sinalizado quando o consumidor abandona o gerador ou um estágio falha:
+        # os estágios param de trabalhar e só esvaziam as filas até o fim
+        parar = threading.Event()
+        falha = []
+        # Extrações deste pipeline ainda no pool (canceladas se o consumidor desistir)
+        futures = set()
+        futures_lock = threading.Lock()
+        executor = pool_de_extracao()
+
+        def alimentar():
+            try:
+                vistos = set()
+                for url in urls:
+                    if parar.is_set():
+                        break
+                    if url and url not in vistos:
+                        vistos.add(url)
+                        url_queue.put(url)
+            except Exception as e:
+                falha.append(e)
+            finally:
+                for _ in range(self.download_workers):
+                    url_queue.put(_FIM)
+
+        def baixar():
+            while True:
+                url = url_queue.get()
+                if url is _FIM:
+                    pdf_queue.put(_FIM)
+                    return
+                pdf_queue.put((url, None if parar.is_set() else self.download(url)))
+
+        def extrair():
+            finalizados = 0
+            try:
+                while finalizados < self.download_workers:
+                    item = pdf_queue.get()
+                    if item is _FIM:
+                        finalizados += 1
+                        continue
+
+                    url, content = item
+                    if parar.is_set():
+                        continue
+                    if not content:
+                        result_queue.put((url, None))
+                        continue
+
+                    content_hash = hash_conteudo(content)
+                    if self.cache:
+                        texto = self.cache.get_pdf_text(content_hash)
+                        if texto is not None:
+                            result_queue.put((url, texto))
+                            continue
+
+                    em_extracao.acquire()
+                    try:
+                        future = executor.submit(extrair_texto_pdf, content)
+                    except BaseException:
+                        em_extracao.release()
+                        raise
+                    with futures_lock:
+                        futures.add(future)
+                    future.add_done_callback(lambda f, url=url, h=content_hash: entregar(url, h, f))
+
+                # Aguarda as extrações em andamento antes de sinalizar o fim
+                for _ in range(limite_extracao):
+                    em_extracao.acquire()
+            except Exception as e:
+                # Ex.: BrokenProcessPool; o erro chega ao consumidor após o fim
+                if isinstance(e, BrokenProcessPool):
+                    descartar_pool(executor)
+                falha.append(e)
+                parar.set()
+                # Libera os downloads que aguardam espaço na fila
+                while finalizados < self.download_workers:
+                    if pdf_queue.get() is _FIM:
+                        finalizados += 1
+            finally:
+                result_queue.put(_FIM)
+
+        def entregar(url, content_hash, future):
+            with futures_lock:
+                futures.discard(future)
+            texto = None
+            try:
+                if not future.cancelled():
+                    texto = future.result()
+                    if texto and self.cache:
+                        self.cache.put_pdf_text(content_hash, texto)
+            except Exception as e:
+                print(f"Erro ao extrair texto do PDF {url}: {e}")
+                texto = None
+            result_queue.put((url, texto or None))
+            em_extracao.release()
+
+        threads = [threading.Thread(target=alimentar, daemon=True),
+                   threading.Thread(target=extrair, daemon=True)]
+        threads += [threading.Thread(target=baixar, daemon=True) for _ in range(self.download_workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = result_queue.get()
+                if item is _FIM:
+                    break
+                yield item
+        finally:
+            # Consumidor abandonou o gerador (ou fim normal): nada novo é enviado ao pool e
+            # as extrações deste pipeline que ainda não começaram são canceladas (o pool segue)
+            parar.set()
+            with futures_lock:
+                restantes = list(futures)
+            for future in restantes:
+                future.cancel()
+
+        if falha:
+            raise falha[0]
+
+    def process_all(self, urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Processa todas as URLs e retorna um dicionário url -> texto"""
+        return dict(self.process(urls))
@@ -1,35 +1,228 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Optional, Union
 import PyPDF2
 import io
+import os
+import mmap
+import hashlib
+import atexit
+import tempfile
+import json
+import asyncio
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from app.services.legal_chunker import LegalChunker, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# Processos dedicados à extração de texto e páginas por tarefa
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(os.cpu_count() or 2)))
+PAGINAS_POR_TAREFA = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+
+# Limite de tamanho dos uploads e tamanho de cada leitura ao gravá-los em disco
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_READ_CHUNK = int(os.getenv("UPLOAD_READ_CHUNK", str(1024 * 1024)))
+
+# Folga para os cabeçalhos e campos do multipart além do próprio arquivo
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+# Diretório dos arquivos temporários de upload (None = padrão do sistema)
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+# PDF em memória (bytes) ou caminho de arquivo em disco
+OrigemPDF = Union[bytes, str]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Pool de processos compartilhado, criado no primeiro upload"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, PDF_PARSE_WORKERS))
+        return _pool
+
+
+@atexit.register
+def shutdown_pool() -> None:
+    """Encerra o pool de processos de extração"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+@contextmanager
+def abrir_pdf(origem: OrigemPDF) -> Iterator[PyPDF2.PdfReader]:
+    """Leitor do PDF; arquivos em disco são mapeados em memória em vez de copiados"""
+    if isinstance(origem, (bytes, bytearray)):
+        yield PyPDF2.PdfReader(io.BytesIO(origem))
+        return
+    
+    with open(origem, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        yield PyPDF2.PdfReader(buffer)
+
+
+def contar_paginas(origem: OrigemPDF) -> int:
+    """Número de páginas do PDF (lê apenas a estrutura, sem extrair texto)"""
+    with abrir_pdf(origem) as reader:
+        return len(reader.pages)
+
+
+def extrair_intervalo(origem: OrigemPDF, inicio: int, fim: int) -> List[str]:
+    """Extrai o texto das páginas [inicio, fim) — executado nos processos do pool"""
+    with abrir_pdf(origem) as reader:
+        return [reader.pages[i].extract_text() or "" for i in range(inicio, min(fim, len(reader.pages)))]
+
+
+class UploadMuitoGrande(Exception):
+    """Upload acima do limite configurado (UPLOAD_MAX_BYTES)"""
+
+
+def _mensagem_limite(max_bytes: int) -> str:
+    return f"Arquivo maior que o limite de {max_bytes // (1024 * 1024)} MB"
+
+
+class LimiteDeUpload:
+    """
+    Middleware ASGI que recusa uploads grandes antes de o formulário ser lido.
+    O Starlette grava o multipart inteiro antes de chamar a rota; aqui o
+    Content-Length é conferido de antemão e, sem ele (chunked), os bytes do corpo
+    são contados à medida que chegam.
+    """
+
+    def __init__(self, app, prefixo: str = "/documents/upload", max_bytes: int = UPLOAD_MAX_BYTES):
+        self.app = app
+        self.prefixo = prefixo
+        self.limite = max_bytes + UPLOAD_FORM_OVERHEAD
+        self.mensagem = _mensagem_limite(max_bytes)
+
+    async def _recusar(self, send) -> None:
+        corpo = json.dumps({"detail": self.mensagem}, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(corpo)).encode())]})
+        await send({"type": "http.response.body", "body": corpo})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.prefixo):
+            await self.app(scope, receive, send)
+            return
+
+        tamanho = dict(scope["headers"]).get(b"content-length")
+        if tamanho is not None and tamanho.isdigit() and int(tamanho) > self.limite:
+            await self._recusar(send)
+            return
+
+        recebidos = 0
+        excedeu = respondido = False
+
+        async def receber():
+            nonlocal recebidos, excedeu
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebidos += len(mensagem.get("body", b""))
+                if recebidos > self.limite:
+                    excedeu = True
+                    raise UploadMuitoGrande(self.mensagem)
+            return mensagem
+
+        async def enviar(mensagem):
+            nonlocal respondido
+            # O FastAPI transforma erros na leitura do corpo em 400: a resposta vira 413
+            if excedeu:
+                if mensagem["type"] == "http.response.start" and not respondido:
+                    respondido = True
+                    await self._recusar(send)
+                return
+            respondido = respondido or mensagem["type"] == "http.response.start"
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receber, enviar)
+        except UploadMuitoGrande:
+            if respondido:
+                return
+            await self._recusar(send)
+
+
+class UploadTemporario:
+    """PDF enviado gravado em arquivo temporário; removido ao sair do contexto"""
+    
+    def __init__(self, path: str, size: int, sha256: str = ""):
+        self.path = path
+        self.size = size
+        # Hash do conteúdo, calculado durante a gravação (chave do cache de uploads)
+        self.sha256 = sha256
+    
+    def __enter__(self) -> "UploadTemporario":
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def close(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def salvar_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> UploadTemporario:
+    """Grava o upload em disco por partes, sem carregar o arquivo inteiro em memória
+    
+    Args:
+        file: Arquivo enviado pelo usuário
+        max_bytes: Tamanho máximo aceito
+        
+    Returns:
+        UploadTemporario: Caminho, tamanho e SHA-256 do arquivo gravado
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadMuitoGrande(_mensagem_limite(max_bytes))
+    
+    destino = tempfile.NamedTemporaryFile(prefix="upload_", suffix=".pdf", dir=UPLOAD_TMP_DIR, delete=False)
+    upload = UploadTemporario(destino.name, 0)
+    digest = hashlib.sha256()
+    try:
+        with destino:
+            while True:
+                parte = await file.read(UPLOAD_READ_CHUNK)
+                if not parte:
+                    break
+                upload.size += len(parte)
+                if upload.size > max_bytes:
+                    raise UploadMuitoGrande(_mensagem_limite(max_bytes))
+                digest.update(parte)
+                await run_in_threadpool(destino.write, parte)
+    except BaseException:
+        upload.close()
+        raise
+    
+    upload.sha256 = digest.hexdigest()
+    return upload
+
 
 class PDFService:
     """Serviço para processamento de arquivos PDF"""
     
     @staticmethod
-    def extract_text_from_bytes(content: bytes) -> str:
-        """Extrai texto de um arquivo PDF a partir de bytes
+    def extract_text_from_bytes(content: OrigemPDF) -> str:
+        """Extrai texto de um arquivo PDF a partir de bytes ou de um caminho
         
         Args:
-            content: Conteúdo do arquivo PDF em bytes
+            content: Conteúdo do arquivo PDF em bytes ou caminho do arquivo
             
         Returns:
             str: Texto extraído do PDF
         """
         try:
-            # Cria um objeto BytesIO para o PyPDF2
-            pdf_file = io.BytesIO(content)
-            
-            # Cria o leitor PDF
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
             # Extrai texto de todas as páginas
-            text = ""
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
-            
-            return text.strip()
+            with abrir_pdf(content) as pdf_reader:
+                return "\n".join(page.extract_text() or "" for page in pdf_reader.pages).strip()
             
         except Exception as e:
             raise Exception(f"Erro ao extrair texto do PDF: {str(e)}")
@@ -45,11 +238,12 @@ class PDFService:
             str: Texto extraído do PDF
         """
         try:
-            # Lê o conteúdo do arquivo
-            content = await file.read()
-            
-            # Usa o método síncrono para extrair texto
-            return PDFService.extract_text_from_bytes(content)
+            # Lê direto do arquivo temporário do upload, sem copiá-lo para bytes
+            await file.seek(0)
+            # PdfReader lê a estrutura do arquivo na construção: também fora do event loop
+            return await run_in_threadpool(
+                lambda: "\n".join(page.extract_text() or "" for page in PyPDF2.PdfReader(file.file).pages).strip()
+            )
             
         except Exception as e:
             raise Exception(f"Erro ao extrair texto do PDF: {str(e)}")
@@ -58,46 +252,22 @@ class PDFService:
             await file.seek(0)
     
     @staticmethod
-    def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
+    def chunk_text(text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                   overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
         """Divide o texto em chunks menores para processamento
         
         Args:
             text: Texto a ser dividido
-            chunk_size: Tamanho máximo de cada chunk
-            overlap: Sobreposição entre chunks
+            max_tokens: Tamanho máximo de cada chunk, em tokens do modelo de embeddings
+            overlap_tokens: Sobreposição ao quebrar um mesmo dispositivo
             
         Returns:
-            List[str]: Lista de chunks de texto
+            List[str]: Lista de chunks de texto (quebrados por artigo, parágrafo, inciso e alínea)
         """
         if not text:
             return []
         
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            # Define o fim do chunk
-            end = start + chunk_size
-            
-            # Se não é o último chunk, tenta quebrar em uma palavra
-            if end < len(text):
-                # Procura por espaço ou quebra de linha próxima
-                while end > start and text[end] not in [' ', '\n', '.', '!', '?']:
-                    end -= 1
-                
-                # Se não encontrou um bom ponto de quebra, usa o tamanho original
-                if end == start:
-                    end = start + chunk_size
-            
-            # Adiciona o chunk
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            # Move o início para o próximo chunk com sobreposição
-            start = end - overlap if end < len(text) else end
-        
-        return chunks
+        return LegalChunker(max_tokens, overlap_tokens).split_text(text)
     
     @staticmethod
     def process_pdf(content: bytes) -> List[str]:
@@ -121,6 +291,58 @@ class PDFService:
         except Exception as e:
             raise Exception(f"Erro ao processar PDF: {str(e)}")
     
+    @staticmethod
+    async def extract_text_parallel(content: OrigemPDF,
+                                    on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """Extrai o texto em paralelo, por intervalos de páginas, fora do event loop
+        
+        Args:
+            content: Caminho do PDF (preferível: cada processo mapeia o arquivo) ou bytes
+            on_progress: Chamado com (páginas concluídas, total de páginas) a cada intervalo
+            
+        Returns:
+            str: Texto extraído do PDF, na ordem das páginas
+        """
+        loop = asyncio.get_running_loop()
+        pool = _get_pool()
+        total = await loop.run_in_executor(pool, contar_paginas, content)
+        
+        intervalos = [(inicio, min(inicio + PAGINAS_POR_TAREFA, total))
+                      for inicio in range(0, total, PAGINAS_POR_TAREFA)]
+        
+        async def extrair(indice: int, inicio: int, fim: int):
+            return indice, await loop.run_in_executor(pool, extrair_intervalo, content, inicio, fim)
+        
+        # Intervalos terminam fora de ordem; cada um guarda sua posição para o join final
+        paginas_por_intervalo: List[List[str]] = [[] for _ in intervalos]
+        concluidas = 0
+        for tarefa in asyncio.as_completed([extrair(i, inicio, fim) for i, (inicio, fim) in enumerate(intervalos)]):
+            indice, paginas = await tarefa
+            paginas_por_intervalo[indice] = paginas
+            concluidas += len(paginas)
+            if on_progress:
+                on_progress(concluidas, total)
+        
+        return "\n".join(pagina for paginas in paginas_por_intervalo for pagina in paginas).strip()
+    
+    @staticmethod
+    async def process_pdf_async(content: OrigemPDF,
+                                on_progress: Optional[Callable[[int, int], None]] = None) -> List[str]:
+        """Versão assíncrona de process_pdf: extração no pool de processos, chunking em thread
+        
+        Args:
+            content: Caminho do PDF em disco ou conteúdo em bytes
+            on_progress: Chamado com (páginas concluídas, total de páginas)
+            
+        Returns:
+            List[str]: Lista de chunks de texto extraídos
+        """
+        try:
+            text = await PDFService.extract_text_parallel(content, on_progress)
+            return await run_in_threadpool(PDFService.chunk_text, text)
+        except Exception as e:
+            raise Exception(f"Erro ao processar PDF: {str(e)}")
+    
     @staticmethod
     async def process_pdf_upload(file: UploadFile) -> Dict[str, Any]:
         """Processa um arquivo PDF completo
@@ -1,18 +1,29 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone
 import os
+from app.services.openai_clients import embeddings_model
+from app.services.container import services
 
 index_name = os.getenv("PINECONE_INDEX_NAME", "leis-ambientais")
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-vectorstore = PineconeVectorStore(index_name=index_name, embedding=embeddings)
+
+
+def _criar_vectorstore():
+    from langchain_pinecone import PineconeVectorStore
+    return PineconeVectorStore(index_name=index_name, embedding=services.get("embeddings"))
+
+
+def _criar_pinecone_index():
+    from pinecone import Pinecone
+    return Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(index_name)
+
+
+# Criados no primeiro uso (ver container); os nomes do módulo são proxies
+embeddings = services.register("embeddings", lambda: embeddings_model("text-embedding-3-small"))
+vectorstore = services.register("vectorstore", _criar_vectorstore)
 
 # Conexão direta com Pinecone para busca com namespace
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-pinecone_index = pc.Index(index_name)
+pinecone_index = services.register("pinecone_index", _criar_pinecone_index)
 
 def search_similar_documents(texto: str, top_k: int = 5):
     """Busca documentos similares incluindo normas ABNT"""
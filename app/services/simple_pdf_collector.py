@@ -5,12 +5,16 @@ Usa apenas requests para acessar as páginas e baixar PDFs
 
 import requests
 import json
-import io
 import re
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional
 from bs4 import BeautifulSoup
-import pypdf
 from app.services.leis_html_service import eh_lei_ambiental, normalizar_texto
+from app.services.async_crawler import fetch_pages
+from app.services.pdf_pipeline import PDFPipeline, extrair_texto_pdf
+from app.services.http_cache import http_cache
+
+# Páginas de listagem baixadas em paralelo a cada lote
+LISTING_BATCH_SIZE = 20
 
 class SimplePDFCollector:
     """Coletor simplificado que não usa Selenium"""
@@ -24,9 +28,7 @@ class SimplePDFCollector:
     def get_page_content(self, url: str) -> str:
         """Obtém conteúdo HTML de uma página"""
         try:
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            return response.text
+            return http_cache.get(self.session, url, timeout=30).text
         except Exception as e:
             print(f"Erro ao acessar {url}: {e}")
             return ""
@@ -95,26 +97,33 @@ class SimplePDFCollector:
         """Baixa e extrai texto de um PDF"""
         try:
             print(f"Baixando PDF: {pdf_url}")
-            response = self.session.get(pdf_url, timeout=60)
-            response.raise_for_status()
-            
-            # Extrai texto do PDF
-            pdf_file = io.BytesIO(response.content)
-            pdf_reader = pypdf.PdfReader(pdf_file)
-            
-            texto_completo = ""
-            for page in pdf_reader.pages:
-                texto_completo += page.extract_text() + "\n"
+            response = http_cache.get(self.session, pdf_url, timeout=60)
             
-            return normalizar_texto(texto_completo)
+            # Extrai texto do PDF (reaproveitado se o conteúdo não mudou)
+            return normalizar_texto(http_cache.pdf_text(response.content, extrair_texto_pdf))
             
         except Exception as e:
             print(f"Erro ao processar PDF {pdf_url}: {e}")
             return ""
     
+    def page_url(self, page_num: int) -> str:
+        """URL de uma página da listagem de legislação estadual"""
+        return f"https://www.al.to.leg.br/legislacaoEstadual?page={page_num}"
+    
+    def attach_pdf_contents(self, leis: List[Dict], textos: Dict[str, Optional[str]]) -> None:
+        """Preenche o conteúdo das leis com o texto extraído do primeiro PDF"""
+        for lei in leis:
+            pdf_content = textos.get(lei['pdf_links'][0]) if lei['pdf_links'] else None
+            
+            if pdf_content:
+                lei['conteudo'] = normalizar_texto(pdf_content)
+                lei['fonte'] = 'PDF'
+            else:
+                lei['fonte'] = 'HTML'
+    
     def collect_laws_from_page(self, page_num: int) -> List[Dict]:
         """Coleta leis de uma página específica"""
-        url = f"https://www.al.to.leg.br/legislacaoEstadual?page={page_num}"
+        url = self.page_url(page_num)
         print(f"Processando página {page_num}: {url}")
         
         html_content = self.get_page_content(url)
@@ -123,47 +132,53 @@ class SimplePDFCollector:
         
         leis = self.extract_laws_from_html(html_content, url)
         
-        # Processa PDFs para cada lei
-        for lei in leis:
-            if lei['pdf_links']:
-                # Usa o primeiro PDF encontrado
-                pdf_url = lei['pdf_links'][0]
-                pdf_content = self.download_and_extract_pdf(pdf_url)
-                
-                if pdf_content:
-                    lei['conteudo'] = pdf_content
-                    lei['fonte'] = 'PDF'
-                else:
-                    lei['fonte'] = 'HTML'
-            else:
-                lei['fonte'] = 'HTML'
+        # Processa os PDFs da página em paralelo (usa o primeiro PDF de cada lei)
+        textos = PDFPipeline(session=self.session, cache=http_cache).process_all(
+            lei['pdf_links'][0] for lei in leis if lei['pdf_links']
+        )
+        self.attach_pdf_contents(leis, textos)
         
         return leis
     
-    def collect_all_laws(self, max_pages: int = 250) -> List[Dict]:
-        """Coleta todas as leis ambientais"""
-        print(f"=== INICIANDO COLETA DE LEIS AMBIENTAIS ===")
-        print(f"Páginas a processar: {max_pages}")
+    def iter_laws_from_listing(self, max_pages: int) -> Iterator[Dict]:
+        """Percorre a listagem em lotes de páginas baixadas em paralelo"""
+        page_nums = list(range(1, max_pages + 1))
         
-        todas_leis = []
-        
-        for page_num in range(1, max_pages + 1):
-            try:
-                leis_pagina = self.collect_laws_from_page(page_num)
+        for inicio in range(0, len(page_nums), LISTING_BATCH_SIZE):
+            lote = page_nums[inicio:inicio + LISTING_BATCH_SIZE]
+            pages = fetch_pages([self.page_url(page_num) for page_num in lote], cache=http_cache)
+            
+            for page_num in lote:
+                url = self.page_url(page_num)
+                try:
+                    leis_pagina = self.extract_laws_from_html(pages.get(url) or "", url)
+                except Exception as e:
+                    print(f"Erro na página {page_num}: {e}")
+                    continue
                 
                 if leis_pagina:
-                    todas_leis.extend(leis_pagina)
                     print(f"Página {page_num}: {len(leis_pagina)} leis ambientais encontradas")
                 else:
                     print(f"Página {page_num}: Nenhuma lei ambiental encontrada")
                 
-                # Pausa entre requisições
-                import time
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Erro na página {page_num}: {e}")
-                continue
+                yield from leis_pagina
+    
+    def collect_all_laws(self, max_pages: int = 250) -> List[Dict]:
+        """Coleta todas as leis ambientais"""
+        print(f"=== INICIANDO COLETA DE LEIS AMBIENTAIS ===")
+        print(f"Páginas a processar: {max_pages}")
+        
+        todas_leis = []
+        
+        def pdf_urls():
+            # A listagem alimenta o pipeline de PDFs enquanto ainda está sendo percorrida
+            for lei in self.iter_laws_from_listing(max_pages):
+                todas_leis.append(lei)
+                if lei['pdf_links']:
+                    yield lei['pdf_links'][0]
+        
+        textos = PDFPipeline(session=self.session, cache=http_cache).process_all(pdf_urls())
+        self.attach_pdf_contents(todas_leis, textos)
         
         print(f"\n=== COLETA FINALIZADA ===")
         print(f"Total de leis ambientais coletadas: {len(todas_leis)}")
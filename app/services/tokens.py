@@ -0,0 +1,76 @@
+"""
+Contagem de tokens com o tokenizador do modelo de embeddings
+Usa o tiktoken quando instalado; sem ele, estima pelo tamanho do texto
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import List
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Média de caracteres por token em português (usada só na estimativa)
+CHARS_POR_TOKEN = 4
+
+_PALAVRAS = re.compile(r"\S+")
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def tokenizador_disponivel(model: str = EMBEDDING_MODEL) -> bool:
+    """Se a contagem é exata (tiktoken instalado) ou estimada"""
+    return _encoding(model) is not None
+
+
+def contar_tokens(texto: str, model: str = EMBEDDING_MODEL) -> int:
+    """Número de tokens do texto para o modelo (estimado se não houver tiktoken)"""
+    if not texto:
+        return 0
+
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(texto, disallowed_special=()))
+
+    # Estimativa: nunca menos que um token por palavra
+    return max(len(_PALAVRAS.findall(texto)), -(-len(texto) // CHARS_POR_TOKEN))
+
+
+def truncar_tokens(texto: str, max_tokens: int, model: str = EMBEDDING_MODEL) -> str:
+    """Corta o texto para caber em max_tokens"""
+    if max_tokens <= 0:
+        return ""
+
+    encoding = _encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(texto, disallowed_special=())
+        return texto if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+    limite = max_tokens * CHARS_POR_TOKEN
+    if len(texto) <= limite:
+        return texto
+    corte = texto.rfind(" ", 0, limite)
+    return texto[:corte if corte > 0 else limite]
+
+
+def fatiar_tokens(texto: str, max_tokens: int, model: str = EMBEDDING_MODEL) -> List[str]:
+    """Divide o texto em fatias consecutivas de até max_tokens (para trechos sem espaços)"""
+    max_tokens = max(1, max_tokens)
+    encoding = _encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(texto, disallowed_special=())
+        return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+    limite = max_tokens * CHARS_POR_TOKEN
+    return [texto[i:i + limite] for i in range(0, len(texto), limite)]
@@ -0,0 +1,196 @@
+"""
+Cache de uploads endereçado pelo conteúdo (SHA-256 do arquivo enviado)
+Guarda em disco o texto extraído, os chunks e os embeddings de cada PDF já
+processado: reenviar o mesmo arquivo em outra conversa vira uma consulta.
+Bytes e entradas são totais mantidos em memória, atualizados a cada gravação e
+remoção; o diretório só é varrido no primeiro uso e quando o limite é passado
+(a varredura também conta o que outros workers gravaram).
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional
+from app.services.legal_chunker import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from app.services.tokens import EMBEDDING_MODEL
+
+# Diretório do cache e tamanho máximo em disco (entradas menos usadas saem primeiro)
+UPLOAD_CACHE_DIR = os.getenv("UPLOAD_CACHE_DIR", os.path.join(".cache", "uploads"))
+UPLOAD_CACHE_MAX_BYTES = int(os.getenv("UPLOAD_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+ARQUIVO_META = "meta.json"
+ARQUIVO_DOCUMENTO = "documento.json"
+ARQUIVO_EMBEDDINGS = "embeddings.npy"
+
+
+def versao_processamento() -> str:
+    """Parâmetros que mudam chunks ou embeddings; entradas de outra versão são ignoradas"""
+    return f"{CHUNK_MAX_TOKENS}:{CHUNK_OVERLAP_TOKENS}:{EMBEDDING_MODEL}"
+
+
+def _tamanho_diretorio(path: str) -> int:
+    total = 0
+    for nome in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, nome))
+        except OSError:
+            pass
+    return total
+
+
+class UploadCache:
+    """Entradas em <diretório>/<sha[:2]>/<sha>/, gravadas de forma atômica (seguro entre workers)"""
+
+    def __init__(self, directory: str = UPLOAD_CACHE_DIR, max_bytes: int = UPLOAD_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.versao = versao_processamento()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Totais em disco (None = ainda não varrido)
+        self._bytes: Optional[int] = None
+        self._entradas = 0
+
+    def _entrada(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    def get(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """
+        Recupera o processamento de um arquivo já enviado.
+
+        Args:
+            sha256: Hash do conteúdo do arquivo
+
+        Returns:
+            Dict: {'text', 'chunks', 'embeddings'} ou None se não houver entrada válida
+        """
+        entrada = self._entrada(sha256)
+        try:
+            with open(os.path.join(entrada, ARQUIVO_META), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("versao") != self.versao:
+                self.misses += 1
+                return None
+
+            with open(os.path.join(entrada, ARQUIVO_DOCUMENTO), "r", encoding="utf-8") as f:
+                documento = json.load(f)
+
+            embeddings = None
+            if meta.get("embeddings"):
+                embeddings = np.load(os.path.join(entrada, ARQUIVO_EMBEDDINGS), allow_pickle=False)
+
+            # Marca o uso (a limpeza remove primeiro as entradas usadas há mais tempo)
+            os.utime(os.path.join(entrada, ARQUIVO_META))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Entrada inválida no cache de uploads ({sha256[:12]}): {e}")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {"text": documento["text"], "chunks": documento["chunks"], "embeddings": embeddings}
+
+    def put(self, sha256: str, text: str, chunks: List[str], embeddings: Optional[np.ndarray] = None) -> None:
+        """Grava (ou substitui) a entrada de um arquivo"""
+        entrada = self._entrada(sha256)
+        pai = os.path.dirname(entrada)
+        os.makedirs(pai, exist_ok=True)
+
+        # Monta a entrada em um diretório temporário e a publica com um rename
+        anterior = _tamanho_diretorio(entrada) if os.path.isdir(entrada) else None
+        temporario = tempfile.mkdtemp(prefix=f".{sha256[:12]}_", dir=pai)
+        try:
+            with open(os.path.join(temporario, ARQUIVO_DOCUMENTO), "w", encoding="utf-8") as f:
+                json.dump({"text": text, "chunks": chunks}, f, ensure_ascii=False)
+            if embeddings is not None:
+                np.save(os.path.join(temporario, ARQUIVO_EMBEDDINGS), np.asarray(embeddings, dtype=np.float32))
+            with open(os.path.join(temporario, ARQUIVO_META), "w", encoding="utf-8") as f:
+                json.dump({
+                    "versao": self.versao,
+                    "chunks": len(chunks),
+                    "embeddings": embeddings is not None
+                }, f)
+            tamanho = _tamanho_diretorio(temporario)
+
+            shutil.rmtree(entrada, ignore_errors=True)
+            try:
+                os.rename(temporario, entrada)
+            except OSError:
+                # Outro worker publicou a mesma entrada ao mesmo tempo
+                shutil.rmtree(temporario, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(temporario, ignore_errors=True)
+            raise
+
+        self._totais()
+        with self._lock:
+            self._bytes += tamanho - (anterior or 0)
+            self._entradas += 0 if anterior is not None else 1
+        self._podar()
+
+    def _totais(self) -> None:
+        """Varre o diretório uma vez para iniciar os totais"""
+        if self._bytes is None:
+            entradas = self._listar()
+            with self._lock:
+                if self._bytes is None:
+                    self._bytes = sum(e["bytes"] for e in entradas)
+                    self._entradas = len(entradas)
+
+    def _listar(self) -> List[Dict[str, Any]]:
+        entradas = []
+        if not os.path.isdir(self.directory):
+            return entradas
+        for prefixo in os.listdir(self.directory):
+            pasta = os.path.join(self.directory, prefixo)
+            if not os.path.isdir(pasta):
+                continue
+            for nome in os.listdir(pasta):
+                entrada = os.path.join(pasta, nome)
+                if nome.startswith(".") or not os.path.isdir(entrada):
+                    continue
+                try:
+                    usado_em = os.path.getmtime(os.path.join(entrada, ARQUIVO_META))
+                except OSError:
+                    continue
+                entradas.append({"path": entrada, "usado_em": usado_em, "bytes": _tamanho_diretorio(entrada)})
+        return entradas
+
+    def _podar(self) -> None:
+        """Remove as entradas usadas há mais tempo até caber em max_bytes"""
+        if self._bytes <= self.max_bytes:
+            return
+        # Acima do limite: a varredura corrige os totais e escolhe as entradas mais antigas
+        entradas = self._listar()
+        total = sum(e["bytes"] for e in entradas)
+        restantes = len(entradas)
+        for entrada in sorted(entradas, key=lambda e: e["usado_em"]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entrada["path"], ignore_errors=True)
+            total -= entrada["bytes"]
+            restantes -= 1
+        with self._lock:
+            self._bytes, self._entradas = total, restantes
+
+    def stats(self) -> Dict[str, Any]:
+        """Uso do cache (para o endpoint de status)"""
+        self._totais()
+        return {
+            "directory": self.directory,
+            "entries": self._entradas,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Instância compartilhada
+upload_cache = UploadCache()
@@ -0,0 +1,171 @@
+"""
+Aquecimento do app na subida (lifespan)
+Etapas registradas aqui criam os clientes pesados do contêiner, abrem as conexões
+dos pools e pré-calculam embeddings das perguntas mais frequentes, em segundo plano.
+/ready só responde 200 depois que todas terminam: o balanceador não manda tráfego
+para um worker frio. Uma etapa que falha não bloqueia o app; o serviço volta a ser
+criado sob demanda no primeiro uso.
+"""
+
+import os
+import time
+import asyncio
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.services.container import services
+
+# Etapas a pular, separadas por vírgula (ex.: WARMUP_SKIP=ia_tabela,embedding_cache)
+WARMUP_SKIP = {nome.strip() for nome in os.getenv("WARMUP_SKIP", "").split(",") if nome.strip()}
+
+# Mensagens recentes lidas do histórico e quantas perguntas distintas vão ao cache
+WARMUP_HISTORY_LIMIT = int(os.getenv("WARMUP_HISTORY_LIMIT", "2000"))
+WARMUP_TOP_QUESTIONS = int(os.getenv("WARMUP_TOP_QUESTIONS", "200"))
+
+
+class WarmupRunner:
+    """Etapas de aquecimento executadas em paralelo, com estado exposto em /ready"""
+
+    def __init__(self, skip=WARMUP_SKIP):
+        self.skip = set(skip)
+        self._etapas: Dict[str, Callable[[], Any]] = {}
+        self._estado: Dict[str, Dict[str, Any]] = {}
+        self._tarefa: Optional[asyncio.Task] = None
+        self.ready = False
+        self.inicio: Optional[float] = None
+        self.duracao: Optional[float] = None
+
+    def stage(self, nome: str) -> Callable:
+        """Decorador que registra uma função síncrona como etapa"""
+        def registrar(funcao: Callable[[], Any]) -> Callable[[], Any]:
+            self._etapas[nome] = funcao
+            return funcao
+        return registrar
+
+    async def _executar(self, nome: str, funcao: Callable[[], Any]) -> None:
+        self._estado[nome] = {"status": "running", "seconds": None, "detail": None}
+        inicio = time.perf_counter()
+        try:
+            detalhe = await run_in_threadpool(funcao)
+            self._estado[nome].update(status="done", detail=detalhe)
+        except Exception as e:
+            self._estado[nome].update(status="failed", detail=str(e))
+            print(f"⚠️ Aquecimento '{nome}' falhou (será criado no primeiro uso): {e}")
+        self._estado[nome]["seconds"] = round(time.perf_counter() - inicio, 3)
+
+    async def run(self) -> None:
+        """Executa todas as etapas não puladas e marca o app como pronto"""
+        self.inicio = time.perf_counter()
+        etapas = {nome: funcao for nome, funcao in self._etapas.items() if nome not in self.skip}
+        for nome in self._etapas:
+            if nome in self.skip:
+                self._estado[nome] = {"status": "skipped", "seconds": None, "detail": None}
+
+        await asyncio.gather(*(self._executar(nome, funcao) for nome, funcao in etapas.items()))
+
+        self.duracao = time.perf_counter() - self.inicio
+        falhas = [nome for nome, estado in self._estado.items() if estado["status"] == "failed"]
+        self.ready = True
+        print(f"🔥 Aquecimento concluído em {self.duracao:.1f}s"
+              + (f" ({len(falhas)} etapa(s) com falha: {', '.join(falhas)})" if falhas else ""))
+
+    def start(self) -> None:
+        """Inicia o aquecimento em segundo plano (o servidor já aceita conexões)"""
+        if self._tarefa is None:
+            self._tarefa = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._tarefa and not self._tarefa.done():
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+        self._tarefa = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "seconds": round(self.duracao, 3) if self.duracao is not None else None,
+            "stages": {nome: dict(estado) for nome, estado in self._estado.items()}
+        }
+
+
+def consultas_da_pergunta(pergunta: str) -> List[str]:
+    """
+    Textos que consultar_lei envia a embed_query para a pergunta (chaves do cache).
+
+    Acompanha as buscas de consult_service.consultar_lei: por número de lei,
+    semântica (pergunta normalizada) e COEMA.
+    """
+    from app.services.consult_service import extrair_numero_lei
+    from app.services.text_normalizer import normalizar_texto, normalizar_pergunta_busca
+
+    normalizada = normalizar_pergunta_busca(pergunta)
+    numero_lei = extrair_numero_lei(pergunta)
+    if numero_lei:
+        enriquecida = f"Sobre a Lei {numero_lei}: {normalizada}"
+        return [f"lei {numero_lei} {normalizada}", enriquecida, normalizar_texto(enriquecida)]
+    return [normalizada, normalizar_texto(normalizada)]
+
+
+def perguntas_frequentes(supabase, limite: int = WARMUP_HISTORY_LIMIT,
+                         top: int = WARMUP_TOP_QUESTIONS) -> List[str]:
+    """Perguntas de usuários mais repetidas entre as mensagens recentes gravadas"""
+    from app.services.consult_service import detectar_saudacao
+
+    resultado = supabase.table("messages").select("content") \
+        .eq("role", "user").order("created_at", desc=True).limit(limite).execute()
+    contagem = Counter(
+        m["content"].strip() for m in resultado.data
+        if m.get("content") and m["content"].strip() and not detectar_saudacao(m["content"])
+    )
+    return [pergunta for pergunta, _ in contagem.most_common(top)]
+
+
+warmup = WarmupRunner()
+
+
+@warmup.stage("supabase")
+def _aquecer_supabase():
+    # Primeira consulta abre a conexão HTTP do cliente
+    services.get("supabase").table("conversations").select("id").limit(1).execute()
+
+
+@warmup.stage("pinecone")
+def _aquecer_pinecone():
+    import app.services.pinecone_service  # noqa: F401  (registra embeddings, vectorstore e índice)
+    stats = services.get("pinecone_index").describe_index_stats()
+    services.get("vectorstore")
+    return {"vectors": getattr(stats, "total_vector_count", None)}
+
+
+@warmup.stage("llm")
+def _aquecer_llm():
+    import app.services.consult_service  # noqa: F401  (registra llm, qa_chain e coema_service)
+    for nome in ("llm", "coema_service", "qa_chain"):
+        services.get(nome)
+
+
+@warmup.stage("document_store")
+def _aquecer_document_store():
+    from app.services.document_chat_service import DocumentChatService
+    return DocumentChatService.store_stats()
+
+
+@warmup.stage("embedding_cache")
+def _aquecer_embedding_cache():
+    # A chamada em lote também abre as conexões do pool HTTP da OpenAI
+    import app.services.pinecone_service  # noqa: F401
+    from app.services.openai_clients import prime_query_embeddings
+
+    textos = []
+    for pergunta in perguntas_frequentes(services.get("supabase")):
+        textos.extend(consultas_da_pergunta(pergunta))
+    return {"queries": prime_query_embeddings(services.get("embeddings"), textos)}
+
+
+@warmup.stage("ia_tabela")
+def _aquecer_ia_tabela():
+    # Corpus do gerador de tabelas (carregado do Pinecone)
+    return {"documents": len(services.get("ia_tabela").todas_fontes_data)}
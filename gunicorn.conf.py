@@ -0,0 +1,15 @@
+"""
+Configuração do gunicorn usada pelo start.py em produção com vários workers
+"""
+
+
+def child_exit(server, worker):
+    """Worker encerrado (inclusive por falha): seus registros de chat pendentes voltam ao journal principal"""
+    from app.services.message_queue import recuperar_journal_do_worker
+    try:
+        recuperados = recuperar_journal_do_worker(worker.pid)
+    except Exception as e:
+        print(f"⚠️ Falha ao recuperar o journal do worker {worker.pid}: {e}")
+        return
+    if recuperados:
+        print(f"📒 {recuperados} registro(s) de chat do worker {worker.pid} devolvidos ao journal")
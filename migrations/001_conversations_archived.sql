@@ -0,0 +1,2 @@
+-- Coluna usada por /chats/bulk (archive/unarchive) e pelo filtro de /user-chats
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS archived boolean NOT NULL DEFAULT false;
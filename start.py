@@ -1,91 +1,211 @@
 #!/usr/bin/env python
+"""
+Inicialização da API (FastAPI) e do gerador de tabelas (Streamlit)
+
+Produção: N workers da API com preload + fork (gunicorn com workers uvicorn; no
+Windows ou sem gunicorn, uvicorn --workers). Sem um cache de conversas
+compartilhado (CHAT_CACHE_URL) a API sobe com um único worker, mesmo com
+WEB_CONCURRENCY ou --workers. Antes de subir os
+workers, o snapshot do corpus é preparado uma única vez e os journals de
+mensagens de execuções anteriores são reunidos; com gunicorn, o journal de um
+worker que termina volta ao principal na hora (gunicorn.conf.py). O Streamlit só
+inicia quando /ready responde 200.
+"""
 import subprocess
 import time
 import os
 import signal
 import sys
+import shutil
+import argparse
+import urllib.request
+import urllib.error
+
+# Tempo máximo de espera pelo /ready da API
+READY_TIMEOUT = int(os.environ.get("READY_TIMEOUT", "300"))
+
+processos = []
+
+def parar_processos():
+    for processo in processos:
+        if processo.poll() is None:
+            processo.terminate()
+    for processo in processos:
+        try:
+            processo.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            processo.kill()
 
 def signal_handler(sig, frame):
     print("\nParando os serviços...")
+    parar_processos()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
+signal.signal(signal.SIGTERM, signal_handler)
+
+def numero_de_workers(pedido=None):
+    """
+    --workers ou WEB_CONCURRENCY (definido automaticamente por Railway/Heroku); sem eles,
+    um worker por núcleo. Sem cache de conversas compartilhado (CHAT_CACHE_URL) fica em
+    um único worker: cada worker teria o próprio cache de leitura e serviria conversas velhas
+    """
+    if pedido is None and "WEB_CONCURRENCY" in os.environ:
+        pedido = int(os.environ["WEB_CONCURRENCY"])
+    if not os.environ.get("CHAT_CACHE_URL"):
+        if pedido and pedido > 1:
+            print(f"⚠️ CHAT_CACHE_URL não definido: usando 1 worker em vez de {pedido} "
+                  "(defina CHAT_CACHE_URL para rodar vários workers)")
+        return 1
+    return pedido or os.cpu_count() or 1
+
+def aguardar_api(port, processo, timeout=READY_TIMEOUT):
+    """Aguarda o /ready da API responder 200 (aquecimento concluído) em vez de um tempo fixo"""
+    url = f"http://127.0.0.1:{port}/ready"
+    inicio = time.monotonic()
+    while time.monotonic() - inicio < timeout:
+        if processo.poll() is not None:
+            raise RuntimeError(f"A API encerrou durante a inicialização (código {processo.returncode})")
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resposta:
+                if resposta.status == 200:
+                    print(f"✅ API pronta em {time.monotonic() - inicio:.1f}s")
+                    return True
+        except urllib.error.HTTPError:
+            pass  # 503: ainda aquecendo
+        except (urllib.error.URLError, OSError):
+            pass  # Porta ainda fechada
+        time.sleep(0.5)
+    print(f"⚠️ API não ficou pronta em {timeout}s; seguindo assim mesmo")
+    return False
+
+def preparar_corpus(refresh=False):
+    """Grava o snapshot do corpus uma vez, em processo separado, antes de criar os workers"""
+    print("Preparando snapshot do corpus...")
+    codigo = (
+        "import sys; sys.path.append('tabela_generator'); "
+        "from ia_tabela_service import IATabela; "
+        f"IATabela(refresh_corpus={refresh})"
+    )
+    resultado = subprocess.run([sys.executable, "-c", codigo])
+    if resultado.returncode != 0:
+        print("⚠️ Snapshot do corpus não foi preparado; os workers carregam no primeiro uso")
+
+def preparar_journals():
+    """Reúne os journals por worker da execução anterior (nenhum worker está ativo ainda)"""
+    from app.services.message_queue import juntar_journals
+    recuperados = juntar_journals()
+    if recuperados:
+        print(f"📒 {recuperados} registro(s) de chat de workers anteriores reunidos no journal")
+
+def comando_api(port, workers):
+    """Gunicorn com preload (módulos carregados uma vez e compartilhados no fork) ou uvicorn"""
+    if workers > 1 and sys.platform != "win32" and shutil.which("gunicorn"):
+        return [
+            "gunicorn", "app.main:app",
+            "--worker-class", "uvicorn.workers.UvicornWorker",
+            "--workers", str(workers),
+            "--bind", f"0.0.0.0:{port}",
+            "--config", "gunicorn.conf.py",
+            "--preload",
+            "--graceful-timeout", "30",
+            "--timeout", "120"
+        ]
+    return [
+        "uvicorn", "app.main:app",
+        "--host", "0.0.0.0",
+        "--port", str(port),
+        "--workers", str(workers)
+    ]
+
+def iniciar_streamlit(headless):
+    comando = [
+        "streamlit", "run", "tabela_generator/web_interface.py",
+        "--server.port", "8501",
+        "--server.address", "0.0.0.0"
+    ]
+    if headless:
+        comando += ["--server.headless", "true"]
+    return subprocess.Popen(comando)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inicia a API e o gerador de tabelas")
+    parser.add_argument("--workers", type=int, default=None, help="Workers da API (padrão: WEB_CONCURRENCY ou núcleos; sempre 1 sem CHAT_CACHE_URL)")
+    parser.add_argument("--refresh-corpus", action="store_true", help="Baixa o corpus de novo mesmo com snapshot válido")
+    parser.add_argument("--no-streamlit", action="store_true", help="Não inicia o Streamlit")
+    args = parser.parse_args()
+
     # Obtém a porta do ambiente (Railway define automaticamente)
     port = int(os.environ.get("PORT", 8000))
-    
+
     # Detecta se está no Railway ou ambiente de produção
     is_production = (
-        "RAILWAY_ENVIRONMENT" in os.environ or 
+        "RAILWAY_ENVIRONMENT" in os.environ or
         "RAILWAY_PROJECT_ID" in os.environ or
         "RAILWAY_SERVICE_ID" in os.environ or
         "DYNO" in os.environ  # Heroku
     )
-    
+
     if is_production:
         # Em produção, roda FastAPI e Streamlit
-        print(f"Modo produção detectado - porta: {port}")
-        
+        workers = numero_de_workers(args.workers)
+        print(f"Modo produção detectado - porta: {port}, workers: {workers}")
+
+        preparar_journals()
+        preparar_corpus(refresh=args.refresh_corpus)
+
+        if workers > 1:
+            # Cada worker grava o próprio journal de mensagens
+            os.environ["MESSAGE_JOURNAL_PER_WORKER"] = "1"
+
         print("Iniciando FastAPI em produção...")
-        # Inicia FastAPI em background
-        fastapi_process = subprocess.Popen([
-            "uvicorn", "app.main:app", 
-            "--host", "0.0.0.0", 
-            "--port", str(port),
-            "--workers", "1"
-        ])
-        
-        # Aguarda um pouco para o FastAPI inicializar
-        time.sleep(3)
-        
-        print("Iniciando Streamlit em produção...")
-        # Inicia Streamlit na porta 8501
-        streamlit_process = subprocess.Popen([
-            "streamlit", "run", "tabela_generator/web_interface.py",
-            "--server.port", "8501",
-            "--server.address", "0.0.0.0",
-            "--server.headless", "true"
-        ])
-        
-        # Aguarda ambos os processos
+        fastapi_process = subprocess.Popen(comando_api(port, workers))
+        processos.append(fastapi_process)
+
         try:
-            fastapi_process.wait()
-        except KeyboardInterrupt:
-            fastapi_process.terminate()
-            streamlit_process.terminate()
+            aguardar_api(port, fastapi_process)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+        if not args.no_streamlit:
+            print("Iniciando Streamlit em produção...")
+            # Inicia Streamlit na porta 8501
+            processos.append(iniciar_streamlit(headless=True))
+
+        # Aguarda a API (o processo principal do serviço); se ela cair, o Streamlit também para
+        fastapi_process.wait()
+        parar_processos()
+        sys.exit(fastapi_process.returncode)
     else:
         # Em desenvolvimento local, rodamos ambos separadamente
         print("Modo desenvolvimento local detectado")
         os.environ["STREAMLIT_URL"] = "http://localhost:8501"
-        
+
         print("Iniciando FastAPI...")
         fastapi_process = subprocess.Popen([
-            "uvicorn", "app.main:app", 
-            "--host", "0.0.0.0", 
+            "uvicorn", "app.main:app",
+            "--host", "0.0.0.0",
             "--port", str(port),
             "--reload"
         ])
-        
-        print("Aguardando 5 segundos para o FastAPI inicializar...")
-        time.sleep(5)
-        
-        print("Iniciando Streamlit...")
-        streamlit_process = subprocess.Popen([
-            "streamlit", "run", "tabela_generator/web_interface.py", 
-            "--server.port", "8501",
-            "--server.address", "0.0.0.0"
-        ])
-        
+        processos.append(fastapi_process)
+
+        print("Aguardando o /ready da API...")
+        try:
+            aguardar_api(port, fastapi_process)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+        if not args.no_streamlit:
+            print("Iniciando Streamlit...")
+            processos.append(iniciar_streamlit(headless=False))
+
         print("Ambos os serviços foram iniciados!")
         print(f"FastAPI: http://localhost:{port}")
         print("Streamlit: http://localhost:8501")
         print(f"Acesse o Streamlit via FastAPI em: http://localhost:{port}/gerador-tabelas")
-        
-        try:
-            fastapi_process.wait()
-            streamlit_process.wait()
-        except KeyboardInterrupt:
-            print("\nParando os serviços...")
-            fastapi_process.terminate()
-            streamlit_process.terminate()
\ No newline at end of file
+
+        for processo in processos:
+            processo.wait()
@@ -3,11 +3,24 @@
 # Script para iniciar FastAPI e Streamlit simultaneamente
 echo "Iniciando FastAPI..."
 python -m uvicorn app.main:app --host 0.0.0.0 --port $PORT &
+FASTAPI_PID=$!
 
-# Aguardar FastAPI inicializar
-echo "Aguardando FastAPI inicializar..."
-sleep 5
+# Aguardar o /ready da API (aquecimento concluído) em vez de um tempo fixo
+echo "Aguardando o /ready da API..."
+READY_TIMEOUT=${READY_TIMEOUT:-300}
+inicio=$SECONDS
+until curl -sf "http://127.0.0.1:$PORT/ready" > /dev/null; do
+    if ! kill -0 $FASTAPI_PID 2> /dev/null; then
+        echo "A API encerrou durante a inicialização"
+        exit 1
+    fi
+    if (( SECONDS - inicio >= READY_TIMEOUT )); then
+        echo "API não ficou pronta em ${READY_TIMEOUT}s; seguindo assim mesmo"
+        break
+    fi
+    sleep 0.5
+done
 
 # Iniciar Streamlit
 echo "Iniciando Streamlit..."
-streamlit run tabela_generator/web_interface.py --server.port 8501 --server.address 0.0.0.0
\ No newline at end of file
+streamlit run tabela_generator/web_interface.py --server.port 8501 --server.address 0.0.0.0
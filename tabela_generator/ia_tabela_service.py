@@ -7,11 +7,11 @@ Inclui TODAS as fontes de dados: Leis Estaduais, Power BI, COEMA, ABNT, CONAMA,
 """
 
 import json
+from itertools import islice
 import pandas as pd
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 import openai
-from openai import OpenAI
 import os
 import sys
 from dotenv import load_dotenv
@@ -21,6 +21,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'app'))
 
 # Importar função de normalização de texto
 from app.services.text_normalizer import normalizar_texto
+from app.services.openai_clients import chat_completion
+from app.services.corpus_snapshot import carregar_corpus, coluna, filtrar
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -30,16 +32,21 @@ class IATabela:
     IA direcionada para geração de tabelas organizadas de TODAS as fontes de dados ambientais
     """
     
-    def __init__(self):
-        """Inicializa o serviço de IA para tabelas com todas as fontes"""
+    def __init__(self, refresh_corpus: bool = False):
+        """
+        Inicializa o serviço de IA para tabelas com todas as fontes
+
+        Args:
+            refresh_corpus: Baixa o corpus do Pinecone mesmo com snapshot válido em disco
+        """
         self.api_key = os.getenv('OPENAI_API_KEY')
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY não encontrada no arquivo .env")
         
 
         
-        # Carregar dados APENAS do Pinecone
-        self.todas_fontes_data = self._carregar_todas_fontes()
+        # Carregar dados APENAS do Pinecone (via snapshot mapeado em memória, compartilhado entre processos)
+        self.todas_fontes_data = carregar_corpus(self._carregar_todas_fontes, refresh=refresh_corpus)
         
 
     
@@ -74,7 +81,7 @@ class IATabela:
         dados_pinecone = []
         
         try:
-            from services.pinecone_service import pinecone_index
+            from app.services.pinecone_service import pinecone_index
             
             # Obter estatísticas dos namespaces
             stats = pinecone_index.describe_index_stats()
@@ -323,11 +330,10 @@ class IATabela:
         legislacoes_federais = []
         
         # 🔍 BUSCAR NAS LEIS REAIS CARREGADAS DE TODAS AS FONTES (INCLUINDO PINECONE)
-        for lei in self.todas_fontes_data:
-            # Filtrar apenas leis federais
-            jurisdicao = lei.get("jurisdicao", "").lower()
-            if "federal" not in jurisdicao:
-                continue
+        # Filtrar apenas leis federais (no snapshot, só essas linhas são montadas)
+        federais = filtrar(self.todas_fontes_data, "jurisdicao", lambda j: "federal" in j.lower(),
+                           colunas=("titulo", "ementa"), padrao="")
+        for lei in federais:
             titulo = lei.get("titulo", "")
             ementa = lei.get("ementa", "")
             titulo_ementa_normalizado = normalizar_texto(titulo + " " + ementa)
@@ -407,11 +413,10 @@ class IATabela:
         legislacoes_estaduais = []
         
         # 🔍 BUSCAR NAS LEIS REAIS CARREGADAS DE TODAS AS FONTES (INCLUINDO PINECONE)
-        for lei in self.todas_fontes_data:
-            # Filtrar apenas leis estaduais (incluindo "Estadual - Tocantins")
-            jurisdicao = lei.get("jurisdicao", "").lower()
-            if "estadual" not in jurisdicao:
-                continue
+        # Filtrar apenas leis estaduais (incluindo "Estadual - Tocantins")
+        estaduais = filtrar(self.todas_fontes_data, "jurisdicao", lambda j: "estadual" in j.lower(),
+                            colunas=("titulo", "descricao"), padrao="")
+        for lei in estaduais:
             titulo_desc_normalizado = normalizar_texto(lei.get("titulo", "") + " " + lei.get("descricao", ""))
             
             # Normalizar palavras-chave para comparação
@@ -469,11 +474,10 @@ class IATabela:
         legislacoes_municipais = []
         
         # 🔍 BUSCAR NAS LEIS REAIS CARREGADAS DE TODAS AS FONTES (INCLUINDO PINECONE)
-        for lei in self.todas_fontes_data:
-            # Filtrar apenas leis municipais (incluindo "Municipal - [Nome do Município]")
-            jurisdicao = lei.get("jurisdicao", "").lower()
-            if "municipal" not in jurisdicao:
-                continue
+        # Filtrar apenas leis municipais (incluindo "Municipal - [Nome do Município]")
+        municipais = filtrar(self.todas_fontes_data, "jurisdicao", lambda j: "municipal" in j.lower(),
+                             colunas=("titulo", "descricao"), padrao="")
+        for lei in municipais:
             titulo_desc_normalizado = normalizar_texto(lei.get("titulo", "") + " " + lei.get("descricao", ""))
             
             # Normalizar palavras-chave para comparação
@@ -548,14 +552,10 @@ class IATabela:
         """
         
         try:
-            client = OpenAI(
-                api_key=self.api_key,
-                timeout=60.0,  # Timeout de 60 segundos
-                max_retries=3  # Máximo de 3 tentativas
-            )
-            
-            response = client.chat.completions.create(
+            # Cliente compartilhado: pool HTTP, novas tentativas e fila do modelo
+            response = chat_completion(
                 model="gpt-4o-mini",
+                api_key=self.api_key,
                 messages=[
                     {"role": "system", "content": prompt_sistema},
                     {"role": "user", "content": prompt_usuario}
@@ -662,8 +662,8 @@ class IATabela:
                 print(f"📊 Populando tabela com {len(dados_fonte)} documentos de TODAS as fontes")
             else:
                 # Filtrar apenas leis estaduais dos dados do Pinecone
-                dados_estaduais = [d for d in self.todas_fontes_data if d.get('jurisdicao', '').startswith('Estadual')]
-                dados_fonte = dados_estaduais[:num_documentos]
+                dados_estaduais = filtrar(self.todas_fontes_data, 'jurisdicao', lambda j: j.startswith('Estadual'), padrao='')
+                dados_fonte = list(islice(dados_estaduais, num_documentos))
                 print(f"📊 Populando tabela com {len(dados_fonte)} leis estaduais do Pinecone")
             
             # Processar cada documento
@@ -864,9 +864,10 @@ if __name__ == "__main__":
         
         # Verificar carregamento das fontes (todos do Pinecone)
         dados_pinecone = ia_tabela.todas_fontes_data
-        dados_estaduais = [d for d in dados_pinecone if d.get('jurisdicao', '').startswith('Estadual')]
-        dados_federais = [d for d in dados_pinecone if d.get('jurisdicao') == 'Federal']
-        dados_municipais = [d for d in dados_pinecone if d.get('jurisdicao', '').startswith('Municipal')]
+        jurisdicoes = coluna(dados_pinecone, 'jurisdicao', '')
+        dados_estaduais = [j for j in jurisdicoes if j.startswith('Estadual')]
+        dados_federais = [j for j in jurisdicoes if j == 'Federal']
+        dados_municipais = [j for j in jurisdicoes if j.startswith('Municipal')]
         
         print(f"\n📊 RESUMO DOS DADOS CARREGADOS (PINECONE APENAS):")
         print(f"   • Leis Estaduais: {len(dados_estaduais)} documentos")
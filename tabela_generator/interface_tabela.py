@@ -12,6 +12,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from tabela_generator.ia_tabela_service import IATabela
+from app.services.corpus_snapshot import coluna
 import json
 
 class InterfaceTabela:
@@ -151,8 +152,8 @@ class InterfaceTabela:
             limite_padrao = 20
         else:
             # Filtrar apenas leis estaduais dos dados do Pinecone
-            dados_estaduais = [d for d in self.ia_tabela.todas_fontes_data if d.get('jurisdicao', '').startswith('Estadual')]
-            total_disponivel = len(dados_estaduais)
+            jurisdicoes = coluna(self.ia_tabela.todas_fontes_data, 'jurisdicao', '')
+            total_disponivel = sum(1 for jurisdicao in jurisdicoes if jurisdicao.startswith('Estadual'))
             print(f"🏛️ Incluindo apenas leis estaduais do TO ({total_disponivel} leis disponíveis)")
             limite_padrao = 10
         
@@ -206,8 +207,7 @@ class InterfaceTabela:
         
         # Todos os dados agora vêm do Pinecone
         dados_pinecone = self.ia_tabela.todas_fontes_data
-        dados_estaduais = [d for d in dados_pinecone if d.get('jurisdicao', '').startswith('Estadual')]
-        total_leis = len(dados_estaduais)
+        total_leis = sum(1 for jurisdicao in coluna(dados_pinecone, 'jurisdicao', '') if jurisdicao.startswith('Estadual'))
         total_todas_fontes = len(dados_pinecone)
         
         print(f"🏛️ Leis Estaduais do Tocantins: {total_leis}")
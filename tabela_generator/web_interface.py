@@ -16,6 +16,11 @@ import json
 sys.path.append(str(Path(__file__).parent.parent))
 
 from ia_tabela_service import IATabela
+from app.services.corpus_snapshot import coluna
+
+# Validade do serviço compartilhado (corpus) e dos quadros-resumo em cache, em segundos
+IATABELA_CACHE_TTL = int(os.getenv("IATABELA_CACHE_TTL", str(6 * 60 * 60)))
+QUADRO_CACHE_TTL = int(os.getenv("QUADRO_CACHE_TTL", str(60 * 60)))
 
 # Funções de validação
 # Funções de validação
@@ -899,17 +904,32 @@ def get_theme_css():
 # Aplicar CSS baseado no tema
 st.markdown(get_theme_css(), unsafe_allow_html=True)
 
+@st.cache_resource(ttl=IATABELA_CACHE_TTL, show_spinner="🔄 Carregando legislações do Pinecone...")
+def obter_servico() -> IATabela:
+    """Serviço de IA único do processo, compartilhado por todas as sessões (recriado após o TTL)"""
+    return IATabela()
+
+@st.cache_data(ttl=QUADRO_CACHE_TTL, max_entries=256, show_spinner=False)
+def gerar_quadro_resumo(municipio: str, grupo_atividade: str, esferas: tuple, limite_por_esfera: int) -> pd.DataFrame:
+    """Quadro-resumo em cache: sessões com os mesmos parâmetros reaproveitam o resultado"""
+    servico = obter_servico()
+    estrutura = servico._estrutura_quadro_padrao(municipio, grupo_atividade)
+    return servico.popular_quadro_resumo(
+        estrutura=estrutura,
+        municipio=municipio,
+        grupo_atividade=grupo_atividade,
+        esferas=list(esferas),
+        limite_por_esfera=limite_por_esfera
+    )
+
 def inicializar_servico():
-    """Inicializa o serviço de IA com cache"""
-    if 'ia_tabela_service' not in st.session_state:
-        try:
-            st.session_state.ia_tabela_service = IATabela()
-            st.session_state.servico_inicializado = True
-        except Exception as e:
-            st.error(f"Erro ao inicializar serviço: {e}")
-            st.session_state.servico_inicializado = False
-    
-    return st.session_state.get('servico_inicializado', False)
+    """Inicializa o serviço de IA (carregado uma vez por processo)"""
+    try:
+        obter_servico()
+        return True
+    except Exception as e:
+        st.error(f"Erro ao inicializar serviço: {e}")
+        return False
 
 def main():
     """Função principal da interface web"""
@@ -932,11 +952,11 @@ def main():
     
     # Mostrar dados disponíveis (fora da sidebar para evitar erros)
     # Todos os dados agora vêm do Pinecone
-    dados_pinecone = st.session_state.ia_tabela_service.todas_fontes_data
-    total_leis_estaduais = len([d for d in dados_pinecone if d.get('jurisdicao', '').startswith('Estadual')])
-    total_leis_federais = len([d for d in dados_pinecone if d.get('jurisdicao') == 'Federal'])
-    total_leis_municipais = len([d for d in dados_pinecone if d.get('jurisdicao', '').startswith('Municipal')])
-    total_todas_fontes = len(dados_pinecone)
+    jurisdicoes = coluna(obter_servico().todas_fontes_data, 'jurisdicao', '')
+    total_leis_estaduais = len([j for j in jurisdicoes if j.startswith('Estadual')])
+    total_leis_federais = len([j for j in jurisdicoes if j == 'Federal'])
+    total_leis_municipais = len([j for j in jurisdicoes if j.startswith('Municipal')])
+    total_todas_fontes = len(jurisdicoes)
     
     # Sidebar com informações
     with st.sidebar:
@@ -1358,13 +1378,8 @@ def main():
             with st.spinner("🔄 Gerando quadro-resumo usando dados reais do Pinecone..."):
                 try:
                     # Gerar quadro-resumo usando dados reais do Pinecone
-                    estrutura = st.session_state.ia_tabela_service._estrutura_quadro_padrao(municipio, grupo_atividade)
-                    df_resultado = st.session_state.ia_tabela_service.popular_quadro_resumo(
-                        estrutura=estrutura,
-                        municipio=municipio,
-                        grupo_atividade=grupo_atividade,
-                        esferas=incluir_esferas,
-                        limite_por_esfera=limite_documentos
+                    df_resultado = gerar_quadro_resumo(
+                        municipio, grupo_atividade, tuple(incluir_esferas), limite_documentos
                     )
                     
                     if df_resultado is not None and not df_resultado.empty:
@@ -0,0 +1,206 @@
+"""
+Testes da fila de gravação diferida (app/services/message_queue.py)
+O Supabase é substituído por um banco em memória que aplica a chave estrangeira
+messages.conversation_id -> conversations.id e o upsert por ID.
+"""
+
+import asyncio
+import pytest
+from app.services.message_queue import MessagePersistenceQueue, erro_permanente, recuperar_journal_do_worker
+from app.services.ndjson_store import iter_records, write_records
+
+
+class ErroBanco(Exception):
+    def __init__(self, code: str):
+        super().__init__(f"erro {code}")
+        self.code = code
+
+
+class BancoFalso:
+    """Cliente mínimo com table().upsert().execute(); falhar_em simula queda de rede numa chamada"""
+
+    def __init__(self, conversas=()):
+        self.linhas = {"conversations": {c: {"id": c} for c in conversas}, "messages": {}}
+        self.falhar_em = None
+        self.chamadas = 0
+
+    def table(self, nome):
+        return _Tabela(self, nome)
+
+
+class _Tabela:
+    def __init__(self, banco, nome):
+        self.banco, self.nome, self.linhas = banco, nome, []
+
+    def upsert(self, linhas, on_conflict=None, ignore_duplicates=False):
+        assert on_conflict == "id"
+        self.linhas = linhas
+        return self
+
+    def execute(self):
+        self.banco.chamadas += 1
+        if self.banco.chamadas == self.banco.falhar_em:
+            raise ConnectionError("rede indisponível")
+        if self.nome == "messages":
+            for linha in self.linhas:
+                if linha["conversation_id"] not in self.banco.linhas["conversations"]:
+                    raise ErroBanco("23503")  # violação de chave estrangeira
+        for linha in self.linhas:
+            self.banco.linhas[self.nome][linha["id"]] = linha
+
+
+def _fila(tmp_path, banco, batch_size=50):
+    return MessagePersistenceQueue(
+        banco, batch_size=batch_size,
+        journal_path=str(tmp_path / "journal.ndjson"),
+        dead_letter_path=str(tmp_path / "dead_letter.ndjson"),
+        per_worker=False
+    )
+
+
+def _turno(fila, conversation_id, texto):
+    fila.add_messages(conversation_id, [
+        {"role": "user", "content": texto},
+        {"role": "assistant", "content": f"resposta: {texto}"}
+    ])
+
+
+def test_erro_permanente_classifica_restricoes_e_4xx():
+    assert erro_permanente(ErroBanco("23503"))
+    assert erro_permanente(ErroBanco("PGRST204"))
+    assert not erro_permanente(ConnectionError("timeout"))
+    assert not erro_permanente(ErroBanco("57014"))  # statement timeout
+
+
+def test_registro_invalido_vai_para_descarte_sem_travar_a_fila(tmp_path):
+    banco = BancoFalso(conversas=["c1", "c2"])
+    fila = _fila(tmp_path, banco)
+    _turno(fila, "c1", "primeira")
+    _turno(fila, "inexistente", "conversa que não existe no banco")
+    _turno(fila, "c2", "segunda")
+
+    gravados = asyncio.run(fila.flush())
+
+    assert gravados == 4
+    assert len(banco.linhas["messages"]) == 4
+    assert fila.stats()["pending"] == 0
+    descartados = list(iter_records(str(tmp_path / "dead_letter.ndjson")))
+    assert len(descartados) == 2
+    assert {r["dados"]["conversation_id"] for r in descartados} == {"inexistente"}
+    assert all("23503" in r["erro"] for r in descartados)
+    # Journal vazio: nada fica para reenviar
+    fila.wait_journal()
+    assert not (tmp_path / "journal.ndjson").exists()
+
+
+def test_falha_transitoria_mantem_o_lote_e_reenvio_nao_duplica(tmp_path):
+    banco = BancoFalso(conversas=["c1"])
+    fila = _fila(tmp_path, banco, batch_size=2)
+    _turno(fila, "c1", "a")
+    _turno(fila, "c1", "b")
+
+    # Primeiro lote gravado, segundo falha por rede: continua pendente
+    banco.falhar_em = 2
+    with pytest.raises(ConnectionError):
+        asyncio.run(fila.flush())
+    assert fila.stats()["pending"] == 2
+    assert fila.stats()["dead_lettered"] == 0
+    assert len(banco.linhas["messages"]) == 2
+
+    # Nova tentativa envia o restante; reenviar o que já foi gravado não duplica
+    asyncio.run(fila.flush())
+    assert len(banco.linhas["messages"]) == 4
+    # Mesmo lote reenviado (ex.: queda antes de regravar o journal)
+    for linha in list(banco.linhas["messages"].values()):
+        fila._enfileirar([{"tabela": "messages", "dados": dict(linha)}])
+    asyncio.run(fila.flush())
+    assert len(banco.linhas["messages"]) == 4
+
+
+def test_journal_recuperado_mantem_ids(tmp_path):
+    banco = BancoFalso(conversas=["c1"])
+    fila = _fila(tmp_path, banco)
+    _turno(fila, "c1", "antes do reinício")
+    ids = {r["dados"]["id"] for r in fila._pendentes}
+    fila.wait_journal()
+
+    # Reinício: nova fila lê o journal e grava com os mesmos IDs
+    nova = _fila(tmp_path, banco)
+    assert nova._recuperar_journal() == 2
+    asyncio.run(nova.flush())
+    assert set(banco.linhas["messages"]) == ids
+
+
+def test_alteracao_de_conversa_pendente_nao_acrescenta_colunas(tmp_path):
+    banco = BancoFalso()
+    fila = _fila(tmp_path, banco)
+    fila.add_conversation("c1", "u1", "título antigo")
+
+    assert fila.update_pending_conversation("c1", {"title": "novo", "archived": True})
+    assert not fila.update_pending_conversation("c2", {"title": "outra"})
+    conversa = fila.pending_conversations("u1")[0]
+    assert conversa["title"] == "novo"
+    assert "archived" not in conversa
+
+
+def test_journal_de_worker_encerrado_volta_ao_principal(tmp_path):
+    base = str(tmp_path / "journal.ndjson")
+    registro = {"tabela": "messages", "dados": {"id": "m1", "conversation_id": "c1"}}
+    write_records(str(tmp_path / "journal.4321.ndjson"), [registro])
+
+    assert recuperar_journal_do_worker(4321, base) == 1
+    assert list(iter_records(base)) == [registro]
+    assert not (tmp_path / "journal.4321.ndjson").exists()
+
+
+def test_journal_so_de_acrescimo_recupera_apenas_o_pendente(tmp_path):
+    banco = BancoFalso(conversas=["c1"])
+    fila = _fila(tmp_path, banco, batch_size=2)
+    _turno(fila, "c1", "gravado")
+    _turno(fila, "c1", "pendente")
+    banco.falhar_em = 2
+    with pytest.raises(ConnectionError):
+        asyncio.run(fila.flush())
+    fila.wait_journal()
+
+    # O lote gravado virou uma marca "ack" no journal, sem regravar o arquivo
+    linhas = list(iter_records(str(tmp_path / "journal.ndjson")))
+    assert len(linhas) == 5 and "ack" in linhas[-1]
+
+    nova = _fila(tmp_path, BancoFalso(conversas=["c1"]))
+    assert nova._recuperar_journal() == 2
+    assert [r["dados"]["content"] for r in nova._pendentes] == ["pendente", "resposta: pendente"]
+
+
+def test_journal_compactado_quando_cresce(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.message_queue.MESSAGE_JOURNAL_COMPACT_LINES", 4)
+    banco = BancoFalso(conversas=["c1"])
+    fila = _fila(tmp_path, banco, batch_size=2)
+    for texto in ("a", "b", "c"):
+        _turno(fila, "c1", texto)
+    banco.falhar_em = 3
+    with pytest.raises(ConnectionError):
+        asyncio.run(fila.flush())
+    fila.wait_journal()
+
+    # Acima do limite de linhas: o journal passa a ter só os registros pendentes
+    assert len(list(iter_records(str(tmp_path / "journal.ndjson")))) == 2
+
+
+def test_locked_espera_o_lote_em_andamento(tmp_path):
+    banco = BancoFalso(conversas=["c1"])
+    fila = _fila(tmp_path, banco)
+    _turno(fila, "c1", "em envio")
+
+    async def cenario():
+        envio = asyncio.create_task(fila.flush())
+        await asyncio.sleep(0)  # o lote já foi retirado da fila
+        async with fila.locked():
+            # Dentro do bloco o lote já chegou ao banco: excluir agora não é desfeito depois
+            assert len(banco.linhas["messages"]) == 2
+            fila.discard("c1")
+            banco.linhas["messages"].clear()
+        await envio
+
+    asyncio.run(cenario())
+    assert banco.linhas["messages"] == {}
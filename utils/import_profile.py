@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Perfil do tempo de importação da API
+Executa `python -X importtime -c "import app.main"` num processo separado e lista
+os módulos mais lentos, para conferir o que ainda pesa na subida do app.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def medir_importacao(modulo: str):
+    """
+    Importa o módulo com -X importtime e lê o relatório do stderr.
+
+    Args:
+        modulo: Módulo a importar (ex.: app.main)
+
+    Returns:
+        List[Tuple[str, int, int]]: (módulo, próprio em µs, acumulado em µs)
+    """
+    ambiente = dict(os.environ, PYTHONPATH=str(BASE_DIR))
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=BASE_DIR, env=ambiente, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        erros = [l for l in resultado.stderr.splitlines() if not l.startswith("import time:")]
+        print(f"❌ Falha ao importar {modulo}:\n" + "\n".join(erros[-10:]))
+        sys.exit(1)
+
+    medidas = []
+    for linha in resultado.stderr.splitlines():
+        # Formato: "import time:       123 |        456 |   pacote.modulo"
+        if not linha.startswith("import time:"):
+            continue
+        partes = linha[len("import time:"):].split("|")
+        if len(partes) != 3 or not partes[0].strip().isdigit():
+            continue  # cabeçalho
+        medidas.append((partes[2].strip(), int(partes[0]), int(partes[1])))
+    return medidas
+
+
+def imprimir_ranking(titulo: str, medidas, indice: int, top: int):
+    print(f"\n{titulo}")
+    for nome, proprio, acumulado in sorted(medidas, key=lambda m: m[indice], reverse=True)[:top]:
+        print(f"  {acumulado / 1000:9.1f} ms  {proprio / 1000:9.1f} ms  {nome}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Módulos mais lentos na importação da API")
+    parser.add_argument("modulo", nargs="?", default="app.main", help="Módulo a importar (padrão: app.main)")
+    parser.add_argument("--top", type=int, default=20, help="Quantidade de módulos listados")
+    args = parser.parse_args()
+
+    medidas = medir_importacao(args.modulo)
+    total = max((acumulado for _, _, acumulado in medidas), default=0)
+    print(f"⏱️ import {args.modulo}: {total / 1000:.1f} ms ({len(medidas)} módulos)")
+    print("  (acumulado | próprio | módulo)")
+    imprimir_ranking("📦 Maior tempo acumulado:", medidas, 2, args.top)
+    imprimir_ranking("🐢 Maior tempo próprio:", medidas, 1, args.top)
+
+
+if __name__ == "__main__":
+    main()